@@ -64,23 +64,21 @@ class Ui_MainWindow(object):
         self.verticalLayout_2.addLayout(self.horizontalLayout_2)
         self.verticalLayout = QtWidgets.QVBoxLayout()
         self.verticalLayout.setObjectName("verticalLayout")
-        self.tableWidget = QtWidgets.QTableWidget(self.centralwidget)
-        self.tableWidget.setMinimumSize(QtCore.QSize(549, 100))
-        self.tableWidget.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
-        self.tableWidget.setAcceptDrops(True)
-        self.tableWidget.setAutoFillBackground(False)
-        self.tableWidget.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
-        self.tableWidget.setDragDropMode(QtWidgets.QAbstractItemView.DropOnly)
-        self.tableWidget.setAlternatingRowColors(True)
-        self.tableWidget.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
-        self.tableWidget.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
-        self.tableWidget.setRowCount(0)
-        self.tableWidget.setColumnCount(5)
-        self.tableWidget.setObjectName("tableWidget")
-        self.tableWidget.horizontalHeader().setDefaultSectionSize(100)
-        self.tableWidget.horizontalHeader().setSortIndicatorShown(True)
-        self.tableWidget.horizontalHeader().setStretchLastSection(True)
-        self.verticalLayout.addWidget(self.tableWidget)
+        self.tableView = QtWidgets.QTableView(self.centralwidget)
+        self.tableView.setMinimumSize(QtCore.QSize(549, 100))
+        self.tableView.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        self.tableView.setAcceptDrops(True)
+        self.tableView.setAutoFillBackground(False)
+        self.tableView.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tableView.setDragDropMode(QtWidgets.QAbstractItemView.DropOnly)
+        self.tableView.setAlternatingRowColors(True)
+        self.tableView.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.tableView.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.tableView.setObjectName("tableView")
+        self.tableView.horizontalHeader().setDefaultSectionSize(100)
+        self.tableView.horizontalHeader().setSortIndicatorShown(True)
+        self.tableView.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout.addWidget(self.tableView)
         self.label = QtWidgets.QLabel(self.centralwidget)
         self.label.setObjectName("label")
         self.verticalLayout.addWidget(self.label)
@@ -192,7 +190,7 @@ class Ui_MainWindow(object):
         self.filter_comboBox.setItemText(4, _translate("MainWindow", "High quality"))
         self.filter_comboBox.setItemText(5, _translate("MainWindow", "Low quality"))
         self.filter_comboBox.setItemText(6, _translate("MainWindow", "Unscanned"))
-        self.tableWidget.setSortingEnabled(True)
+        self.tableView.setSortingEnabled(True)
         self.label.setText(_translate("MainWindow", "Drag audio files or folders into box above then click scan"))
         self.scanButton.setText(_translate("MainWindow", "Scan"))
         self.actionScan_Files.setText(_translate("MainWindow", "Scan Files"))
@@ -51,6 +51,9 @@ class Ui_optionsDialog(object):
         self.spinBox_processes.setMaximum(200)
         self.spinBox_processes.setObjectName("spinBox_processes")
         self.horizontalLayout.addWidget(self.spinBox_processes)
+        self.checkBox_process_engine = QtWidgets.QCheckBox(self.tab)
+        self.checkBox_process_engine.setObjectName("checkBox_process_engine")
+        self.horizontalLayout.addWidget(self.checkBox_process_engine)
         self.formLayout_2.setLayout(1, QtWidgets.QFormLayout.LabelRole, self.horizontalLayout)
         self.checkBox_followsymlinks = QtWidgets.QCheckBox(self.tab)
         self.checkBox_followsymlinks.setObjectName("checkBox_followsymlinks")
@@ -283,6 +286,8 @@ class Ui_optionsDialog(object):
         _translate = QtCore.QCoreApplication.translate
         optionsDialog.setWindowTitle(_translate("optionsDialog", "Options"))
         self.label_4.setText(_translate("optionsDialog", "Number of processes: (0 = same as # of cpus):"))
+        self.checkBox_process_engine.setToolTip(_translate("optionsDialog", "Run scanners and parse their output in separate worker processes instead of threads"))
+        self.checkBox_process_engine.setText(_translate("optionsDialog", "Use worker processes"))
         self.checkBox_followsymlinks.setText(_translate("optionsDialog", "Follow Symlinks"))
         self.checkBox_recursive.setText(_translate("optionsDialog", "Recursive folder selection"))
         self.checkBox_cache.setText(_translate("optionsDialog", "Cache results"))
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+from math import floor, log10
+
+from PyQt5.QtCore import Qt, QLineF, QPointF, QRectF
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF
+from PyQt5.QtWidgets import QWidget
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+graph_margins = (60, 30, 20, 40)  # left, top, right, bottom
+min_view_seconds = 0.05
+zoom_step = 1.25  # per mouse wheel step
+
+
+def niceStep(span, max_ticks):
+    ''' 1, 2 or 5 x power of ten, so span has at most max_ticks ticks '''
+    if span <= 0 or max_ticks < 1:
+        return 1
+    raw = span / max_ticks
+    magnitude = 10 ** floor(log10(raw))
+    for multiple in (1, 2, 5, 10):
+        if raw <= multiple * magnitude:
+            return multiple * magnitude
+    return 10 * magnitude
+
+
+def niceTimeStep(span, max_ticks):
+    ''' as niceStep, in whole minutes and hours once ticks are a minute or more apart '''
+    raw = span / max(1, max_ticks)
+    if raw <= 30:
+        return niceStep(span, max_ticks)
+    for step in (60, 120, 300, 600, 900, 1800, 3600):
+        if raw <= step:
+            return step
+    return 3600 * niceStep(span / 3600, max_ticks)
+
+
+def formatTime(seconds, step, minutes=False):
+    ''' tick label - minutes:seconds if minutes, for views that reach past a minute '''
+    if minutes and step >= 1:
+        minutes, seconds = divmod(int(round(seconds)), 60)
+        if minutes >= 60:
+            return "{}:{:02d}:{:02d}".format(minutes // 60, minutes % 60, seconds)
+        return "{}:{:02d}".format(minutes, seconds)
+    decimals = max(0, -int(floor(log10(step)))) if step < 1 else 0
+    return "{:.{}f}".format(seconds, decimals)
+
+
+def columnEnvelope(index, start, end, columns):
+    ''' (lowest, mean, highest) bitrate of the frames in each of columns equal slices of start - end seconds,
+        None for columns without a frame '''
+    first, last = index.range(start, end)
+    if first > 0 and (first == len(index) or index.times[first] > start):
+        first -= 1  # frame still playing at start
+    width = (end - start) / columns
+    if numpy is not None:
+        times = numpy.frombuffer(index.times, dtype=numpy.float64)[first:last]
+        bitrates = numpy.frombuffer(index.bitrates, dtype=numpy.uint16)[first:last]
+        envelope = [None] * columns
+        if not len(times):
+            return envelope
+        column = numpy.clip(((times - start) / width).astype(numpy.int64), 0, columns - 1)
+        starts = numpy.flatnonzero(numpy.r_[True, column[1:] != column[:-1]])
+        lows = numpy.minimum.reduceat(bitrates, starts)
+        highs = numpy.maximum.reduceat(bitrates, starts)
+        means = numpy.add.reduceat(bitrates.astype(numpy.float64), starts) / numpy.diff(numpy.r_[starts, len(times)])
+        for at, low, mean, high in zip(column[starts].tolist(), lows.tolist(), means.tolist(), highs.tolist()):
+            envelope[at] = (low, mean, high)
+        return envelope
+    envelope = []
+    pos = first
+    for i in range(columns):
+        column_end = index.range(start + (i + 1) * width, end)[0] if i < columns - 1 else last
+        frames = index.bitrates[pos:column_end]
+        envelope.append((min(frames), sum(frames) / len(frames), max(frames)) if frames else None)
+        pos = column_end
+    return envelope
+
+
+class bitrateGraph(QWidget):
+    ''' plots a spct_native.frameIndex - wheel zooms around the mouse, drag pans, double click shows the whole file
+        each pixel column shows the range and mean of the frames in it, so long files draw as fast as short ones '''
+
+    def __init__(self, index, parent=None):
+        super(bitrateGraph, self).__init__(parent)
+        self.index = index
+        self.duration = max(index.duration, min_view_seconds)
+        self.max_bitrate = max(max(index.bitrates) if len(index) else 0, 1)
+        self.view = (0.0, self.duration)
+        self.drag_x = None
+        self.setMinimumSize(400, 250)
+
+    def plotRect(self):
+        left, top, right, bottom = graph_margins
+        return QRectF(left, top, max(1, self.width() - left - right), max(1, self.height() - top - bottom))
+
+    def setView(self, start, end):
+        span = min(max(end - start, min_view_seconds), self.duration)
+        start = min(max(0.0, start), self.duration - span)
+        self.view = (start, start + span)
+        self.update()
+
+    def timeAt(self, x):
+        rect = self.plotRect()
+        start, end = self.view
+        return start + (x - rect.left()) / rect.width() * (end - start)
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if not steps:
+            return
+        start, end = self.view
+        centre = self.timeAt(event.pos().x())
+        scale = zoom_step ** -steps
+        self.setView(centre - (centre - start) * scale, centre + (end - centre) * scale)
+        event.accept()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_x = event.pos().x()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_x is None:
+            return
+        start, end = self.view
+        shift = self.timeAt(self.drag_x) - self.timeAt(event.pos().x())
+        self.drag_x = event.pos().x()
+        self.setView(start + shift, end + shift)
+
+    def mouseReleaseEvent(self, event):
+        self.drag_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.setView(0.0, self.duration)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        rect = self.plotRect()
+        start, end = self.view
+        text_pen = QPen(self.palette().text().color())
+        grid_pen = QPen(QColor(128, 128, 128, 80))
+        y_max = self.max_bitrate * 1.1
+
+        def yPos(bitrate):
+            return rect.bottom() - bitrate / y_max * rect.height()
+
+        painter.setPen(text_pen)
+        painter.drawText(QRectF(0, 0, self.width(), graph_margins[1]), Qt.AlignCenter, self.tr("Bitrate vs time"))
+        painter.drawText(QRectF(0, self.height() - 18, self.width(), 18), Qt.AlignCenter, self.tr("Time"))
+        painter.save()
+        painter.translate(12, rect.center().y())
+        painter.rotate(-90)
+        painter.drawText(QRectF(-rect.height() / 2, -10, rect.height(), 20), Qt.AlignCenter, self.tr("Bitrate (kbps)"))
+        painter.restore()
+
+        step = niceStep(y_max, max(1, int(rect.height() / 40)))
+        bitrate = 0
+        while bitrate <= y_max:
+            y = yPos(bitrate)
+            painter.setPen(grid_pen)
+            painter.drawLine(QPointF(rect.left(), y), QPointF(rect.right(), y))
+            painter.setPen(text_pen)
+            painter.drawText(QRectF(16, y - 10, rect.left() - 20, 20), Qt.AlignRight | Qt.AlignVCenter,
+                             "{:g}".format(bitrate))
+            bitrate += step
+
+        step = niceTimeStep(end - start, max(1, int(rect.width() / 80)))
+        tick = floor(start / step) * step
+        while tick <= end:
+            if tick >= start:
+                x = rect.left() + (tick - start) / (end - start) * rect.width()
+                painter.setPen(grid_pen)
+                painter.drawLine(QPointF(x, rect.top()), QPointF(x, rect.bottom()))
+                painter.setPen(text_pen)
+                painter.drawText(QRectF(x - 40, rect.bottom() + 2, 80, 18), Qt.AlignHCenter | Qt.AlignTop,
+                                 formatTime(tick, step, end >= 60))
+            tick += step
+
+        def xPos(time):
+            return rect.left() + (time - start) / (end - start) * rect.width()
+
+        columns = int(rect.width())
+        colour = QColor(0x00, 0x60, 0xad)  # as the gnuplot graph was
+        painter.setClipRect(rect)
+        line = QPolygonF()
+        first, last = self.index.range(start, end)
+        if last - first < columns:  # zoomed in so frames are wider than a pixel - draw each frame as a step
+            first = max(0, first - 1)
+            times = self.index.times
+            for i in range(first, min(last + 1, len(self.index))):
+                y = yPos(self.index.bitrates[i])
+                line.append(QPointF(xPos(times[i]), y))
+                line.append(QPointF(xPos(times[i + 1] if i + 1 < len(self.index) else self.index.duration), y))
+        else:
+            band_colour = QColor(colour)
+            band_colour.setAlpha(70)
+            painter.setPen(QPen(band_colour, 1))
+            band = []
+            for i, values in enumerate(columnEnvelope(self.index, start, end, columns)):
+                if values is None:
+                    continue
+                low, mean, high = values
+                x = rect.left() + i + 0.5
+                band.append(QLineF(x, yPos(high), x, yPos(low)))
+                line.append(QPointF(x, yPos(mean)))
+            painter.drawLines(band)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(colour, 1.5))
+        painter.drawPolyline(line)
+        painter.setClipping(False)
+        painter.setPen(text_pen)
+        painter.drawRect(rect)
+        painter.end()
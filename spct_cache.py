@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import spct_cfg as cfg
+from spct_defs import colourToCode
+from spct_utils import debug_log, md5Str
+
+# columns stored for each file - also the keys of dicts returned by ResultCache.lookup
+CacheFields = ("artist", "encoder", "bitrate", "length", "filesize", "mode", "frequency", "quality",
+               "quality_colour", "error_colour", "frame_hist", "tools", "cutoff", "streams")
+
+schema_version = 6
+
+
+def fileKey(st):
+    ''' cache key from stat identity - survives renames and moves within a filesystem '''
+    return "{}:{}:{}:{}".format(st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def legacyFileKey(path, st):
+    ''' md5 key used by Specton-cache.ini and cache entries migrated from it '''
+    return md5Str(path.replace("/", "\\") + str(st.st_mtime))
+
+
+# map legacy Specton-cache.ini value names to result columns
+legacy_field_names = {"Artist": "artist", "Encoder": "encoder", "Bitrate": "bitrate", "Length": "length",
+                      "Filesize": "filesize", "Mode": "mode", "Frequency": "frequency", "Quality": "quality",
+                      "QualityColour": "quality_colour", "ErrorColour": "error_colour", "FrameHist": "frame_hist"}
+
+
+class ResultCache(object):
+    ''' sqlite store for scanner results - one row per file
+        writes are batched into transactions, call commit() to flush '''
+
+    def __init__(self, db_path, batch_size=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.pending = 0
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.createSchema()
+        self.has_legacy_keys = self.countLegacyKeys() > 0
+
+    def createSchema(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self.conn.execute("BEGIN")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, path TEXT, {})".format(
+                ", ".join(CacheFields)))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_path ON results (path)")
+            self.conn.execute("COMMIT")
+        if version < 2:
+            self.conn.execute("BEGIN")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, listing TEXT)")
+            self.conn.execute("COMMIT")
+        if version < 3:
+            # tool versions that produced the result, see spct_tools.parseToolVersions
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+            if "tools" not in columns:
+                self.conn.execute("ALTER TABLE results ADD COLUMN tools TEXT")
+        if version < 4:
+            # spectral data for the FileInfo dialog, see spct_spectrogram.spectrogramData
+            self.conn.execute("CREATE TABLE IF NOT EXISTS spectrograms (key TEXT PRIMARY KEY, path TEXT, params TEXT, "
+                              "sample_rate INTEGER, width INTEGER, height INTEGER, data BLOB)")
+        if version < 5:
+            # lowpass frequency found in lossless files, see spct_spectrogram.detectCutoff
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+            if "cutoff" not in columns:
+                self.conn.execute("ALTER TABLE results ADD COLUMN cutoff TEXT")
+        if version < 6:
+            # every audio stream of the file, see spct_parsers.formatAudioStreams
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(results)")]
+            if "streams" not in columns:
+                self.conn.execute("ALTER TABLE results ADD COLUMN streams TEXT")
+        if version < schema_version:
+            self.conn.execute("PRAGMA user_version={}".format(schema_version))
+
+    def countLegacyKeys(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results WHERE key NOT LIKE '%:%'").fetchone()[0]
+
+    def lookup(self, key):
+        ''' return dict of cached fields for key or None if not cached '''
+        with self.lock:
+            row = self.conn.execute("SELECT {} FROM results WHERE key=?".format(", ".join(CacheFields)),
+                                    (key,)).fetchone()
+        return self.rowToDict(row)
+
+    def lookupFile(self, key, path, st):
+        ''' look up file by stat key, falling back to path (same size and mtime) and then legacy md5 key
+            entries found by fallback are re-keyed so the next lookup is direct '''
+        with self.lock:
+            row = self.conn.execute("SELECT path, {} FROM results WHERE key=?".format(", ".join(CacheFields)),
+                                    (key,)).fetchone()
+            if row is not None:
+                if not row[0] == path:  # file renamed or moved
+                    self.write("UPDATE results SET path=? WHERE key=?", (path, key))
+                return self.rowToDict(row[1:])
+
+            old_key = None
+            size_mtime = key.split(":", 2)[2]
+            for (path_key,) in self.conn.execute("SELECT key FROM results WHERE path=?", (path,)).fetchall():
+                if path_key.split(":", 2)[-1] == size_mtime:  # same file, new device or inode number
+                    old_key = path_key
+                    break
+            if old_key is None and self.has_legacy_keys:
+                old_key = legacyFileKey(path, st)
+            if old_key is None:
+                return None
+
+            row = self.conn.execute("SELECT {} FROM results WHERE key=?".format(", ".join(CacheFields)),
+                                    (old_key,)).fetchone()
+            if row is not None:
+                self.write("UPDATE results SET key=?, path=? WHERE key=?", (key, path, old_key))
+            return self.rowToDict(row)
+
+    @staticmethod
+    def rowToDict(row):
+        if row is None:
+            return None
+        result = dict(zip(CacheFields, row))
+        if result["frame_hist"] is not None:
+            try:
+                result["frame_hist"] = tuple(json.loads(result["frame_hist"]))
+            except ValueError:
+                result["frame_hist"] = None
+        return result
+
+    def store(self, key, path, **fields):
+        ''' insert or update the given fields for key - only columns passed in fields are changed '''
+        fields = {name: value for name, value in fields.items() if name in CacheFields}
+        if "frame_hist" in fields and fields["frame_hist"] is not None:
+            fields["frame_hist"] = json.dumps(fields["frame_hist"])
+        columns = ["path"] + list(fields)
+        sql = "INSERT INTO results (key, {}) VALUES (?, {}) ON CONFLICT(key) DO UPDATE SET {}".format(
+            ", ".join(columns), ", ".join("?" * len(columns)),
+            ", ".join("{0}=excluded.{0}".format(column) for column in columns))
+        self.write(sql, [key, path] + list(fields.values()))
+
+    def write(self, sql, params):
+        with self.lock:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self.conn.execute(sql, params)
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.commit()
+
+    def lookupDir(self, path):
+        ''' return (mtime_ns, listing) stored for directory or None
+            listing is a list of [name, "d"] for directories, [name, "l"] for symlinked directories
+            [name, "f"] for files matching the filemask and [name, "o"] for other files.
+            files aren't stat'ed in the listing - a file changed in place doesn't change the directory's mtime '''
+        with self.lock:
+            row = self.conn.execute("SELECT mtime_ns, listing FROM dirs WHERE path=?", (path,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return row[0], json.loads(row[1])
+        except ValueError:
+            return None
+
+    def storeDirs(self, dirs):
+        ''' store list of (path, mtime_ns, listing) in one transaction '''
+        with self.lock:
+            for path, mtime_ns, listing in dirs:
+                self.write("INSERT OR REPLACE INTO dirs (path, mtime_ns, listing) VALUES (?, ?, ?)",
+                           (path, mtime_ns, json.dumps(listing)))
+            self.commit()
+
+    def lookupSpectrogram(self, key, params):
+        ''' return (sample_rate, width, height, data) stored for key or None if not stored with the same params '''
+        with self.lock:
+            row = self.conn.execute("SELECT params, sample_rate, width, height, data FROM spectrograms WHERE key=?",
+                                    (key,)).fetchone()
+        if row is None or not row[0] == params:
+            return None
+        return row[1:]
+
+    def storeSpectrogram(self, key, path, params, sample_rate, width, height, data):
+        with self.lock:
+            self.write("INSERT OR REPLACE INTO spectrograms (key, path, params, sample_rate, width, height, data) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, path, params, sample_rate, width, height, data))
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            if self.conn.in_transaction:
+                self.conn.execute("COMMIT")
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+    def migrateLegacyCache(self, ini_path):
+        ''' one-time import of the old QSettings Specton-cache.ini - renamed afterwards so it is not read again '''
+        from PyQt5.QtCore import QSettings
+        debug_log("Migrating legacy cache {}".format(ini_path))
+        legacy = QSettings(ini_path, QSettings.IniFormat)
+        count = 0
+        for group in legacy.childGroups():
+            fields = {}
+            for name, column in legacy_field_names.items():
+                value = legacy.value("{}/{}".format(group, name))
+                if value is None:
+                    continue
+                if column in ("quality_colour", "error_colour"):
+                    value = colourToCode(value)
+                elif column == "frame_hist":
+                    try:
+                        x, y = value
+                        value = ([int(i) for i in x], [int(i) for i in y])
+                    except (TypeError, ValueError):
+                        continue
+                fields[column] = value
+            if fields:
+                self.store(group, None, **fields)
+                count += 1
+        self.commit()
+        self.has_legacy_keys = self.has_legacy_keys or count > 0
+        del legacy
+        try:
+            os.replace(ini_path, ini_path + ".migrated")
+        except OSError as e:
+            debug_log("Could not rename legacy cache {}: {}".format(ini_path, e), logging.WARNING)
+        debug_log("Migrated {} entries from legacy cache".format(count))
+
+
+result_cache = None
+result_cache_lock = threading.Lock()
+
+
+def getResultCache():
+    ''' open the result cache on first use, importing Specton-cache.ini if present '''
+    global result_cache
+    with result_cache_lock:
+        if result_cache is None:
+            config_dir = os.path.dirname(cfg.settings.fileName())
+            result_cache = ResultCache(os.path.join(config_dir, "Specton-cache.db"))
+            legacy_ini = os.path.join(config_dir, "Specton-cache.ini")
+            if os.path.exists(legacy_ini):
+                try:
+                    result_cache.migrateLegacyCache(legacy_ini)
+                except Exception as e:
+                    debug_log("Legacy cache migration failed: {}".format(e), logging.ERROR)
+        return result_cache
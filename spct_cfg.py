@@ -6,7 +6,6 @@ AppName = "Specton"
 version = 0.172
 
 settings = QSettings(QSettings.IniFormat, QSettings.UserScope, "Specton", "Specton-settings")
-filecache = QSettings(QSettings.IniFormat, QSettings.UserScope, "Specton", "Specton-cache")
 app_dirs = AppDirs(AppName, "", roaming=True)
 debug_enabled = settings.value("Options/Debug", False, type=bool)
 
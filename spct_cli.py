@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+from time import time
+
+from PyQt5.QtCore import QThreadPool
+
+import spct_cfg as cfg
+from spct_cache import getResultCache, fileKey, CacheFields
+from spct_objects import main_info, discovery_info
+from spct_parsers import mergeSongInfo
+from spct_scheduler import taskScheduler, schedulerLimits, METADATA, DECODE, ANALYSIS
+from spct_threads import getFileScanThreads, batchMediaInfoThreads, fileDiscovery_Thread, threadTaskCount
+from spct_tools import getToolRegistry
+from spct_utils import debug_log, getFilemaskRegex, stopProcesses
+from spct_workers import scanProcessPool
+
+# QualityColours codes as written to the json output
+QualityNames = ("unknown", "good", "ok", "warning", "bad")
+
+
+def parseScanArgs(argv):
+    parser = argparse.ArgumentParser(prog="specton scan",
+                                     description="Scan audio files without the GUI and write one JSON object per "
+                                                 "file to stdout as results arrive")
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="files or folders to scan")
+    parser.add_argument("-j", "--workers", type=int,
+                        default=cfg.settings.value('Options/Processes', 0, type=int),
+                        help="most scanners to run at once, and number of worker processes with --processes "
+                             "(default: limit for each task class)")
+    parser.add_argument("--metadata-jobs", type=int, default=0,
+                        help="tag and header scans to run at once (default: from cpu count and disk type)")
+    parser.add_argument("--decode-jobs", type=int, default=0,
+                        help="decode error checks to run at once (default: from cpu count and disk type)")
+    parser.add_argument("--analysis-jobs", type=int, default=0,
+                        help="auCDtect checks to run at once (default: from cpu count and disk type)")
+    parser.add_argument("--processes", dest="process_engine", action="store_true",
+                        default=cfg.settings.value('Options/ProcessEngine', False, type=bool),
+                        help="run scanners in worker processes instead of threads")
+    parser.add_argument("--mediainfo-batch", type=int, default=cfg.settings.value('Options/MediaInfoBatch', 16, type=int),
+                        help="most files to pass to one mediainfo run, 1 to run it once per file (default: %(default)s)")
+    parser.add_argument("--timeout", type=int, default=cfg.settings.value("Options/Proc_Timeout", 300, type=int),
+                        help="seconds to wait for each scanner process (default: %(default)s)")
+    parser.add_argument("--no-cache", dest="usecache", action="store_false",
+                        default=cfg.settings.value('Options/UseCache', True, type=bool),
+                        help="don't read or write the result cache")
+    parser.add_argument("--rescan", action="store_true", help="scan files even if a cached result exists")
+    parser.add_argument("--no-recurse", dest="recurse", action="store_false",
+                        default=cfg.settings.value('Options/RecurseDirectories', True, type=bool),
+                        help="don't scan subfolders")
+    parser.add_argument("--follow-symlinks", action="store_true",
+                        default=cfg.settings.value('Options/FollowSymlinks', False, type=bool))
+    parser.add_argument("--aucdtect", action="store_true",
+                        default=cfg.settings.value('Options/auCDtect_scan', False, type=bool),
+                        help="also check lossless files with auCDtect")
+    parser.add_argument("--no-error-check", dest="error_check", action="store_false",
+                        default=cfg.settings.value('Options/ScanForErrors', True, type=bool),
+                        help="don't decode lossless files to test for errors")
+    parser.add_argument("--cutoff", dest="cutoff_scan", action="store_true",
+                        default=cfg.settings.value('Options/CutoffScan', False, type=bool),
+                        help="find the lowpass frequency of lossless files, a sign of lossy sources")
+    return parser.parse_args(argv)
+
+
+class cliScan(object):
+    ''' runs the scanner threads used by the GUI and streams merged results for each file as json lines
+        scanner threads and fileDiscovery_Thread all post to result_q, read here on the main thread '''
+
+    def __init__(self, args, out=sys.stdout):
+        self.args = args
+        self.out = out
+        self.result_q = queue.Queue()
+        limits = schedulerLimits(args.paths[0], args.workers)
+        for task_class, limit in ((METADATA, args.metadata_jobs), (DECODE, args.decode_jobs),
+                                  (ANALYSIS, args.analysis_jobs)):
+            if limit > 0:
+                limits[task_class] = limit
+        self.scanner_threadpool = taskScheduler(limits)
+        self.discovery_threadpool = QThreadPool()
+        self.discovery_thread = None
+        self.tool_registry = getToolRegistry()
+        self.scanner_bins = self.tool_registry.scannerBins()
+        if args.aucdtect:
+            self.aucdtect_mode = cfg.settings.value('Options/auCDtect_mode', 10, type=int)
+        else:
+            self.aucdtect_mode = None
+        self.cache = getResultCache() if args.usecache else None
+        self.scan_options = (self.scanner_bins, args.timeout, cfg.debug_enabled, self.aucdtect_mode, args.error_check,
+                             args.cutoff_scan)
+        self.scan_process_pool = None
+        self.files = {}  # file id -> [path, key, record, tasks left, cmd error]
+        self.next_id = 0
+        self.seen_keys = set()
+        self.unscannable_types = set()  # extensions reported by noScanner
+        self.file_count = 0
+        self.cached_count = 0
+
+    def run(self):
+        start_time = time()
+        directories = []
+        files = []
+        for path in self.args.paths:
+            if os.path.isdir(path):
+                directories.append(path)
+            else:
+                files.append((os.path.basename(path), os.path.dirname(path), None))
+
+        if self.args.process_engine:
+            self.scan_process_pool = scanProcessPool(self.args.workers, self.result_q)
+
+        try:
+            self.addFiles(files)
+            if directories:
+                if self.cache is not None and cfg.settings.value('Options/IncrementalRescan', True, type=bool):
+                    dir_index = self.cache
+                else:
+                    dir_index = None
+                self.discovery_thread = fileDiscovery_Thread(directories, getFilemaskRegex(), self.result_q,
+                                                             self.args.follow_symlinks, self.args.recurse,
+                                                             cfg.settings.value('Options/DiscoveryThreads', 8,
+                                                                                type=int),
+                                                             dir_index=dir_index)
+                self.discovery_threadpool.start(self.discovery_thread)
+
+            while self.discovery_thread is not None or self.files:
+                try:
+                    q_info = self.result_q.get(True, 0.5)
+                except queue.Empty:
+                    # every thread posts its result before finishing, so once the pool is idle with nothing
+                    # queued any remaining files had a thread that failed without posting
+                    if self.discovery_thread is None and self.scanner_threadpool.waitForDone(0) \
+                            and (self.scan_process_pool is None or self.scan_process_pool.isIdle()) \
+                            and self.result_q.empty():
+                        for file_id in list(self.files):
+                            self.files[file_id][4] = True
+                            self.writeFile(file_id)
+                    continue
+                self.handleResult(q_info)
+        except KeyboardInterrupt:
+            self.cancel()
+            # nothing may still be running when the cache is committed and the interpreter shuts down
+            stopProcesses()
+            self.scanner_threadpool.waitForDone()
+            self.discovery_threadpool.waitForDone()
+            return 130
+        except BrokenPipeError:  # output closed early, e.g. piped to head
+            self.cancel()
+            os.dup2(os.open(os.devnull, os.O_WRONLY), self.out.fileno())
+            return 1
+        finally:
+            if self.cache is not None:
+                self.cache.commit()
+            if self.scan_process_pool is not None:
+                self.scan_process_pool.close()
+
+        print("Scanned {} files ({} cached) in {:.1f}s".format(self.file_count, self.cached_count, time() - start_time),
+              file=sys.stderr)
+        return 0
+
+    def cancel(self):
+        if self.discovery_thread is not None:
+            self.discovery_thread.cancel()
+        self.scanner_threadpool.clear()
+        if self.scan_process_pool is not None:
+            self.scan_process_pool.cancel()
+
+    def handleResult(self, q_info):
+        if isinstance(q_info, discovery_info):
+            if q_info.result_type == discovery_info.FILES:
+                self.addFiles(q_info.files)
+            elif q_info.result_type == discovery_info.FINISHED:
+                self.discovery_thread = None
+        elif isinstance(q_info, main_info):
+            file_id = q_info.row
+            if file_id not in self.files:
+                return
+            path, key, record, tasks_left, cmd_error = self.files[file_id]
+            song_info = q_info.song_info
+            if song_info.cmd_error:
+                self.files[file_id][4] = True
+            else:
+                cache_fields = mergeSongInfo(record, song_info)
+                if cache_fields and self.cache is not None:
+                    self.cache.store(key, path, **cache_fields)
+            self.files[file_id][3] -= 1
+            if self.files[file_id][3] < 1:
+                self.writeFile(file_id)
+        else:
+            debug_log("cliScan received wrong data: {}".format(q_info), logging.WARNING)
+
+    def addFiles(self, files):
+        ''' look up batch of (name, directory, stat_result) in cache and queue scanner threads for the rest '''
+        thread_list = []
+        for name, directory, st in files:
+            filenameStr = os.path.join(directory, name)
+            if st is None:
+                try:
+                    st = os.stat(filenameStr)
+                except OSError as e:
+                    print("Can't read {}: {}".format(filenameStr, e), file=sys.stderr)
+                    continue
+            filekey = fileKey(st)
+            if filekey in self.seen_keys:
+                continue  # don't scan same file twice
+            self.seen_keys.add(filekey)
+
+            file_id = self.next_id
+            self.next_id += 1
+            record = dict.fromkeys(CacheFields)
+            record["scanned"] = False
+
+            if self.cache is not None and not self.args.rescan:
+                cached = self.cache.lookupFile(filekey, filenameStr, st)
+                if cached is not None and cached["encoder"] is not None \
+                        and self.tool_registry.isCurrent(cached["tools"]):
+                    record.update(cached)
+                    record["scanned"] = True
+                    self.files[file_id] = [filenameStr, filekey, record, 0, False]
+                    self.cached_count += 1
+                    self.writeFile(file_id, True)
+                    continue
+
+            threads = getFileScanThreads(file_id, filenameStr, self.scanner_bins, self.args.timeout,
+                                         cfg.debug_enabled, self.result_q, self.aucdtect_mode, self.args.error_check,
+                                         self.args.cutoff_scan)
+            self.files[file_id] = [filenameStr, filekey, record, threadTaskCount(threads), False]
+            if not threads:  # not a type read natively, and no scanner installed
+                self.files[file_id][4] = True
+                self.noScanner(filenameStr)
+                self.writeFile(file_id)
+            elif self.scan_process_pool is not None:  # worker process runs the same threads, one result each
+                self.scan_process_pool.submit(file_id, filenameStr, self.scan_options, threadTaskCount(threads))
+            else:
+                thread_list.extend(threads)
+
+        for thread in batchMediaInfoThreads(thread_list, self.args.mediainfo_batch):
+            self.scanner_threadpool.start(thread)
+
+    def noScanner(self, filenameStr):
+        ''' tell the user once for each file type that no scanner could read it '''
+        ext = os.path.splitext(filenameStr)[1].lower()
+        if ext not in self.unscannable_types:
+            self.unscannable_types.add(ext)
+            print("No scanner for {} files - install mediainfo or set its path in the Specton options".format(
+                ext or "extensionless"), file=sys.stderr)
+
+    def writeFile(self, file_id, cached=False):
+        path, key, record, tasks_left, cmd_error = self.files.pop(file_id)
+        result = {"path": path, "key": key, "cached": cached, "cmd_error": cmd_error}
+        for field, value in record.items():
+            if field in ("quality_colour", "error_colour"):
+                value = QualityNames[value] if value is not None else None
+            result[field] = value
+        self.out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.out.flush()
+        self.file_count += 1
+
+
+def scanMain(argv):
+    ''' entry point for "specton scan" - returns exit code '''
+    args = parseScanArgs(argv)
+    return cliScan(args).run()
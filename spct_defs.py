@@ -10,10 +10,20 @@ TableHeaders = (
 
 dataScanned = 32
 dataFilenameStr = 33
+dataCacheKey = 34
 dataBitrate = 35
 
 aucdtect_confidence_threshold = 90  # aucdtect results considered accurate when probability is higher than this
 
+# lowpass detection for lossless files - lossy encoders remove high frequencies, so a lowpass shows a transcode
+cutoff_bad_freq = 16000  # Hz, lowpass below this is from a low bitrate encode
+# Hz, just above LAME's highest lowpass (20.5 kHz at 320 kbps) so high bitrate transcodes are a warning - not bad,
+# as some lossless masters roll off there too
+cutoff_warning_freq = 20800
+cutoff_floor_margin = 10  # dB above the level near nyquist that counts as content
+cutoff_slope_width = 1000  # Hz
+cutoff_min_drop = 30  # dB the level must fall across cutoff_slope_width to count as a lowpass
+
 LossyFormats=(".mp3",".opus",".mpc",".ogg",".m4a",".aac",".ac3",".ra",".au")
 LosslessFormats=(".flac",".wav",".shn",".ape",".tta",".wv")
 
@@ -29,6 +39,26 @@ colourQualityWarning.setAlpha(100)
 colourQualityBad = QColor(Qt.red)
 colourQualityBad.setAlpha(100)
 
+# colours are stored in the result cache as an index into this tuple
+QualityColours = (colourQualityUnknown, colourQualityGood, colourQualityOk, colourQualityWarning, colourQualityBad)
+
+def colourToCode(colour):
+    ''' map a quality QColor (or QBrush) to its QualityColours index - None if not a quality colour '''
+    if colour is None:
+        return None
+    if hasattr(colour, "color"): # QBrush
+        colour = colour.color()
+    for code, quality_colour in enumerate(QualityColours):
+        if colour == quality_colour:
+            return code
+    return None
+
+def colourFromCode(code):
+    try:
+        return QualityColours[code]
+    except (IndexError, TypeError):
+        return None
+
 defaultfilemask = r"\.(mp3|opus|flac|mpc|ogg|wav|m4a|aac|ac3|ra|au|shn|ape|tta|wv)$"
 
 guessenc_encoder_regex = re.compile(r"^Maybe this file is encoded by (.*)", re.MULTILINE)
@@ -43,7 +73,9 @@ guessenc_frame_hist_regex = re.compile(r"Frame histogram(.*?)(\d*) header errors
 guessenc_block_usage_regex = re.compile(r"^Block usage(.*?)-", re.DOTALL | re.MULTILINE)
 guessenc_mode_count_regex = re.compile(r"^Mode extension: (.*?)--", re.DOTALL | re.MULTILINE)
 guessenc_header_errors_regex = re.compile(r"^\s*(\d*) header errors", re.MULTILINE)
+mediainfo_json_option = "--Output=JSON"
 mediainfo_format_regex = re.compile(r"^Audio.*?Format.*?\: (.*?)$", re.DOTALL | re.MULTILINE)
+mediainfo_complete_name_regex = re.compile(r"^Complete name\s*: (.*?)\r?$", re.MULTILINE)
 mediainfo_encoder_regex = re.compile(r"^Writing library.*\: (.*)", re.MULTILINE)
 mediainfo_artist_regex = re.compile(r"^Performer.*\: (.*)", re.MULTILINE)
 mediainfo_length_regex = re.compile(r"^Audio.*?Duration.*?\: (.*?)$", re.DOTALL | re.MULTILINE)
@@ -60,4 +92,5 @@ mp3_bitrate_data_regex = re.compile(r"(\d*?) kbps \: *(\d*?) \(")
 mp3_lame_tag_preset_regex = re.compile(r"^Lame tag.*Preset\s*:\s*(.*?)Orig", re.MULTILINE | re.DOTALL)
 mp3_xing_quality_regex = re.compile(r"^Xing.*?Quality\s*?:\s*?(\d*?)\s*?\(-q (\d*?) -V (\d*?)\)",
                                     re.MULTILINE | re.DOTALL)
+flac_vendor_regex = re.compile(r"^reference (libFLAC [\d\.]+) (\d{4})(\d\d)(\d\d)$")
 mp3_duration_format_regex = re.compile(r"(\d*?):(\d*?):(\d*\.\d*)")
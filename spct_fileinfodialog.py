@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 
-import queue, os, logging
-from PyQt5.QtCore import QTimer, QThreadPool, QRunnable
+import os, logging
+from PyQt5.QtCore import QThreadPool, QRunnable
 from PyQt5.QtWidgets import QWidget,QDialog,QTabWidget,QGridLayout,QTextEdit,QLabel
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtGui import QPixmap, QImage
 from spct_utils import debug_log
 from dlg_info import Ui_FileInfoDialog
-from spct_utils import md5Str,findGuessEncBin,findGnuPlotBin,findMediaInfoBin,findSoxBin,getTempFileName,findffprobeBin,findDlg
+from spct_utils import md5Str,getTempFileName,findDlg
 from spct_cfg import settings
 from spct_objects import infoobj
-from spct_threads import getScannerThread,makeSpectrogramThread,makeBitGraphThread,makeBitHistThread
+from spct_queue import notifyQueue
+from spct_tools import getToolRegistry
+from spct_native import frameIndex
+from spct_framestore import storedFrameHistogram
+from spct_bitgraph import bitrateGraph
+from spct_threads import getScannerThread,makeSpectrogramThread,makeBitGraphThread,makeBitHistThread,getDecoderCmd
 
 class FileInfo(QDialog):
     # right click file info dialog
@@ -20,7 +25,8 @@ class FileInfo(QDialog):
         self.setWindowTitle(self.tr("Info") + " - {}".format(os.path.basename(filenameStr)))
         self.filename = filenameStr
         self.frame_hist = frame_hist  # tuple
-        self.infodlg_q = queue.Queue()
+        self.infodlg_q = notifyQueue()
+        self.infodlg_q.connect(self.updateGui)
         self.infodlg_threadpool = QThreadPool(None)
         self.debug_enabled = debug_enabled
         self.infodlg_list = infodlg_list
@@ -31,6 +37,10 @@ class FileInfo(QDialog):
             self.restoreGeometry(windowGeometry)
         tabWidget = self.findChild(QTabWidget, "tabWidget")
         tabWidget.clear()
+        tool_registry = getToolRegistry()
+
+        if self.frame_hist is None and settings.value('Options/UseCache', True, type=bool):
+            self.frame_hist = storedFrameHistogram(filenameStr)
 
         if self.frame_hist is not None:
             x, y = self.frame_hist
@@ -53,17 +63,12 @@ class FileInfo(QDialog):
 
                 thread = makeBitHistThread(filenameStr, grid.objectName(),
                                            settings.value("Options/Proc_Timeout", 300, type=int), self.infodlg_q,
-                                           findGnuPlotBin(), x, y)
+                                           tool_registry.path("gnuplot"), x, y)
                 self.infodlg_threadpool.start(thread)
 
             except Exception as e:
                 debug_log(e,logging.ERROR)
 
-        updateGuiTimer = QTimer(self)
-        updateGuiTimer.timeout.connect(self.updateGui)
-        updateGuiTimer.setInterval(100)
-        updateGuiTimer.start()
-
         debug_log("Running scanner for file {}".format(filenameStr))
 
         tab = QWidget()
@@ -71,15 +76,8 @@ class FileInfo(QDialog):
         grid.setObjectName("OutputLayout-{}".format(md5Str(filenameStr)))
         tabWidget.addTab(tab, self.tr("Scanner Output"))
 
-        mp3guessenc_bin = findGuessEncBin()
-        if (mp3guessenc_bin == "") or (not os.path.exists(mp3guessenc_bin)):
-            mp3guessenc_bin = ""
-
-        mediainfo_bin = findMediaInfoBin()
-        if (mediainfo_bin == "") or (not os.path.exists(mediainfo_bin)):
-            mediainfo_bin = ""
-
-        threads = getScannerThread(grid.objectName(), filenameStr, mp3guessenc_bin, mediainfo_bin, grid,
+        threads = getScannerThread(grid.objectName(), filenameStr, tool_registry.path("mp3guessenc"),
+                                   tool_registry.path("mediainfo"), grid,
                                   settings.value("Options/Proc_Timeout", 300, type=int),debug_enabled,None,self.infodlg_q)
         if threads:
             for thread in threads:
@@ -94,14 +92,18 @@ class FileInfo(QDialog):
             grid.setObjectName("SpectrogramLayout-{}".format(md5Str(filenameStr)))
             tabWidget.addTab(tab, self.tr("Spectrogram"))
 
-            sox_bin = findSoxBin()
+            sox_bin = tool_registry.path("sox")
             temp_file = getTempFileName() + ".png"
             palette = settings.value('Options/SpectrogramPalette', 1, type=int)
 
             debug_log("Running sox to create spectrogram for file {}".format(filenameStr))
 
+            decoder_cmd = getDecoderCmd(filenameStr, tool_registry.path("flac"), tool_registry.path("ffmpeg"),
+                                        allow_lossy=True)
+
             thread = makeSpectrogramThread(filenameStr, sox_bin, temp_file, palette, grid.objectName(),
-                                           settings.value("Options/Proc_Timeout", 300, type=int), self.infodlg_q)
+                                           settings.value("Options/Proc_Timeout", 300, type=int), self.infodlg_q,
+                                           decoder_cmd, settings.value('Options/UseCache', True, type=bool))
             self.infodlg_threadpool.start(thread)
 
         if settings.value('Options/EnableBitGraph', True, type=bool):
@@ -109,16 +111,15 @@ class FileInfo(QDialog):
             grid = QGridLayout(tab)
             grid.setObjectName("BitgraphLayout-{}".format(md5Str(filenameStr)))
             tabWidget.addTab(tab, self.tr("Bitrate Graph"))
-            debug_log("Running ffprobe to create bitrate graph for file {}".format(filenameStr))
-            thread = makeBitGraphThread(filenameStr, grid.objectName(), findffprobeBin(),
+            debug_log("Reading frame bitrates to create bitrate graph for file {}".format(filenameStr))
+            thread = makeBitGraphThread(filenameStr, grid.objectName(), tool_registry.path("ffprobe"),
                                         settings.value("Options/Proc_Timeout", 300, type=int), self.infodlg_q,
-                                        findGnuPlotBin())
+                                        settings.value('Options/UseCache', True, type=bool))
             self.infodlg_threadpool.start(thread)
 
     def updateGui(self):
-        ''' called from timer - subprocesses post to queue when finished '''
-        if not self.infodlg_q.empty():
-            update_info = self.infodlg_q.get(False, 1)
+        ''' called when threads post to infodlg_q - handles all waiting updates '''
+        for update_info in self.infodlg_q.getAll():
             # class infoobj
             # type - type of update e.g. "Spectrogram"
             # data - handler specific data
@@ -127,17 +128,23 @@ class FileInfo(QDialog):
 
             if not isinstance(update_info, infoobj):
                 debug_log("updateGui received wrong data: {}".format(update_info),logging.WARNING)
-                return
+                continue
                 
             if update_info.type in [infoobj.BITGRAPH, infoobj.BITHIST, infoobj.SPECTROGRAM]:
                 debug_log("updateGui received type {} update".format(update_info.type))
-                px = QLabel()
+                if isinstance(update_info.data, frameIndex):  # plotted in process
+                    px = bitrateGraph(update_info.data)
+                else:
+                    px = QLabel()
                 dlg = findDlg(update_info.fn,self.debug_enabled,self.infodlg_list)
                 if dlg is not None:
                     layout = dlg.findChild(QGridLayout, update_info.layout)
                     if layout is not None:
                         layout.addWidget(px)
-                        px.setPixmap(QPixmap(update_info.data))
+                        if isinstance(update_info.data, QImage):  # calculated in process, not a temp file
+                            px.setPixmap(QPixmap.fromImage(update_info.data))
+                        elif isinstance(update_info.data, str):
+                            px.setPixmap(QPixmap(update_info.data))
                     else:
                         debug_log("updateGui ran but layout not found type={} str={} layout={}".format(update_info.type,
                                                                                                        update_info.data,
@@ -146,10 +153,11 @@ class FileInfo(QDialog):
                     debug_log("updateGui couldn't find dlg type={} str={} layout={}".format(update_info.type,
                                                                                             update_info.data,
                                                                                             update_info.layout),logging.WARNING)
-                try:
-                    os.remove(update_info.data)  # delete generated spectrogram image
-                except OSError:
-                    pass
+                if isinstance(update_info.data, str):
+                    try:
+                        os.remove(update_info.data)  # delete generated spectrogram image
+                    except OSError:
+                        pass
 
             elif update_info.type == infoobj.SCANNER_OUTPUT:
                 debug_log("updateGui received Scanner_Output update")
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+import spct_cfg as cfg
+from spct_cache import fileKey
+from spct_native import frameIndex
+from spct_utils import debug_log, md5Str
+
+# file layout: header, source (tools string the index was read with, e.g. "native=1"), padded to 8 bytes,
+# then float64 frame start times and uint16 bitrates in kbps, both in native byte order
+frame_store_magic = b"SPFI"
+frame_store_format = 1
+frame_store_header = struct.Struct("=4sHHQd")  # magic, format, source length, frame count, duration
+byte_order_flag = 0x8000 if sys.byteorder == "big" else 0  # or'd into format
+
+
+def frameIndexFileName(key):
+    return md5Str(key) + ".idx"
+
+
+class FrameIndexStore(object):
+    ''' frame indexes (spct_native.frameIndex) on disk, one file per result cache key - so the bitrate graph
+        and histogram don't need the file read again. indexes are memory mapped, not read into memory.
+        least recently used indexes are deleted once the files take more than max_bytes '''
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None  # unknown until the first store
+
+    def path(self, key):
+        return os.path.join(self.directory, frameIndexFileName(key))
+
+    def lookup(self, key):
+        ''' returns (frameIndex, source) or None - the index's arrays are memoryviews of the mapped file '''
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # missing, or empty
+            return None
+        try:
+            magic, file_format, source_length, count, duration = frame_store_header.unpack_from(mm, 0)
+            if not magic == frame_store_magic or not file_format == frame_store_format | byte_order_flag:
+                raise ValueError("unknown format")
+            source_end = frame_store_header.size + source_length
+            times_start = (source_end + 7) & ~7
+            bitrates_start = times_start + count * 8
+            if len(mm) < bitrates_start + count * 2:
+                raise ValueError("truncated")
+            source = mm[frame_store_header.size:source_end].decode("utf-8")
+        except (ValueError, struct.error) as e:
+            debug_log("Frame index {} unreadable: {}".format(path, e), logging.WARNING)
+            mm.close()
+            self.remove(path)
+            return None
+        view = memoryview(mm)  # the map stays open while the index uses it
+        times = view[times_start:bitrates_start].cast("d")
+        bitrates = view[bitrates_start:bitrates_start + count * 2].cast("H")
+        try:
+            os.utime(path)  # mtime is the last use, for eviction
+        except OSError:
+            pass
+        return frameIndex(times, bitrates, duration), source
+
+    def store(self, key, index, source):
+        source = source.encode("utf-8")
+        header = frame_store_header.pack(frame_store_magic, frame_store_format | byte_order_flag, len(source),
+                                         len(index), index.duration)
+        padding = b"\x00" * (-(len(header) + len(source)) % 8)
+        path = self.path(key)
+        temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                f.write(header + source + padding)
+                f.write(memoryview(index.times).cast("B"))
+                f.write(memoryview(index.bitrates).cast("B"))
+            os.replace(temp_path, path)  # readers never see a partly written index
+        except OSError as e:
+            debug_log("Could not store frame index {}: {}".format(path, e), logging.WARNING)
+            self.remove(temp_path)
+            return
+        self.evict(os.path.getsize(path))
+
+    def evict(self, added_bytes):
+        ''' delete least recently used indexes until the store is under max_bytes '''
+        with self.lock:
+            if self.total_bytes is not None:
+                self.total_bytes += added_bytes
+                if self.total_bytes <= self.max_bytes:
+                    return
+            entries = []
+            try:
+                with os.scandir(self.directory) as it:
+                    for entry in it:
+                        if entry.name.endswith(".idx"):
+                            st = entry.stat()
+                            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            except OSError as e:
+                debug_log("Could not list frame index store {}: {}".format(self.directory, e), logging.WARNING)
+                return
+            self.total_bytes = sum(size for mtime, size, path in entries)
+            if self.total_bytes <= self.max_bytes:
+                return
+            entries.sort()
+            for mtime, size, path in entries[:-1]:  # keep the index just stored
+                if self.remove(path):
+                    self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+            debug_log("Frame index store evicted to {} bytes".format(self.total_bytes))
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:  # already gone, or mapped on windows
+            return False
+
+
+def storedFrameHistogram(filenameStr):
+    ''' frame_hist format histogram from the stored frame index of file, or None if it has none '''
+    try:
+        key = fileKey(os.stat(filenameStr))
+    except OSError:
+        return None
+    stored = getFrameIndexStore().lookup(key)
+    if stored is None or not len(stored[0]):
+        return None
+    return stored[0].bitrateHistogram()
+
+
+frame_index_store = None
+frame_index_store_lock = threading.Lock()
+
+
+def getFrameIndexStore():
+    ''' open the store on first use - Options/FrameIndexCacheSize is its size limit in MiB '''
+    global frame_index_store
+    with frame_index_store_lock:
+        if frame_index_store is None:
+            max_mib = cfg.settings.value("Options/FrameIndexCacheSize", 256, type=int)
+            frame_index_store = FrameIndexStore(os.path.join(cfg.app_dirs.user_cache_dir, "frame-index"),
+                                                max_mib * 1024 * 1024)
+        return frame_index_store
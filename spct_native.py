@@ -0,0 +1,702 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from spct_defs import flac_vendor_regex
+from spct_objects import song_info_obj
+from spct_parsers import doMP3QualityChecks, doQualityChecks, formatMediaInfoDuration
+from spct_tools import internal_tool_versions
+from spct_utils import format_bytes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+native_version = internal_tool_versions["native"]
+
+# mpeg audio layer III frame headers
+MPEG1 = 3  # version bits, 2 is MPEG 2 and 0 is MPEG 2.5
+mp3_bitrates = {MPEG1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+                2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+                0: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+mp3_sample_rates = {MPEG1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+mp3_channel_modes = ("Stereo", "Joint Stereo", "Dual Channel", "Mono")
+mp3_mode_extensions = ("Simple stereo", "Intensity stereo", "Mid-side stereo", "Mid-side and intensity stereo")
+
+# lame tag preset values, from lame.h
+lame_presets = {1000: "R3mix.", 1001: "Standard.", 1002: "Extreme.", 1003: "Insane.", 1004: "Standard.",
+                1005: "Extreme.", 1006: "Medium.", 1007: "Medium."}
+lame_presets.update({410 + (9 - v) * 10: "V{}".format(v) for v in range(10)})  # V9 = 410 ... V0 = 500
+
+unpack_header = struct.Struct(">I").unpack_from
+unpack_le_int = struct.Struct("<I").unpack_from
+
+
+def decodeMP3Header(header):
+    ''' layer III frame header as int - returns (frame length, bitrate kbps, sample rate, version, channel mode,
+        mode extension) or None if it isn't a valid header. free format frames aren't supported '''
+    if header >> 21 != 0x7ff:
+        return None
+    version = (header >> 19) & 3
+    if version == 1 or (header >> 17) & 3 != 1:  # reserved version or not layer III
+        return None
+    bitrate_index = (header >> 12) & 15
+    sample_rate_index = (header >> 10) & 3
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = mp3_bitrates[version][bitrate_index]
+    sample_rate = mp3_sample_rates[version][sample_rate_index]
+    frame_length = (144 if version == MPEG1 else 72) * bitrate * 1000 // sample_rate + ((header >> 9) & 1)
+    return frame_length, bitrate, sample_rate, version, (header >> 6) & 3, (header >> 4) & 3
+
+
+def syncsafeInt(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def decodeID3Text(data):
+    if not data:
+        return ""
+    encoding = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(data[0], "latin-1")
+    text = data[1:].decode(encoding, "replace")
+    return text.split("\x00")[0].strip()  # id3v2.4 separates multiple values with nulls
+
+
+def readID3v2(mm):
+    ''' read text frames of id3v2 tag at start of file - returns (tag length, dict of frame id -> text) '''
+    if len(mm) < 10 or mm[0:3] != b"ID3":
+        return 0, {}
+    major = mm[3]
+    flags = mm[5]
+    size = syncsafeInt(mm[6:10])
+    tag_length = 10 + size + (10 if flags & 0x10 else 0)  # footer
+    frames = {}
+    if flags & 0x80 and major < 4:  # whole tag unsynchronised - rare, don't bother
+        return tag_length, frames
+    pos = 10
+    end = min(10 + size, len(mm))
+    if flags & 0x40:  # extended header
+        pos += syncsafeInt(mm[10:14]) if major == 4 else 4 + unpack_header(mm, 10)[0]
+    id_length, header_length = (3, 6) if major == 2 else (4, 10)
+    while pos + header_length <= end:
+        frame_id = mm[pos:pos + id_length]
+        if frame_id[0] == 0:  # padding
+            break
+        if major == 2:
+            frame_size = int.from_bytes(mm[pos + 3:pos + 6], "big")
+        elif major == 4:
+            frame_size = syncsafeInt(mm[pos + 4:pos + 8])
+        else:
+            frame_size = unpack_header(mm, pos + 4)[0]
+        if frame_id[:1] == b"T":
+            frames.setdefault(frame_id.decode("latin-1"),
+                              decodeID3Text(mm[pos + header_length:pos + header_length + frame_size]))
+        pos += header_length + frame_size
+    return tag_length, frames
+
+
+def audioEnd(mm):
+    ''' end of the audio data - before any id3v1 and apev2 tags at the end of the file
+        returns (end, id3v1 artist) '''
+    end = len(mm)
+    artist = ""
+    if end >= 128 and mm[end - 128:end - 125] == b"TAG":
+        artist = mm[end - 95:end - 65].split(b"\x00")[0].decode("latin-1").strip()
+        end -= 128
+    if end >= 32 and mm[end - 32:end - 24] == b"APETAGEX":
+        tag_size = unpack_le_int(mm, end - 20)[0]
+        has_header = unpack_le_int(mm, end - 12)[0] & 0x80000000
+        end = max(0, end - tag_size - (32 if has_header else 0))
+    return end, artist
+
+
+def bitrateHistogram(bitrates):
+    ''' (bitrates, frame counts) for each bitrate used in uint16 array bitrates - the frame_hist format '''
+    if numpy is not None:
+        counts = numpy.bincount(numpy.frombuffer(bitrates, dtype=numpy.uint16))
+        used = numpy.flatnonzero(counts)
+        return [int(bitrate) for bitrate in used], [int(counts[bitrate]) for bitrate in used]
+    counts = Counter(bitrates)
+    used = sorted(counts)
+    return used, [counts[bitrate] for bitrate in used]
+
+
+class mp3FrameScan(object):
+    ''' walks the frame headers of an mp3 file - every audio frame's offset and bitrate are kept in arrays,
+        the Xing/Info frame (if any) is read for the lame tag and not counted as audio '''
+
+    def __init__(self, mm, start, end):
+        self.offsets = array('Q')
+        self.bitrates = array('H')  # kbps
+        self.channel_mode_counts = [0, 0, 0, 0]
+        self.mode_extension_counts = [0, 0, 0, 0]
+        self.header_errors = 0
+        self.sample_rate = 0
+        self.version = None
+        self.samples_per_frame = 0
+        self.xing_quality = -1
+        self.encoder_string = ""
+        self.lame_preset = ""
+        self.vbri = False
+        self.headers = {}  # header int -> decodeMP3Header result, most files use only a few distinct headers
+        self.scan(mm, start, end)
+
+    def header(self, mm, pos):
+        value = unpack_header(mm, pos)[0]
+        try:
+            return self.headers[value]
+        except KeyError:
+            decoded = self.headers[value] = decodeMP3Header(value)
+            return decoded
+
+    def matches(self, info):
+        return info is not None and (self.version is None or
+                                     (info[3] == self.version and info[2] == self.sample_rate))
+
+    def findSync(self, mm, pos, end):
+        ''' offset of next frame header at or after pos that is followed by another frame header, or -1 '''
+        while True:
+            pos = mm.find(b"\xff", pos, end - 3)
+            if pos < 0:
+                return -1
+            info = self.header(mm, pos)
+            if self.matches(info):
+                next_pos = pos + info[0]
+                if next_pos == end:
+                    return pos
+                if next_pos + 4 <= end:
+                    next_info = self.header(mm, next_pos)
+                    if next_info is not None and next_info[3] == info[3] and next_info[2] == info[2]:
+                        return pos
+            pos += 1
+
+    def scan(self, mm, start, end):
+        pos = self.findSync(mm, start, end)
+        if pos < 0:
+            return
+        first = self.header(mm, pos)
+        self.version = first[3]
+        self.sample_rate = first[2]
+        self.samples_per_frame = 1152 if self.version == MPEG1 else 576
+        if self.readXing(mm, pos, first):
+            pos += first[0]
+
+        offsets = self.offsets
+        bitrates = self.bitrates
+        channel_mode_counts = self.channel_mode_counts
+        mode_extension_counts = self.mode_extension_counts
+        version = self.version
+        sample_rate = self.sample_rate
+        headers = self.headers
+        while pos + 4 <= end:
+            value = unpack_header(mm, pos)[0]
+            info = headers.get(value)
+            if info is None and value not in headers:
+                info = headers[value] = decodeMP3Header(value)
+            if info is not None and info[3] == version and info[2] == sample_rate:
+                if pos + info[0] > end:  # truncated last frame
+                    break
+                offsets.append(pos)
+                bitrates.append(info[1])
+                channel_mode_counts[info[4]] += 1
+                mode_extension_counts[info[5]] += 1
+                pos += info[0]
+                continue
+            next_pos = self.findSync(mm, pos + 1, end)
+            if next_pos < 0:  # rest of file is junk or tags
+                break
+            self.header_errors += 1
+            pos = next_pos
+
+    def readXing(self, mm, pos, info):
+        ''' read Xing/Info or VBRI header in first frame - returns True if the frame is a tag, not audio '''
+        mono = info[4] == 3
+        if info[3] == MPEG1:
+            side_info = 17 if mono else 32
+        else:
+            side_info = 9 if mono else 17
+        xing = pos + 4 + side_info
+        tag = mm[xing:xing + 4]
+        if tag in (b"Xing", b"Info"):
+            flags = unpack_header(mm, xing + 4)[0]
+            offset = xing + 8
+            if flags & 1:  # frame count
+                offset += 4
+            if flags & 2:  # byte count
+                offset += 4
+            if flags & 4:  # seek table
+                offset += 100
+            if flags & 8:
+                self.xing_quality = unpack_header(mm, offset)[0]
+                offset += 4
+            self.readLameTag(mm, offset)
+            return True
+        if mm[pos + 36:pos + 40] == b"VBRI":  # Fraunhofer encoders
+            self.vbri = True
+            return True
+        return False
+
+    def readLameTag(self, mm, offset):
+        encoder_string = mm[offset:offset + 9]
+        if not encoder_string[:4] in (b"LAME", b"Lavc", b"Lavf", b"GOGO"):
+            return
+        self.encoder_string = encoder_string.split(b"\x00")[0].decode("latin-1").strip()
+        if offset + 28 <= len(mm):
+            preset = int.from_bytes(mm[offset + 26:offset + 28], "big") & 0x7ff
+            if 8 <= preset <= 320:
+                self.lame_preset = "{} kbps".format(preset)  # abr
+            else:
+                self.lame_preset = lame_presets.get(preset, "")
+
+    def frameCount(self):
+        return len(self.bitrates)
+
+    def duration(self):
+        if not self.sample_rate:
+            return 0
+        return len(self.bitrates) * self.samples_per_frame / self.sample_rate
+
+    def bitrateHistogram(self):
+        return bitrateHistogram(self.bitrates)
+
+    def averageBitrate(self):
+        if not self.bitrates:
+            return 0
+        if numpy is not None:
+            return float(numpy.frombuffer(self.bitrates, dtype=numpy.uint16).mean())
+        return sum(self.bitrates) / len(self.bitrates)
+
+
+def scanMP3File(filenameStr):
+    ''' open and mmap mp3 file - returns (mp3FrameScan, id3 artist, file size) '''
+    with open(filenameStr, "rb") as f:
+        filesize = os.fstat(f.fileno()).st_size
+        if filesize == 0:
+            return mp3FrameScan(b"", 0, 0), "", 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            tag_length, id3_frames = readID3v2(mm)
+            end, id3v1_artist = audioEnd(mm)
+            frames = mp3FrameScan(mm, min(tag_length, end), end)
+    artist = id3_frames.get("TPE1") or id3_frames.get("TP1") or id3v1_artist
+    return frames, artist, filesize
+
+
+def scan_mp3(filenameStr, require_encoder=False):
+    ''' read mp3 frame headers, tags and lame header directly - returns song_info_obj as parse_mp3guessenc_output would
+        with require_encoder returns None if the encoder isn't named in the file, so mp3guessenc can guess it '''
+    frames, artist, filesize = scanMP3File(filenameStr)
+
+    si = song_info_obj()
+    si.result_type = song_info_obj.MP3GUESSENC  # same fields as mp3guessenc gives
+    si.audio_format = "MP3"
+    if not frames.frameCount():
+        si.file_error = True
+        si.audio_format = "MP3?"
+        return si
+
+    if frames.encoder_string:
+        si.encoderstring = frames.encoder_string
+        if frames.encoder_string.startswith("LAME"):
+            si.encoder = "Lame"
+    elif frames.vbri:
+        si.encoder = "FhG"
+    elif require_encoder:
+        return None
+
+    si.artist = artist
+    si.filesize = format_bytes(filesize)
+    si.frame_hist = frames.bitrateHistogram()
+    si.bitrate = "{} kbps".format(int(round(frames.averageBitrate())))
+    si.frequency = "{} KHz".format(frames.sample_rate / 1000)
+    si.decode_errors = frames.header_errors
+
+    channel_mode = max(range(4), key=frames.channel_mode_counts.__getitem__)
+    mode = {"Stereo": "S", "Joint Stereo": "JS"}.get(mp3_channel_modes[channel_mode], mp3_channel_modes[channel_mode])
+    if channel_mode == 1:
+        si.mode_count = "".join("\n  {} : {}".format(name, count)
+                                for name, count in zip(mp3_mode_extensions, frames.mode_extension_counts))
+    bitrate_mode = "VBR" if len(si.frame_hist[0]) > 1 else "CBR"
+    si.mode = "{}/{}".format(mode, bitrate_mode)
+
+    seconds = frames.duration()
+    minutes = int(seconds // 60)
+    si.length = "{}m {}s".format(minutes, round(seconds - minutes * 60))
+
+    # xing quality is 100 - 10 * V - q for lame
+    quality = q = V = -1
+    if si.encoder == "Lame" and 0 <= frames.xing_quality <= 100:
+        quality = frames.xing_quality
+        V, q = divmod(100 - quality, 10)
+    si.quality, si.quality_colour = doMP3QualityChecks(si.bitrate, si.encoder, si.encoderstring, frames.lame_preset,
+                                                       quality, q, V)
+    return si
+
+
+def audioStream(audio_format, duration, bitrate, sample_rate, bit_depth, channels, encoder=""):
+    ''' typed fields of an audio stream, with the same keys as spct_parsers.mediainfo_stream '''
+    return {"format": audio_format, "format_profile": "", "duration": duration, "bitrate": bitrate,
+            "bitrate_mode": "VBR" if audio_format == "FLAC" else "CBR", "sampling_rate": sample_rate,
+            "bit_depth": bit_depth, "channels": channels, "mode": "", "encoder": encoder, "language": "", "title": ""}
+
+
+def losslessSongInfo(stream, artist, filesize):
+    ''' song_info_obj for a lossless file read from its header - fields formatted as parse_mediainfo_media gives them '''
+    si = song_info_obj()
+    si.result_type = song_info_obj.MEDIAINFO
+    si.audio_streams = [stream]
+    si.audio_format = stream["format"]
+    si.encoder = stream["encoder"]
+    si.artist = artist
+    si.filesize = format_bytes(filesize)
+    si.length = formatMediaInfoDuration(stream["duration"])
+    si.bitrate = "{} kbps".format(int(round(stream["bitrate"] / 1000))) if stream["bitrate"] else ""
+    si.frequency = "{}/{:.1f} kHz".format(stream["bit_depth"], stream["sampling_rate"] / 1000)
+    si.mode = stream["bitrate_mode"]
+    si.file_error = False
+    si.quality, si.quality_colour = doQualityChecks(si.bitrate, si.audio_format, si.encoder)
+    return si
+
+
+def skipID3v2(f):
+    ''' leave f after any id3v2 tag at its start '''
+    header = f.read(10)
+    if len(header) == 10 and header[0:3] == b"ID3":
+        f.seek(10 + syncsafeInt(header[6:10]) + (10 if header[5] & 0x10 else 0))
+    else:
+        f.seek(0)
+
+
+def flacVendorString(vendor):
+    ''' "reference libFLAC 1.3.2 20170101" -> "libFLAC 1.3.2 (UTC 2017-01-01)", as mediainfo shows it '''
+    search = flac_vendor_regex.search(vendor)
+    if search is not None:
+        return "{} (UTC {}-{}-{})".format(*search.groups())
+    return vendor
+
+
+def readVorbisComments(data):
+    ''' returns (vendor string, dict of upper case field name -> first value) '''
+    comments = {}
+    vendor_length = unpack_le_int(data, 0)[0]
+    vendor = data[4:4 + vendor_length].decode("utf-8", "replace")
+    pos = 4 + vendor_length
+    count = unpack_le_int(data, pos)[0]
+    pos += 4
+    for i in range(count):
+        length = unpack_le_int(data, pos)[0]
+        name, sep, value = data[pos + 4:pos + 4 + length].decode("utf-8", "replace").partition("=")
+        comments.setdefault(name.upper(), value)
+        pos += 4 + length
+    return vendor, comments
+
+
+def scan_flac(filenameStr):
+    ''' read FLAC STREAMINFO and vorbis comments - returns song_info_obj, or None if mediainfo should read the file '''
+    with open(filenameStr, "rb") as f:
+        filesize = os.fstat(f.fileno()).st_size
+        skipID3v2(f)
+        if f.read(4) != b"fLaC":
+            return None
+        stream_info = None
+        vendor = ""
+        comments = {}
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                return None
+            last = header[0] & 0x80
+            block_type = header[0] & 0x7f
+            length = int.from_bytes(header[1:4], "big")
+            if block_type == 0:  # STREAMINFO
+                stream_info = f.read(length)
+            elif block_type == 4:  # VORBIS_COMMENT
+                vendor, comments = readVorbisComments(f.read(length))
+            else:  # skip pictures, seek tables, padding etc.
+                f.seek(length, os.SEEK_CUR)
+        audio_offset = f.tell()
+
+    if stream_info is None or len(stream_info) < 18:
+        return None
+    # 20 bits sample rate, 3 bits channels - 1, 5 bits bits per sample - 1, 36 bits total samples
+    packed = int.from_bytes(stream_info[10:18], "big")
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 7) + 1
+    bit_depth = ((packed >> 36) & 31) + 1
+    total_samples = packed & 0xfffffffff
+    if not sample_rate or not total_samples:  # length unknown
+        return None
+    duration = total_samples / sample_rate
+    bitrate = int((filesize - audio_offset) * 8 / duration)
+    stream = audioStream("FLAC", duration, bitrate, sample_rate, bit_depth, channels, flacVendorString(vendor))
+    return losslessSongInfo(stream, comments.get("ARTIST", ""), filesize)
+
+
+def scan_wav(filenameStr):
+    ''' read RIFF fmt and LIST INFO chunks of a PCM wav file - returns song_info_obj,
+        or None for compressed or unusual files, which mediainfo should read '''
+    with open(filenameStr, "rb") as f:
+        filesize = os.fstat(f.fileno()).st_size
+        header = f.read(12)
+        if len(header) < 12 or header[0:4] not in (b"RIFF", b"RF64") or header[8:12] != b"WAVE":
+            return None
+        fmt = None
+        data_size = None
+        ds64_data_size = None
+        artist = ""
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                break
+            chunk_id = chunk_header[0:4]
+            chunk_size = unpack_le_int(chunk_header, 4)[0]
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+            elif chunk_id == b"ds64":  # rf64 - real sizes of chunks over 4GB
+                ds64 = f.read(chunk_size)
+                ds64_data_size = struct.unpack_from("<Q", ds64, 8)[0]
+            elif chunk_id == b"LIST":
+                info = f.read(chunk_size)
+                if info[0:4] == b"INFO":
+                    pos = 4
+                    while pos + 8 <= len(info):
+                        sub_id = info[pos:pos + 4]
+                        sub_size = unpack_le_int(info, pos + 4)[0]
+                        if sub_id == b"IART":
+                            artist = info[pos + 8:pos + 8 + sub_size].split(b"\x00")[0].decode("latin-1").strip()
+                        pos += 8 + sub_size + (sub_size & 1)
+            else:
+                if chunk_id == b"data":
+                    data_size = chunk_size
+                    if chunk_size == 0xffffffff and ds64_data_size is not None:
+                        data_size = ds64_data_size
+                    data_size = min(data_size, filesize - f.tell())  # truncated file
+                    chunk_size = data_size
+                f.seek(chunk_size, os.SEEK_CUR)
+            if chunk_size & 1:  # chunks are word aligned
+                f.seek(1, os.SEEK_CUR)
+
+    if fmt is None or len(fmt) < 16 or data_size is None:
+        return None
+    format_tag, channels, sample_rate, byte_rate, block_align, bit_depth = struct.unpack_from("<HHIIHH", fmt)
+    if format_tag == 0xfffe and len(fmt) >= 26:  # WAVE_FORMAT_EXTENSIBLE - real format is start of sub format guid
+        format_tag = struct.unpack_from("<H", fmt, 24)[0]
+    if format_tag not in (1, 3) or not byte_rate or not sample_rate:  # only integer and float PCM
+        return None
+    stream = audioStream("PCM", data_size / byte_rate, byte_rate * 8, sample_rate, bit_depth, channels)
+    return losslessSongInfo(stream, artist, filesize)
+
+
+class frameIndex(object):
+    ''' start time (seconds) and bitrate (kbps) of each frame of a file, for the bitrate graph
+        ogg files have a point per page, as pages are the smallest unit with a timestamp.
+        times and bitrates are 'd' and 'H' arrays, or memoryviews of a spct_framestore file '''
+
+    def __init__(self, times=None, bitrates=None, duration=0.0):
+        self.times = times if times is not None else array('d')
+        self.bitrates = bitrates if bitrates is not None else array('H')
+        self.duration = duration
+
+    def __len__(self):
+        return len(self.bitrates)
+
+    def add(self, time, nbytes, seconds):
+        ''' frame of nbytes starting at time and lasting seconds '''
+        if seconds > 0:
+            self.times.append(time)
+            self.bitrates.append(min(0xffff, int(round(nbytes * 8 / seconds / 1000))))
+        self.duration = time + seconds
+
+    def bitrateHistogram(self):
+        return bitrateHistogram(self.bitrates)
+
+    def range(self, start, end):
+        ''' slice of frames starting in start - end seconds '''
+        return bisect_left(self.times, start), bisect_left(self.times, end)
+
+
+def mp3FrameIndex(filenameStr):
+    frames = scanMP3File(filenameStr)[0]
+    if not frames.frameCount():
+        return None
+    frame_seconds = frames.samples_per_frame / frames.sample_rate
+    times = array('d', (i * frame_seconds for i in range(frames.frameCount())))
+    return frameIndex(times, frames.bitrates, frames.duration())
+
+
+# flac frame header fields
+flac_block_sizes = (None, 192, 576, 1152, 2304, 4608, None, None, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+flac_sample_rates = (None, 88200, 176400, 192000, 8000, 16000, 22050, 24000, 32000, 44100, 48000, 96000)
+
+
+def crc8Table():
+    table = []
+    for i in range(256):
+        crc = i
+        for bit in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xff if crc & 0x80 else crc << 1
+        table.append(crc)
+    return bytes(table)
+
+
+flac_crc8_table = crc8Table()
+
+
+def flacFrameHeader(mm, pos, end, sync, stream_sample_rate):
+    ''' (block size, sample rate) of the flac frame header at pos, or None if it isn't one - checked with its crc '''
+    if mm[pos:pos + 2] != sync or pos + 6 > end:
+        return None
+    block_code = mm[pos + 2] >> 4
+    rate_code = mm[pos + 2] & 15
+    if block_code == 0 or rate_code == 15 or mm[pos + 3] & 1 or mm[pos + 3] >> 4 > 10:
+        return None
+    # frame or sample number, utf-8 style coded
+    first = mm[pos + 4]
+    length = 1
+    if first & 0x80:  # number of leading 1 bits is the length
+        length = 0
+        while length < 8 and first & (0x80 >> length):
+            length += 1
+        if not 2 <= length <= 7:
+            return None
+    header_end = pos + 4 + length
+    block_size = flac_block_sizes[block_code]
+    if block_code == 6:
+        block_size = mm[header_end] + 1
+        header_end += 1
+    elif block_code == 7:
+        block_size = int.from_bytes(mm[header_end:header_end + 2], "big") + 1
+        header_end += 2
+    sample_rate = flac_sample_rates[rate_code] if rate_code < 12 else None
+    if rate_code == 0:
+        sample_rate = stream_sample_rate
+    elif rate_code == 12:
+        sample_rate = mm[header_end] * 1000
+        header_end += 1
+    elif rate_code in (13, 14):
+        sample_rate = int.from_bytes(mm[header_end:header_end + 2], "big") * (10 if rate_code == 14 else 1)
+        header_end += 2
+    if header_end >= end or not sample_rate:
+        return None
+    crc = 0
+    for byte in mm[pos:header_end]:
+        crc = flac_crc8_table[crc ^ byte]
+    if crc != mm[header_end]:
+        return None
+    return block_size, sample_rate
+
+
+def flacFrameIndex(filenameStr):
+    ''' frame index from the flac frame headers - frame sizes are the distances between them '''
+    with open(filenameStr, "rb") as f:
+        skipID3v2(f)
+        if f.read(4) != b"fLaC":
+            return None
+        stream_info = None
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) < 4:
+                return None
+            last = header[0] & 0x80
+            length = int.from_bytes(header[1:4], "big")
+            if header[0] & 0x7f == 0:
+                stream_info = f.read(length)
+            else:
+                f.seek(length, os.SEEK_CUR)
+        audio_offset = f.tell()
+        if stream_info is None or len(stream_info) < 18 or os.fstat(f.fileno()).st_size <= audio_offset:
+            return None
+        min_frame_size = max(int.from_bytes(stream_info[4:7], "big"), 1)
+        stream_sample_rate = int.from_bytes(stream_info[10:18], "big") >> 44
+
+        index = frameIndex()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            sync = mm[audio_offset:audio_offset + 2]
+            if sync not in (b"\xff\xf8", b"\xff\xf9"):  # fixed or variable block size
+                return None
+            pos = audio_offset
+            frame = flacFrameHeader(mm, pos, end, sync, stream_sample_rate)
+            time = 0.0
+            while frame is not None:
+                next_pos = mm.find(sync, pos + min_frame_size, end)
+                next_frame = None
+                while next_pos >= 0:
+                    next_frame = flacFrameHeader(mm, next_pos, end, sync, stream_sample_rate)
+                    if next_frame is not None:
+                        break
+                    next_pos = mm.find(sync, next_pos + 1, end)
+                frame_end = next_pos if next_pos >= 0 else end
+                seconds = frame[0] / frame[1]
+                index.add(time, frame_end - pos, seconds)
+                time += seconds
+                pos = frame_end
+                frame = next_frame
+    return index if len(index) else None
+
+
+def oggSampleRate(packet):
+    ''' samples per second of ogg granule positions, from the first packet of the stream - None if unsupported '''
+    if packet[:7] == b"\x01vorbis" and len(packet) >= 16:
+        return unpack_le_int(packet, 12)[0]
+    if packet[:8] == b"OpusHead":
+        return 48000  # opus granule positions are always 48 kHz
+    return None
+
+
+def oggFrameIndex(filenameStr):
+    ''' frame index with a point for each ogg page of the first logical stream - vorbis and opus only '''
+    index = frameIndex()
+    with open(filenameStr, "rb") as f:
+        serial = None
+        sample_rate = None
+        last_granule = 0
+        nbytes = 0
+        while True:
+            header = f.read(27)
+            if len(header) < 27 or header[0:4] != b"OggS":
+                break
+            granule, page_serial = struct.unpack_from("<qI", header, 6)
+            lacing = f.read(header[26])
+            body_size = sum(lacing)
+            if serial is None:
+                serial = page_serial
+                sample_rate = oggSampleRate(f.read(body_size))
+                if not sample_rate:
+                    return None
+                continue
+            f.seek(body_size, os.SEEK_CUR)
+            if page_serial != serial:
+                continue
+            nbytes += 27 + len(lacing) + body_size
+            if granule < 0:  # no packet ends on this page
+                continue
+            if granule > last_granule:
+                index.add(last_granule / sample_rate, nbytes, (granule - last_granule) / sample_rate)
+                last_granule = granule
+                nbytes = 0
+            elif last_granule == 0:  # header pages
+                nbytes = 0
+    return index if len(index) else None
+
+
+frame_index_readers = {".mp3": mp3FrameIndex, ".flac": flacFrameIndex, ".ogg": oggFrameIndex, ".oga": oggFrameIndex,
+                       ".opus": oggFrameIndex}
+
+
+def readFrameIndex(filenameStr):
+    ''' frameIndex read from the file itself - None if the format isn't supported or the file can't be read '''
+    reader = frame_index_readers.get(os.path.splitext(filenameStr)[1].lower())
+    if reader is None:
+        return None
+    try:
+        return reader(filenameStr)
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
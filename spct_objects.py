@@ -33,6 +33,7 @@ class song_info_obj(object):
     MEDIAINFO = 2
     MP3GUESSENC = 3
     AUCDTECT = 4
+    CUTOFF = 5
     
     def __init__(self):
         self.result_type = 0
@@ -51,4 +52,41 @@ class song_info_obj(object):
         self.filesize = None
         self.decode_errors = 0
         self.length = None
+        self.audio_streams = None # list of dicts of typed fields for each audio stream, from mediainfo json output
+        self.tool = None # (name, version) of the tool that produced the result, see spct_tools
+        self.cutoff = None # lowpass frequency in Hz of lossless audio, the nyquist frequency if none
         
+
+class discovery_info(object):
+    # result types:
+    FILES = 1
+    FINISHED = 2
+
+    def __init__(self,result_type=0,files=None,count=0,elapsed=0):
+        self.result_type = result_type
+        self.files = files # list of (name, directory, stat_result)
+        self.count = count
+        self.elapsed = elapsed
+
+
+class cmd_result(object):
+    ''' result of running a command with spct_utils.runProcess '''
+
+    def __init__(self,cmd=None):
+        self.cmd = cmd
+        self.stdout = ""
+        self.stderr = ""
+        self.returncode = None
+        self.source_returncode = None # of source_cmd piped into cmd, if there was one
+        self.timed_out = False
+        self.truncated = False # output was longer than the limit, the rest was dropped
+        self.elapsed = 0.0 # seconds
+        self.error = None # exception if the command couldn't be started
+
+    def failed(self):
+        ''' command couldn't be started or was killed '''
+        return self.error is not None or self.timed_out
+
+    def succeeded(self):
+        ''' command ran to the end and exited with status 0, as did any command piped into it '''
+        return not self.failed() and self.returncode == 0 and self.source_returncode in (None, 0)
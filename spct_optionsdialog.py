@@ -5,6 +5,7 @@ from PyQt5.QtWidgets import QDialog,QFileDialog,QLineEdit,QCheckBox,QSpinBox,QSl
 import spct_cfg as cfg
 from spct_utils import findGuessEncBin,findMediaInfoBin,findFlacBin,findauCDtectBin,findSoxBin,findGnuPlotBin,findffprobeBin
 from spct_defs import defaultfilemask
+from spct_tools import getToolRegistry
 
 class OptionsDialog(QDialog):
     def __init__(self):
@@ -37,6 +38,8 @@ class OptionsDialog(QDialog):
         checkBox_cacheraw.setChecked(cfg.settings.value('Options/CacheRawOutput', False, type=bool))
         spinBox_processes = self.findChild(QSpinBox, "spinBox_processes")
         spinBox_processes.setValue(cfg.settings.value('Options/Processes', 0, type=int))
+        checkBox_process_engine = self.findChild(QCheckBox, "checkBox_process_engine")
+        checkBox_process_engine.setChecked(cfg.settings.value('Options/ProcessEngine', False, type=bool))
         spinBox_spectrogram_palette = self.findChild(QSpinBox, "spinBox_spectrogram_palette")
         spinBox_spectrogram_palette.setValue(cfg.settings.value('Options/SpectrogramPalette', 1, type=int))
         checkBox_debug = self.findChild(QCheckBox, "checkBox_debug")
@@ -115,6 +118,8 @@ class OptionsDialog(QDialog):
         cfg.settings.setValue('Options/CacheRawOutput', checkBox_cacheraw.isChecked())
         spinBox_processes = self.findChild(QSpinBox, "spinBox_processes")
         cfg.settings.setValue('Options/Processes', spinBox_processes.value())
+        checkBox_process_engine = self.findChild(QCheckBox, "checkBox_process_engine")
+        cfg.settings.setValue('Options/ProcessEngine', checkBox_process_engine.isChecked())
         spinBox_spectrogram_palette = self.findChild(QSpinBox, "spinBox_spectrogram_palette")
         cfg.settings.setValue('Options/SpectrogramPalette', spinBox_spectrogram_palette.value())
         checkBox_debug = self.findChild(QCheckBox, "checkBox_debug")
@@ -132,4 +137,5 @@ class OptionsDialog(QDialog):
         cfg.settings.setValue('Options/auCDtect_scan', checkBox_aucdtect_scan.isChecked())
         horizontalSlider_aucdtect_mode = self.findChild(QSlider, "horizontalSlider_aucdtect_mode")
         cfg.settings.setValue('Options/auCDtect_mode', horizontalSlider_aucdtect_mode.value())
+        getToolRegistry().refresh()  # paths may have changed
         self.close()
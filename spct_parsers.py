@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import json
+import logging
 import string
+from array import array
 from spct_defs import *
 from spct_objects import infoobj,main_info,song_info_obj
+from spct_tools import parseToolVersions, formatToolVersions
 from spct_utils import format_bytes, debug_log
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def doQualityChecks(bitrate,audio_format,encoder):
 #    debug_log("doQualityChecks: {},{},{}".format(bitrate,audio_format,encoder))
 
@@ -239,6 +248,16 @@ def parse_mp3guessenc_output(mp3guessenc_output):
     return si
 
 def parse_mediainfo_output(mediainfo_output):
+    ''' parse mediainfo output for one file - json output (or a media dict from split_mediainfo_output)
+        is read with parse_mediainfo_media, anything else with the text parser '''
+    if isinstance(mediainfo_output, dict):
+        return parse_mediainfo_media(mediainfo_output)
+    if is_mediainfo_json(mediainfo_output):
+        media_list = load_mediainfo_json(mediainfo_output)
+        return parse_mediainfo_media(media_list[0] if media_list else {})
+    return parse_mediainfo_text(mediainfo_output)
+
+def parse_mediainfo_text(mediainfo_output):
     bitrate=""
     length=""
     frequency=""
@@ -323,6 +342,151 @@ def parse_mediainfo_output(mediainfo_output):
     
     return si
 
+def is_mediainfo_json(mediainfo_output):
+    return mediainfo_output.lstrip()[:1] in ("{", "[")
+
+def load_mediainfo_json(mediainfo_output):
+    ''' parse --Output=JSON output - returns list of media dicts, one per file that mediainfo could read
+        one file gives {"media": {...}}, several give a list of those or {"media": [...]} depending on version '''
+    try:
+        data = json.loads(mediainfo_output)
+    except ValueError as e:
+        debug_log("mediainfo json output could not be parsed: {}".format(e),logging.WARNING)
+        return []
+    if not isinstance(data, list):
+        data = [data]
+    media_list = []
+    for item in data:
+        media = item.get("media") if isinstance(item, dict) else None
+        if isinstance(media, list):
+            media_list.extend(m for m in media if isinstance(m, dict))
+        elif isinstance(media, dict):
+            media_list.append(media)
+    return media_list
+
+def mediainfo_number(value, number_type=int):
+    ''' numeric json field - mediainfo writes numbers as strings, some with several values as "44100 / 22050" '''
+    if value is None:
+        return None
+    try:
+        return number_type(float(str(value).split("/")[0]))
+    except ValueError:
+        return None
+
+def mediainfo_stream(track):
+    ''' typed fields of an Audio track from mediainfo json output '''
+    return {"format": track.get("Format", ""),
+            "format_profile": track.get("Format_Profile", ""),
+            "duration": mediainfo_number(track.get("Duration"), float),  # seconds
+            "bitrate": mediainfo_number(track.get("BitRate")),  # bits/s
+            "bitrate_mode": track.get("BitRate_Mode", ""),
+            "sampling_rate": mediainfo_number(track.get("SamplingRate")),  # Hz
+            "bit_depth": mediainfo_number(track.get("BitDepth")),
+            "channels": mediainfo_number(track.get("Channels")),
+            "mode": track.get("Format_Settings_Mode", ""),
+            "encoder": track.get("Encoded_Library", ""),
+            "language": track.get("Language", ""),
+            "title": track.get("Title", "")}
+
+def formatAudioStreams(streams):
+    ''' one line for each audio stream (mediainfo_stream dicts) - "AC-3, 384 kbps, 6 ch, 48.0 kHz, eng" '''
+    lines = []
+    for stream in streams:
+        parts = [" ".join(part for part in (stream["format"], stream["format_profile"]) if part) or "Unknown"]
+        if stream["bitrate"]:
+            parts.append("{} kbps".format(int(round(stream["bitrate"] / 1000))))
+        if stream["channels"]:
+            parts.append("{} ch".format(stream["channels"]))
+        if stream["sampling_rate"]:
+            parts.append("{:.1f} kHz".format(stream["sampling_rate"] / 1000))
+        parts.extend(part for part in (stream["language"], stream["title"]) if part)
+        lines.append(", ".join(parts))
+    return "\n".join(lines)
+
+def formatMediaInfoDuration(seconds):
+    ''' 200.5 -> 3m 20 s, as the text parser gives for mediainfo's "3 min 20 s" '''
+    ms = int(round(seconds * 1000))
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    secs, ms = divmod(ms, 1000)
+    if hours:
+        return "{} h {}m".format(hours,minutes)
+    elif minutes:
+        return "{}m {} s".format(minutes,secs)
+    return "{} s {} ms".format(secs,ms)
+
+def parse_mediainfo_media(media):
+    ''' parse one file's media dict from mediainfo json output
+        fills song_info from the General track and the first Audio track, every audio stream is in si.audio_streams '''
+    si = song_info_obj()
+    si.result_type = song_info_obj.MEDIAINFO
+
+    tracks = media.get("track") or []
+    if isinstance(tracks, dict):
+        tracks = [tracks]
+    general = {}
+    audio_tracks = []
+    for track in tracks:
+        track_type = track.get("@type")
+        if track_type == "General" and not general:
+            general = track
+        elif track_type == "Audio":
+            audio_tracks.append(track)
+    si.audio_streams = [mediainfo_stream(track) for track in audio_tracks]
+    stream = si.audio_streams[0] if si.audio_streams else mediainfo_stream({})
+
+    si.audio_format = stream["format"]
+    si.artist = general.get("Performer", "")
+    si.encoder = stream["encoder"] or general.get("Encoded_Library", "")
+
+    filesize = mediainfo_number(general.get("FileSize"))
+    if filesize is not None:
+        si.filesize = format_bytes(filesize)
+
+    duration = stream["duration"] if stream["duration"] is not None else mediainfo_number(general.get("Duration"), float)
+    si.length = formatMediaInfoDuration(duration) if duration is not None else ""
+
+    bitrate = stream["bitrate"]
+    si.bitrate = "{} kbps".format(int(round(bitrate / 1000))) if bitrate else ""
+
+    if stream["sampling_rate"]:
+        si.frequency = "{:.1f} kHz".format(stream["sampling_rate"] / 1000)
+        if stream["bit_depth"]:
+            si.frequency = "{}/{}".format(stream["bit_depth"],si.frequency)
+    else:
+        si.frequency = ""
+
+    mode = stream["mode"]
+    if mode.lower() == "stereo":
+        mode = "S"
+    elif mode.lower() == "joint stereo":
+        mode = "JS"
+    bitrate_mode = stream["bitrate_mode"]
+    if bitrate_mode.lower() in ("cbr", "constant"):
+        bitrate_mode = "CBR"
+    elif bitrate_mode.lower() in ("vbr", "variable"):
+        bitrate_mode = "VBR"
+    si.mode = "/".join(part for part in (mode, bitrate_mode) if part)
+
+    si.file_error = False
+    si.quality, si.quality_colour = doQualityChecks(si.bitrate,si.audio_format,si.encoder)
+
+    return si
+
+def split_mediainfo_output(mediainfo_output):
+    ''' split output of mediainfo run on several files - returns list of (complete name, output for that file)
+        for json output each file's output is its media dict, for text output it's the file's report,
+        starting with the line before its "Complete name" (the General section heading) '''
+    if is_mediainfo_json(mediainfo_output):
+        return [(media.get("@ref", ""), media) for media in load_mediainfo_json(mediainfo_output)]
+    reports = []
+    matches = list(mediainfo_complete_name_regex.finditer(mediainfo_output))
+    starts = [mediainfo_output.rfind("\n", 0, max(match.start() - 1, 0)) + 1 for match in matches]
+    for i, match in enumerate(matches):
+        end = starts[i + 1] if i + 1 < len(matches) else len(mediainfo_output)
+        reports.append((match.group(1), mediainfo_output[starts[i]:end]))
+    return reports
+
 def parse_aucdtect_output(aucdtect_output):
     si = song_info_obj()
     si.result_type = song_info_obj.AUCDTECT
@@ -362,3 +526,189 @@ def parse_aucdtect_output(aucdtect_output):
     si.file_error = False
 
     return si
+
+def doCutoffQualityChecks(cutoff, sample_rate):
+    ''' quality text and colour for the lowpass frequency (Hz) found in a lossless file '''
+    if cutoff >= sample_rate // 2:
+        return "Full bandwidth", colourQualityGood
+    text = "Lowpass {:.1f} kHz".format(cutoff / 1000)
+    if cutoff < cutoff_bad_freq:
+        return text, colourQualityBad
+    elif cutoff < cutoff_warning_freq:
+        return text, colourQualityWarning
+    return text, colourQualityGood
+
+def cutoff_song_info(cutoff):
+    ''' song_info_obj from spectrumAccumulator.cutoff() result '''
+    si = song_info_obj()
+    si.result_type = song_info_obj.CUTOFF
+    if cutoff is not None:
+        si.cutoff, sample_rate = cutoff
+        si.quality, si.quality_colour = doCutoffQualityChecks(si.cutoff, sample_rate)
+    return si
+
+def mergeQuality(record, song_info, cache_fields):
+    ''' show the result's quality unless a worse one is already shown, so the order results arrive in doesn't matter
+        colour codes rise with how bad the result is, unknown is lowest. on equal colours aucdtect's verdict is shown,
+        otherwise the first result's '''
+    if song_info.quality_colour is None:
+        return
+    colour = colourToCode(song_info.quality_colour)
+    shown = record["quality_colour"]
+    if shown is None or colour > shown or (colour == shown and (song_info.result_type == song_info_obj.AUCDTECT or
+                                                                not record["quality"])):
+        if song_info.quality is not None:
+            record["quality"] = cache_fields["quality"] = song_info.quality
+        record["quality_colour"] = cache_fields["quality_colour"] = colour
+
+def mergeSongInfo(record, song_info):
+    ''' apply scanner result to record - dict of result cache fields with colours as QualityColours codes
+        returns dict of changed fields to store in result cache '''
+    cache_fields = {}
+
+    if song_info.file_error:
+        record["error_colour"] = colourToCode(colourQualityBad)
+        return cache_fields
+
+    if song_info.result_type == song_info_obj.CUTOFF:
+        if song_info.cutoff is None:  # silent
+            return cache_fields
+        record["cutoff"] = cache_fields["cutoff"] = str(song_info.cutoff)
+        mergeQuality(record, song_info, cache_fields)
+
+    elif song_info.result_type in (song_info_obj.MEDIAINFO, song_info_obj.MP3GUESSENC, song_info_obj.AUCDTECT):
+
+        mergeQuality(record, song_info, cache_fields)
+
+        if song_info.result_type in (song_info_obj.MEDIAINFO, song_info_obj.MP3GUESSENC):
+
+            if song_info.decode_errors > 0:
+                error_colour = colourToCode(colourQualityBad)
+            else:
+                error_colour = colourToCode(colourQualityGood)
+
+            if not record["error_colour"] == colourToCode(colourQualityBad):
+                record["error_colour"] = error_colour
+
+            record["scanned"] = True  # file has been scanned
+
+            # prefer mp3guessenc encoder info over mediainfo
+
+            if song_info.result_type == song_info_obj.MP3GUESSENC:
+                if not song_info.encoderstring == "":
+                    record["encoder"] = "{} ({})".format(song_info.audio_format, song_info.encoderstring)
+                elif not song_info.encoder == "":
+                    record["encoder"] = "{} ({})".format(song_info.audio_format, song_info.encoder)
+                else:
+                    record["encoder"] = "{}".format(song_info.audio_format)
+            elif not record["encoder"]:  # mediainfo
+                if not song_info.encoder == "":
+                    record["encoder"] = "{} ({})".format(song_info.audio_format, song_info.encoder)
+                else:
+                    record["encoder"] = "{}".format(song_info.audio_format)
+
+            if song_info.bitrate is not None:
+                record["bitrate"] = song_info.bitrate
+            if not song_info.artist == "":
+                record["artist"] = song_info.artist
+            if song_info.frame_hist is not None:
+                record["frame_hist"] = song_info.frame_hist
+            if song_info.frequency is not None:
+                record["frequency"] = song_info.frequency
+            if song_info.mode is not None:
+                record["mode"] = song_info.mode
+            if song_info.length is not None:
+                record["length"] = song_info.length
+            if song_info.filesize is not None:
+                record["filesize"] = song_info.filesize
+            if song_info.audio_streams is not None:
+                record["streams"] = formatAudioStreams(song_info.audio_streams)
+
+            for field in ("error_colour", "encoder", "bitrate", "artist", "frame_hist", "frequency", "mode", "length",
+                          "filesize", "streams"):
+                cache_fields[field] = record[field]
+
+    if cache_fields and song_info.tool is not None:
+        tool_versions = parseToolVersions(record.get("tools"))
+        name, version = song_info.tool
+        tool_versions[name] = version
+        record["tools"] = cache_fields["tools"] = formatToolVersions(tool_versions)
+
+    return cache_fields
+
+
+class ffprobePacketParser(object):
+    ''' parses "ffprobe -show_entries packet=pts_time,duration_time,size -of csv=p=0" output as it arrives -
+        pass feed as runProcess output_callback. keeps only packet start times and bitrates (kbps) in arrays,
+        so memory use doesn't depend on the size of the output '''
+
+    def __init__(self):
+        self.times = array('d')
+        self.bitrates = array('H')
+        self.duration = 0.0
+        self.rest = b""  # incomplete last line of previous chunk
+        self.bad_lines = 0
+
+    def feed(self, data):
+        data = self.rest + data
+        end = data.rfind(b"\n") + 1
+        self.rest = data[end:]
+        if end:
+            self.parseLines(data[:end])
+
+    def finish(self):
+        if self.rest.strip():
+            self.parseLines(self.rest + b"\n")
+        self.rest = b""
+
+    def parseLines(self, data):
+        if numpy is not None and self.threeFieldLines(data):
+            # all at once - the lines are parsed one by one if any field isn't a number
+            lines = data.count(b"\n")
+            try:
+                values = numpy.fromstring(data.replace(b"N/A", b"nan").replace(b"\n", b",").decode("ascii", "replace"),
+                                          dtype=numpy.float64, sep=",")
+            except ValueError:
+                values = None
+            if values is not None and len(values) == lines * 3:
+                self.addPackets(*values.reshape(-1, 3).T)
+                return
+        rows = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                time, seconds, size = (float(value) for value in line.replace(b"N/A", b"nan").split(b","))
+            except ValueError:
+                self.bad_lines += 1
+                continue
+            rows.append((time, seconds, size))
+        if not rows:
+            return
+        if numpy is not None:
+            self.addPackets(*numpy.array(rows).T)
+            return
+        for time, seconds, size in rows:
+            if seconds > 0 and size > 0 and time == time:  # not nan
+                self.times.append(time)
+                self.bitrates.append(min(0xffff, int(round(size * 8 / seconds / 1000))))
+                self.duration = max(self.duration, time + seconds)
+
+    @staticmethod
+    def threeFieldLines(data):
+        ''' True if every line of data (ending with a newline) has three comma separated fields '''
+        chars = numpy.frombuffer(data, dtype=numpy.uint8)
+        commas = numpy.cumsum(chars == ord(","))[chars == ord("\n")]
+        return bool(len(commas)) and bool(numpy.all(numpy.diff(commas, prepend=0) == 2))
+
+    def addPackets(self, times, durations, sizes):
+        keep = (durations > 0) & (sizes > 0) & numpy.isfinite(times)
+        times = times[keep]
+        durations = durations[keep]
+        if not len(times):
+            return
+        bitrates = numpy.clip(numpy.rint(sizes[keep] * 8 / durations / 1000), 0, 0xffff).astype(numpy.uint16)
+        self.times.frombytes(times.astype(numpy.float64).tobytes())
+        self.bitrates.frombytes(bitrates.tobytes())
+        self.duration = max(self.duration, float((times + durations).max()))
+
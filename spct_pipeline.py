@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import subprocess
+import threading
+from time import time
+
+from spct_objects import cmd_result
+from spct_utils import debug_log, runProcess, startProcess, killProcess, outputBuffer, readStream, cmd_output_limit
+
+
+class processConsumer(object):
+    ''' command that reads decoded audio from stdin, e.g. aucdtect - result is a cmd_result once finished '''
+
+    def __init__(self, cmd, output_limit=cmd_output_limit):
+        self.cmd = cmd
+        self.result = cmd_result(cmd)
+        self.output_limit = output_limit
+        self.proc = None
+        self.accepting = False  # False once the command has stopped reading
+        self.readers = []
+        self.stdout_buffer = outputBuffer(output_limit)
+        self.stderr_buffer = outputBuffer(output_limit)
+        self.start_time = time()
+
+    def start(self):
+        try:
+            self.proc = startProcess(self.cmd, subprocess.PIPE)
+        except (OSError, ValueError) as e:
+            self.result.error = e
+            debug_log("processConsumer: exception starting {}: {}".format(self.cmd, e), logging.ERROR)
+            return
+        self.accepting = True
+        self.readers = [threading.Thread(target=readStream, args=(self.proc.stdout, self.stdout_buffer.write), daemon=True),
+                        threading.Thread(target=readStream, args=(self.proc.stderr, self.stderr_buffer.write), daemon=True)]
+        for reader in self.readers:
+            reader.start()
+
+    def feed(self, data):
+        if not self.accepting:
+            return
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()  # nothing left buffered for close() to block on
+        except (OSError, ValueError):  # exited without reading everything
+            self.accepting = False
+
+    def finish(self, deadline, complete=True):
+        ''' close stdin and wait for the command until deadline (time() value)
+            complete False means the decoder failed, so the command is killed and its result is an error '''
+        if self.proc is None:
+            return
+        self.accepting = False
+        if not complete:  # before closing stdin, a feed blocked on a full pipe then fails instead of holding it
+            self.result.error = "decoder failed"
+            killProcess(self.proc)
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(max(0, deadline - time()))
+            for reader in self.readers:
+                reader.join(max(0, deadline - time()))
+            if any(reader.is_alive() for reader in self.readers):
+                raise subprocess.TimeoutExpired(self.cmd, deadline - self.start_time)
+        except subprocess.TimeoutExpired:
+            self.result.timed_out = True
+            debug_log("processConsumer: {} killed at timeout".format(self.cmd), logging.WARNING)
+            killProcess(self.proc)
+            for reader in self.readers:
+                reader.join(1)
+        self.proc.wait()
+        self.result.returncode = self.proc.returncode
+        self.result.elapsed = time() - self.start_time
+        self.result.stdout = self.stdout_buffer.text()
+        self.result.stderr = self.stderr_buffer.text()
+        self.result.truncated = self.stdout_buffer.truncated or self.stderr_buffer.truncated
+
+
+class pcmFanout(object):
+    ''' decode a file once and pass the decoded audio to several consumers as it arrives
+        consumers have start(), feed(bytes) and finish(deadline, complete) methods, see processConsumer.
+        a slow consumer holds up the decoder and so the others - the whole run is limited to cmd_timeout
+        if decoder_cmd is empty the file (a wav file) is passed to the consumers as it is '''
+
+    def __init__(self, decoder_cmd, consumers, filenameStr=None):
+        self.decoder_cmd = decoder_cmd
+        self.consumers = consumers
+        self.filenameStr = filenameStr
+
+    def feed(self, data):
+        for consumer in self.consumers:
+            consumer.feed(data)
+
+    def run(self, cmd_timeout=300):
+        ''' returns the decoder's cmd_result - stderr is kept for error checking '''
+        start_time = time()
+        for consumer in self.consumers:
+            consumer.start()
+        if self.decoder_cmd:
+            decoder_result = runProcess(self.decoder_cmd, cmd_timeout, output_callback=self.feed)
+        else:
+            decoder_result = self.readFile()
+        for consumer in self.consumers:
+            consumer.finish(start_time + cmd_timeout, not decoder_result.failed())
+        return decoder_result
+
+    def readFile(self):
+        result = cmd_result(None)
+        try:
+            with open(self.filenameStr, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    self.feed(chunk)
+            result.returncode = 0
+        except OSError as e:
+            result.error = e
+            debug_log("pcmFanout: error reading {}: {}".format(self.filenameStr, e), logging.WARNING)
+        return result
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import queue
+
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+
+
+class queueNotifier(QObject):
+    ''' lives in the GUI thread - turns notifications from worker threads into a (rate limited) ready signal '''
+    item_put = pyqtSignal()
+    ready = pyqtSignal()
+
+    def __init__(self, min_interval=0):
+        super(queueNotifier, self).__init__()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(min_interval)
+        self.timer.timeout.connect(self.ready)
+        self.item_put.connect(self.timer.start, Qt.QueuedConnection)  # always deliver via the event loop
+
+
+class notifyQueue(queue.Queue):
+    ''' queue.Queue that signals the GUI thread when items are added, replacing a polling QTimer
+        notifications are coalesced - after the first put no more are sent until the consumer calls getAll,
+        and ready is emitted at most once every min_interval ms however many results arrive '''
+
+    def __init__(self, maxsize=0, min_interval=0):
+        super(notifyQueue, self).__init__(maxsize)
+        self.notifier = queueNotifier(min_interval)
+        self.notify_pending = False
+
+    def connect(self, slot):
+        ''' call slot in the GUI thread when items are waiting '''
+        self.notifier.ready.connect(slot)
+
+    def _put(self, item):
+        # called by put() with self.mutex held
+        super(notifyQueue, self)._put(item)
+        if not self.notify_pending:
+            self.notify_pending = True
+            self.notifier.item_put.emit()
+
+    def getAll(self):
+        ''' remove and return all waiting items - the next put will notify again '''
+        with self.mutex:
+            items = list(self.queue)
+            self.queue.clear()
+            self.notify_pending = False
+            self.not_full.notify_all()
+        return items
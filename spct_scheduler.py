@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+from time import sleep, time
+
+from PyQt5.QtCore import QRunnable, QThreadPool
+
+import spct_cfg as cfg
+from spct_utils import debug_log
+
+# task classes - scanner threads set task_class to one of these
+METADATA = "metadata"  # reads tags and headers, mostly waiting on process start up and small reads
+DECODE = "decode"  # decodes the whole file, reads it sequentially and keeps a cpu busy
+ANALYSIS = "analysis"  # decodes and analyses the whole file, the most cpu per file
+
+TaskClasses = (METADATA, DECODE, ANALYSIS)
+
+# waiting threads run highest priority first
+PRIORITY_NORMAL = 0
+PRIORITY_VISIBLE = 1  # rows shown in the file list
+PRIORITY_SELECTED = 2  # selected rows
+PRIORITY_INFO = 3  # file shown in a FileInfo dialog
+
+max_priority_files = 2000  # most visible or selected files given a priority, so a priority update stays cheap
+
+# settings holding the limit for each task class, 0 for the default
+LimitSettings = {METADATA: "Options/MetadataThreads", DECODE: "Options/DecodeThreads",
+                 ANALYSIS: "Options/AnalysisThreads"}
+
+
+def isRotational(path):
+    ''' True if path is on a spinning disk - only detected on linux, False if unknown '''
+    if not hasattr(os, "major"):
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    sys_dev = "/sys/dev/block/{}:{}".format(os.major(st.st_dev), os.minor(st.st_dev))
+    for queue_dir in (os.path.join(sys_dev, "queue"), os.path.join(sys_dev, "..", "queue")):  # disk, or partition
+        try:
+            with open(os.path.join(queue_dir, "rotational"), "r") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+def defaultLimits(rotational=False, cpus=None):
+    ''' task class -> number of threads
+        decode and analysis tasks share the cpus between them so both run without oversubscribing.
+        on a spinning disk parallel full file reads make the disk seek between files, so one of each is run '''
+    if cpus is None:
+        cpus = os.cpu_count() or 1
+    if rotational:
+        return {METADATA: max(2, min(cpus, 4)), DECODE: 1, ANALYSIS: 1}
+    analysis = max(1, cpus // 2)
+    return {METADATA: max(2, cpus * 2), DECODE: max(1, cpus - analysis), ANALYSIS: analysis}
+
+
+def schedulerLimits(path=None, max_threads=0):
+    ''' limits from settings, defaulting from cpu count and the storage holding path
+        max_threads > 0 caps every class (Options/Processes or the -j option) '''
+    limits = defaultLimits(path is not None and isRotational(path))
+    for task_class, setting in LimitSettings.items():
+        value = cfg.settings.value(setting, 0, type=int)
+        if value > 0:
+            limits[task_class] = value
+        if max_threads > 0:
+            limits[task_class] = min(limits[task_class], max_threads)
+    return limits
+
+
+def taskFileIds(thread):
+    ''' file ids a scanner thread posts results for '''
+    batch = getattr(thread, "threads", None)  # mediainfoBatch_Thread
+    if batch is not None:
+        return [batch_thread.row for batch_thread in batch]
+    return [thread.row]
+
+
+class scheduledTask(QRunnable):
+    ''' runs a scanner thread then lets the scheduler start the next one of its class '''
+
+    def __init__(self, scheduler, thread, task_class):
+        super(scheduledTask, self).__init__()
+        self.scheduler = scheduler
+        self.thread = thread
+        self.task_class = task_class
+
+    def run(self):
+        try:
+            self.thread.run()
+        finally:
+            self.scheduler.taskDone(self.task_class)
+
+
+class taskScheduler(object):
+    ''' runs scanner threads in a QThreadPool for each task class, so every class has its own concurrency limit
+        and metadata scans keep running while the decode and analysis pools are full.
+        threads wait in a priority queue for each class and are only passed to the pool when it has a free thread,
+        so setPriorities can reorder the waiting threads at any time without cancelling any.
+        a thread whose priority changes is pushed again and its old heap entry left to be skipped when popped,
+        so a priority change only costs the threads of files whose priority changed.
+        has the QThreadPool methods the scanner code uses '''
+
+    def __init__(self, limits=None):
+        self.lock = threading.Lock()
+        self.pools = {task_class: QThreadPool() for task_class in TaskClasses}
+        self.limits = {}
+        self.pending = {task_class: [] for task_class in TaskClasses}  # heaps of [-priority, sequence, push, thread, class]
+        self.entries = {}  # sequence -> current heap entry of each waiting thread, older entries have thread None
+        self.file_entries = {}  # file id -> set of sequences of its waiting threads
+        self.running = dict.fromkeys(TaskClasses, 0)
+        self.priorities = {}  # file id -> priority, files not in it have PRIORITY_NORMAL
+        self.sequence = itertools.count()  # threads of equal priority run in the order they were queued
+        self.pushes = itertools.count()  # tells apart the entries of a thread pushed more than once
+        self.setLimits(limits or defaultLimits())
+
+    def setLimits(self, limits):
+        with self.lock:
+            for task_class, limit in limits.items():
+                self.limits[task_class] = max(1, limit)
+                self.pools[task_class].setMaxThreadCount(self.limits[task_class])
+                self.dispatch(task_class)
+        debug_log("Scheduler limits: {}".format(", ".join(
+            "{} {}".format(task_class, self.limits[task_class]) for task_class in TaskClasses)))
+
+    def threadPriority(self, thread):
+        return max(self.priorities.get(file_id, PRIORITY_NORMAL) for file_id in taskFileIds(thread))
+
+    def push(self, task_class, sequence, thread):
+        ''' add heap entry for waiting thread - call with lock held '''
+        entry = [-self.threadPriority(thread), sequence, next(self.pushes), thread, task_class]
+        self.entries[sequence] = entry
+        heapq.heappush(self.pending[task_class], entry)
+
+    def forget(self, sequence, thread):
+        ''' thread is no longer waiting - call with lock held '''
+        del self.entries[sequence]
+        for file_id in taskFileIds(thread):
+            sequences = self.file_entries.get(file_id)
+            if sequences is not None:
+                sequences.discard(sequence)
+                if not sequences:
+                    del self.file_entries[file_id]
+
+    def dispatch(self, task_class):
+        ''' start waiting threads while the class has free threads - call with lock held '''
+        pending = self.pending[task_class]
+        while pending and self.running[task_class] < self.limits[task_class]:
+            priority, sequence, push, thread, entry_class = heapq.heappop(pending)
+            if thread is None:  # replaced by an entry with a new priority
+                continue
+            self.forget(sequence, thread)
+            self.running[task_class] += 1
+            self.pools[task_class].start(scheduledTask(self, thread, task_class))
+
+    def taskDone(self, task_class):
+        with self.lock:
+            self.running[task_class] -= 1
+            self.dispatch(task_class)
+
+    def start(self, thread):
+        task_class = getattr(thread, "task_class", METADATA)
+        if task_class not in self.pools:
+            debug_log("Unknown task class {} for {}".format(task_class, thread), logging.WARNING)
+            task_class = METADATA
+        with self.lock:
+            sequence = next(self.sequence)
+            for file_id in taskFileIds(thread):
+                self.file_entries.setdefault(file_id, set()).add(sequence)
+            self.push(task_class, sequence, thread)
+            self.dispatch(task_class)
+
+    def setPriorities(self, priorities):
+        ''' dict of file id -> priority, replacing the previous priorities - waiting threads of files whose
+            priority changed are moved '''
+        with self.lock:
+            old_priorities = self.priorities
+            self.priorities = priorities
+            changed = set()
+            for file_id in set(old_priorities) | set(priorities):
+                if not old_priorities.get(file_id) == priorities.get(file_id):
+                    changed.update(self.file_entries.get(file_id, ()))
+            for sequence in changed:
+                entry = self.entries[sequence]
+                thread = entry[3]
+                if not entry[0] == -self.threadPriority(thread):
+                    entry[3] = None  # skipped when popped
+                    self.push(entry[4], sequence, thread)
+            for task_class, pending in self.pending.items():
+                if len(pending) > 2 * len(self.entries) + 1024:  # mostly replaced entries
+                    pending[:] = [entry for entry in pending if entry[3] is not None]
+                    heapq.heapify(pending)
+
+    def clear(self):
+        ''' remove threads that haven't started - returns the number of results they would have posted '''
+        with self.lock:
+            removed = sum(getattr(entry[3], "task_count", 1) for entry in self.entries.values())
+            for pending in self.pending.values():
+                pending.clear()
+            self.entries.clear()
+            self.file_entries.clear()
+            return removed
+
+    def activeThreadCount(self):
+        with self.lock:
+            return sum(self.running.values())
+
+    def pendingCount(self):
+        with self.lock:
+            return len(self.entries)
+
+    def waitForDone(self, msecs=-1):
+        ''' True once no threads are waiting or running - waits up to msecs, or until done if msecs is -1 '''
+        deadline = None if msecs < 0 else time() + msecs / 1000
+        while True:
+            with self.lock:
+                if not any(self.running.values()) and not self.entries:
+                    return True
+            if deadline is not None and time() >= deadline:
+                return False
+            sleep(0.01)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import struct
+import zlib
+from math import sin, pi
+
+from PyQt5.QtGui import QImage, qRgb
+
+from spct_defs import cutoff_floor_margin, cutoff_slope_width, cutoff_min_drop
+from spct_pipeline import pcmFanout
+from spct_utils import debug_log
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+fft_size = 1024  # 43 Hz per bin at 44.1 kHz
+hop_size = fft_size // 2  # windows overlap by half
+spectrogram_width = 800  # time columns kept, the width of sox's spectrogram
+spectrogram_height = 256  # frequency rows kept, each the mean of two fft bins
+db_range = 120  # dB below full scale shown, as sox's default
+
+# stored with cached spectrograms - change when any of the above change so they are recalculated
+spectrogram_params = "stft{}/{}x{}/{}dB".format(fft_size, spectrogram_width, spectrogram_height, db_range)
+
+# wav format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xfffe
+
+max_wav_header = 1024 * 1024
+
+
+def spectrogramEngineAvailable():
+    return numpy is not None
+
+
+def soxPalette(palette=1, light_background=True):
+    ''' colour table matching sox spectrogram -p palette (1-6), -l for light_background '''
+    perm = (palette - 1) % 6
+    colours = [0] * 256
+    for i in range(256):
+        x = i / 255
+        c = (0 if x < .13 else sin((x - .13) / .60 * pi / 2) if x < .73 else 1,
+             0 if x < .60 else sin((x - .60) / .31 * pi / 2) if x < .91 else 1,
+             .5 * sin(x / .60 * pi) if x < .60 else 0 if x < .78 else (x - .78) / .22)
+        at = 255 - i if light_background else i
+        colours[at] = qRgb(int(.5 + 255 * c[perm % 3]), int(.5 + 255 * c[(1 + perm + perm % 2) % 3]),
+                           int(.5 + 255 * c[(2 + perm - perm % 2) % 3]))
+    return colours
+
+
+def parseWavHeader(header):
+    ''' returns ((dtype, channels, sample rate, block align), offset of audio data) from the start of a wav stream,
+        None if more of the stream is needed. the data chunk size is ignored as piped decoders don't know it '''
+    if len(header) < 12:
+        return None
+    if not header[:4] == b"RIFF" or not header[8:12] == b"WAVE":
+        raise ValueError("not a wav stream")
+    sample_format = None
+    offset = 12
+    while len(header) >= offset + 8:
+        chunk_id, chunk_size = struct.unpack_from("<4sI", header, offset)
+        if chunk_id == b"data":
+            if sample_format is None:
+                raise ValueError("no fmt chunk before data")
+            return sample_format, offset + 8
+        if len(header) < offset + 8 + chunk_size:
+            return None
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate, byte_rate, block_align, bits = struct.unpack_from("<HHIIHH", header,
+                                                                                                  offset + 8)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                format_tag = struct.unpack_from("<H", header, offset + 32)[0]  # first two bytes of the subformat guid
+            if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+                dtype = "<f4"
+            elif format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+                dtype = {8: "u1", 16: "<i2", 24: "int24", 32: "<i4"}[bits]
+            else:
+                raise ValueError("unsupported wav format {} {} bit".format(format_tag, bits))
+            if channels < 1 or not block_align == channels * ((bits + 7) // 8):
+                raise ValueError("bad wav block align")
+            sample_format = (dtype, channels, sample_rate, block_align)
+        offset += 8 + chunk_size + chunk_size % 2
+    if len(header) > max_wav_header:
+        raise ValueError("no data chunk in wav header")
+    return None
+
+
+def pcmToMono(data, dtype, channels):
+    ''' interleaved samples as float32 mono, full scale +-1 '''
+    if dtype == "int24":
+        raw = numpy.frombuffer(data, numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+        samples = ((raw[:, 0] << 8 | raw[:, 1] << 16 | raw[:, 2] << 24) >> 8).astype(numpy.float32) / 8388608
+    elif dtype == "u1":
+        samples = (numpy.frombuffer(data, numpy.uint8).astype(numpy.float32) - 128) / 128
+    elif dtype == "<f4":
+        samples = numpy.frombuffer(data, dtype)
+    else:
+        samples = numpy.frombuffer(data, dtype).astype(numpy.float32) / float(2 ** (8 * numpy.dtype(dtype).itemsize - 1))
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=numpy.float32)
+    return samples
+
+
+class spectrogramData(object):
+    ''' log magnitude spectrogram as levels 0-255 (db_range dB below full scale to 0 dB), one byte per pixel,
+        row by row with the highest frequency first '''
+
+    def __init__(self, sample_rate, width, height, levels):
+        self.sample_rate = sample_rate
+        self.width = width
+        self.height = height
+        self.levels = levels
+
+    def pack(self):
+        return zlib.compress(self.levels)
+
+    @classmethod
+    def unpack(cls, sample_rate, width, height, data):
+        return cls(sample_rate, width, height, zlib.decompress(data))
+
+    def toImage(self, palette=1):
+        image = QImage(self.levels, self.width, self.height, self.width, QImage.Format_Indexed8).copy()
+        image.setColorTable(soxPalette(palette))
+        return image
+
+
+class stftAccumulator(object):
+    ''' pcm consumer for pcmFanout - short time fourier transform of a wav stream as it's decoded.
+        power is summed into at most 2 * width columns, merging neighbouring columns whenever there are more,
+        so memory use doesn't depend on the length of the file '''
+
+    def __init__(self, width=spectrogram_width, hop=hop_size):
+        self.width = width
+        self.hop = hop
+        self.header = b""
+        self.sample_format = None  # (dtype, channels, sample rate, block align) once the header has been read
+        self.partial = b""  # bytes of an incomplete sample frame
+        self.samples = numpy.zeros(0, numpy.float32)  # mono samples not yet in a complete window
+        self.window = numpy.hanning(fft_size).astype(numpy.float32)
+        self.columns = []  # summed power of frames_per_column windows
+        self.column = numpy.zeros(fft_size // 2 + 1)
+        self.column_frames = 0
+        self.frames_per_column = 1
+        self.error = None
+
+    def start(self):
+        pass
+
+    def feed(self, data):
+        if self.error is not None:
+            return
+        try:
+            if self.sample_format is None:
+                self.header += data
+                parsed = parseWavHeader(self.header)
+                if parsed is None:
+                    return
+                self.sample_format, offset = parsed
+                data = self.header[offset:]
+                self.header = b""
+            self.addSamples(data)
+        except ValueError as e:
+            debug_log("stftAccumulator: {}".format(e), logging.WARNING)
+            self.error = e
+
+    def addSamples(self, data):
+        dtype, channels, sample_rate, block_align = self.sample_format
+        data = self.partial + data
+        usable = len(data) - len(data) % block_align
+        self.partial = data[usable:]
+        if usable:
+            self.samples = numpy.concatenate((self.samples, pcmToMono(data[:usable], dtype, channels)))
+        if len(self.samples) < fft_size:
+            return
+        count = (len(self.samples) - fft_size) // self.hop + 1
+        frames = numpy.lib.stride_tricks.as_strided(self.samples, (count, fft_size),
+                                                    (self.samples.strides[0] * self.hop, self.samples.strides[0]))
+        self.addPower(numpy.abs(numpy.fft.rfft(frames * self.window, axis=1)) ** 2)
+        self.samples = self.samples[count * self.hop:].copy()
+
+    def addPower(self, power):
+        start = 0
+        while start < len(power):
+            take = min(len(power) - start, self.frames_per_column - self.column_frames)
+            self.column += power[start:start + take].sum(axis=0)
+            self.column_frames += take
+            start += take
+            if self.column_frames == self.frames_per_column:
+                self.columns.append(self.column)
+                self.column = numpy.zeros(fft_size // 2 + 1)
+                self.column_frames = 0
+                if len(self.columns) >= 2 * self.width:
+                    self.columns = [a + b for a, b in zip(self.columns[::2], self.columns[1::2])]
+                    self.frames_per_column *= 2
+
+    def finish(self, deadline, complete=True):
+        if not complete and self.error is None:
+            self.error = "decoder failed"
+
+    def spectrogram(self):
+        ''' spectrogramData, None if the stream couldn't be read or had less than one window of audio '''
+        if self.error is not None or self.sample_format is None:
+            return None
+        power = [column / self.frames_per_column for column in self.columns]
+        if self.column_frames:
+            power.append(self.column / self.column_frames)
+        if not power:
+            return None
+        power = numpy.array(power)
+        if len(power) > self.width:  # average down to width columns
+            starts = (numpy.arange(self.width) * len(power)) // self.width
+            counts = numpy.diff(numpy.append(starts, len(power)))
+            power = numpy.add.reduceat(power, starts, axis=0) / counts[:, None]
+        bins_per_row = (fft_size // 2) // spectrogram_height
+        power = power[:, :spectrogram_height * bins_per_row].reshape(len(power), spectrogram_height, bins_per_row)
+        power = power.mean(axis=2)
+        full_scale = (fft_size / 4) ** 2  # power of a full scale sine through the hann window
+        db = 10 * numpy.log10(power / full_scale + 1e-30)
+        levels = numpy.clip((db + db_range) * (255 / db_range), 0, 255).astype(numpy.uint8)
+        levels = numpy.ascontiguousarray(levels.T[::-1])  # rows of frequencies, highest first
+        return spectrogramData(self.sample_format[2], levels.shape[1], levels.shape[0], levels.tobytes())
+
+
+class spectrumAccumulator(stftAccumulator):
+    ''' pcm consumer for pcmFanout - long term average spectrum of a wav stream, for detectCutoff
+        windows don't overlap, as only the average is needed '''
+
+    def __init__(self):
+        super(spectrumAccumulator, self).__init__(hop=fft_size)
+        self.total = numpy.zeros(fft_size // 2 + 1)
+        self.frames = 0
+
+    def addPower(self, power):
+        self.total += power.sum(axis=0)
+        self.frames += len(power)
+
+    def cutoff(self):
+        ''' (lowpass frequency in Hz, sample rate) - frequency is the nyquist frequency if there's no lowpass,
+            None if the stream couldn't be read or is silent '''
+        if self.error is not None or self.sample_format is None or not self.frames:
+            return None
+        sample_rate = self.sample_format[2]
+        cutoff = detectCutoff(self.total / self.frames, sample_rate)
+        if cutoff is None:
+            return None
+        return cutoff, sample_rate
+
+
+def detectCutoff(power, sample_rate):
+    ''' lowpass frequency (Hz) from average power of each fft bin - the nyquist frequency if there isn't one,
+        None if the audio is silent.
+        finds the highest frequency clearly above the level near nyquist, then checks the level falls steeply
+        there as it does at a lossy encoder's lowpass filter, rather than rolling off gradually '''
+    db = 10 * numpy.log10(power / (fft_size / 4) ** 2 + 1e-30)
+    db = numpy.convolve(db, numpy.ones(3) / 3, mode="same")
+    if db.max() < -db_range:
+        return None
+    bin_hz = sample_rate / fft_size
+    nyquist = sample_rate // 2
+    floor = numpy.median(db[int(len(db) * 0.97):-1])  # level near nyquist
+    above = numpy.nonzero(db[:-1] > floor + cutoff_floor_margin)[0]
+    if not len(above):
+        return nyquist
+    edge = above[-1]
+    slope_bins = max(2, int(cutoff_slope_width / bin_hz))
+    if edge < 2 * slope_bins or edge + slope_bins >= len(db) - 1:
+        return nyquist
+    passband = db[edge - 2 * slope_bins:edge - slope_bins].mean()
+    if passband - db[edge + 1:edge + 1 + slope_bins].mean() < cutoff_min_drop:
+        return nyquist
+    # the edge found is above the filter frequency by the window's leakage, use where the fall starts instead
+    start = edge - 2 * slope_bins
+    falling = numpy.nonzero(db[start:edge + 1] < passband - cutoff_floor_margin)[0]
+    if len(falling):
+        edge = start + falling[0]
+    return int(edge * bin_hz)
+
+
+def computeSpectrogram(filenameStr, decoder_cmd, cmd_timeout=300):
+    ''' spectrogramData for file, None if it couldn't be decoded
+        decoder_cmd writes a wav stream to stdout, empty to read a wav file directly '''
+    accumulator = stftAccumulator()
+    if pcmFanout(decoder_cmd, [accumulator], filenameStr).run(cmd_timeout).failed():
+        return None
+    return accumulator.spectrogram()
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+
+import os
+from array import array
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+from spct_defs import *
+
+# result fields held as string columns
+TextFields = ("artist", "encoder", "bitrate", "length", "filesize", "mode", "frequency", "quality", "tools",
+              "cutoff", "streams")
+
+# table header -> text field shown in that column
+ColumnFields = {"Artist": "artist", "Length": "length", "Bitrate": "bitrate", "Mode": "mode",
+                "Frequency": "frequency", "Filesize": "filesize", "Encoder": "encoder", "Quality": "quality"}
+
+no_colour = -1
+
+# filter_comboBox entries
+filterAll = 0
+filterErrors = 1
+filterLossless = 2
+filterLossy = 3
+filterHighQuality = 4
+filterLowQuality = 5
+filterUnscanned = 6
+
+text_encoding = "utf-8"
+text_errors = "surrogatepass"  # names from os.scandir can hold lone surrogates
+
+
+class internedColumn(object):
+    ''' string column as an array of value ids into a table of the distinct values - most fields have few,
+        so ids start as one byte each and widen when the table outgrows them '''
+
+    id_types = (('B', 0xff), ('H', 0xffff), ('l', 0x7fffffff))
+
+    def __init__(self):
+        self.values = [""]
+        self.index = {"": 0}
+        self.ids = array('B')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, file_id):
+        return self.values[self.ids[file_id]]
+
+    def __setitem__(self, file_id, value):
+        value_id = self.valueId(value)  # may replace ids with a wider array
+        self.ids[file_id] = value_id
+
+    def append(self, value):
+        value_id = self.valueId(value)
+        self.ids.append(value_id)
+
+    def valueId(self, value):
+        value_id = self.index.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(value)
+            self.index[value] = value_id
+            for typecode, max_id in self.id_types:
+                if value_id <= max_id:
+                    if not self.ids.typecode == typecode:
+                        self.ids = array(typecode, self.ids)
+                    break
+        return value_id
+
+    def sortKey(self):
+        ''' key function for file ids that sorts them by value, comparing each distinct value once '''
+        rank = [0] * len(self.values)
+        for position, value_id in enumerate(sorted(range(len(self.values)), key=self.values.__getitem__)):
+            rank[value_id] = position
+        ids = self.ids
+        return lambda file_id: rank[ids[file_id]]
+
+
+class packedStrings(object):
+    ''' string column of mostly distinct values as one encoded buffer with the start and length of each row.
+        a replaced value is appended to the buffer - only keys are replaced, and seldom '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.starts = array('Q')
+        self.lengths = array('I')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, file_id):
+        start = self.starts[file_id]
+        return self.buffer[start:start + self.lengths[file_id]].decode(text_encoding, text_errors)
+
+    def __setitem__(self, file_id, value):
+        self.starts[file_id], self.lengths[file_id] = self.pack(value)
+
+    def append(self, value):
+        start, length = self.pack(value)
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def pack(self, value):
+        data = value.encode(text_encoding, text_errors)
+        start = len(self.buffer)
+        self.buffer += data
+        return start, len(data)
+
+
+class FileTableModel(QAbstractTableModel):
+    ''' model for the main file table, backed by a columnar store (one compact column or array per field)
+
+        every file gets a file id (its index in the store) which does not change until the list is cleared,
+        so scanner results can be applied by id whatever the current sort order or filter.
+        order holds the file ids of the displayed rows, position maps file id to displayed row (-1 if hidden) '''
+
+    def __init__(self, parent=None):
+        super(FileTableModel, self).__init__(parent)
+        self.column_fields = tuple(ColumnFields.get(header) for header in TableHeaders)
+        self.col_filename = TableHeaders.index("Filename")
+        self.col_folder = TableHeaders.index("Folder")
+        self.col_errors = TableHeaders.index("Errors")
+        self.col_quality = TableHeaders.index("Quality")
+        self.col_encoder = TableHeaders.index("Encoder")
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.filter_text = ""
+        self.filter_type = filterAll
+        self.clearStore()
+
+    def clearStore(self):
+        self.names = packedStrings()
+        self.folder_ids = array('l')
+        self.folders = []  # folder paths, indexed by folder_ids
+        self.folder_index = {}  # folder path -> folder id
+        self.keys = packedStrings()  # result cache keys
+        self.text = {field: internedColumn() for field in TextFields}
+        self.quality_colour = array('b')
+        self.error_colour = array('b')
+        self.scanned = bytearray()
+        self.frame_hist = {}  # file id -> frame histogram, only for files that have one
+        self.path_ids = None  # path -> file id, built on first idForPath call
+        self.all_ids = array('l')  # all file ids in sort order
+        self.order = array('l')
+        self.position = array('l')
+
+    def clear(self):
+        self.beginResetModel()
+        self.clearStore()
+        self.endResetModel()
+
+    # QAbstractTableModel interface
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(TableHeaders)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return TableHeaders[section]
+        return super(FileTableModel, self).headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        file_id = self.order[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == self.col_filename:
+                return self.names[file_id]
+            elif column == self.col_folder:
+                return os.path.basename(self.folders[self.folder_ids[file_id]])
+            field = self.column_fields[column]
+            if field is not None:
+                if column == self.col_encoder:
+                    stream_count = self.streamCount(file_id)
+                    if stream_count > 1:
+                        return "{} [{} audio streams]".format(self.text[field][file_id], stream_count)
+                return self.text[field][file_id]
+            return ""
+        elif role == Qt.ToolTipRole:
+            if column == self.col_filename:
+                return self.path(file_id)
+            elif column == self.col_folder:
+                return self.folder(file_id)
+            elif column == self.col_encoder and self.streamCount(file_id) > 1:
+                return self.text["streams"][file_id]
+        elif role == Qt.BackgroundRole:
+            if column == self.col_quality:
+                return colourFromCode(self.quality_colour[file_id])
+            elif column == self.col_errors:
+                return colourFromCode(self.error_colour[file_id])
+        elif role == dataFilenameStr:
+            return self.path(file_id)
+        elif role == dataScanned:
+            return bool(self.scanned[file_id])
+        elif role == dataCacheKey:
+            return self.keys[file_id]
+        elif role == dataBitrate:
+            return self.frame_hist.get(file_id)
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        ''' sort all files by column - ids are sorted with python's sort on the column's values '''
+        self.sort_column = column
+        self.sort_order = order
+        if column < 0 or column >= len(TableHeaders):
+            return
+        if column == self.col_filename:
+            key = self.names.__getitem__
+        elif column == self.col_folder:
+            folder_names = [os.path.basename(folder) for folder in self.folders]
+            key = lambda file_id: folder_names[self.folder_ids[file_id]]
+        elif column == self.col_errors:
+            key = self.error_colour.__getitem__
+        elif self.column_fields[column] is not None:
+            key = self.text[self.column_fields[column]].sortKey()
+        else:
+            return
+        self.all_ids = array('l', sorted(range(len(self.names)), key=key,
+                                         reverse=(order == Qt.DescendingOrder)))
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+        self.setOrder([file_id for file_id in self.all_ids if self.acceptsFile(file_id)])
+        persistent = self.persistentIndexList()
+        self.changePersistentIndexList(persistent, [self.index(self.position[old_order[index.row()]], index.column())
+                                                    if self.position[old_order[index.row()]] >= 0 else QModelIndex()
+                                                    for index in persistent])
+        self.layoutChanged.emit()
+
+    # filtering
+
+    def setFilter(self, filter_text, filter_type):
+        self.filter_text = filter_text.lower()
+        self.filter_type = filter_type
+        self.beginResetModel()
+        self.setOrder([file_id for file_id in self.all_ids if self.acceptsFile(file_id)])
+        self.endResetModel()
+
+    def acceptsFile(self, file_id):
+        if self.filter_text:
+            if not ((self.filter_text in self.path(file_id).lower()) or
+                    (self.filter_text in self.text["artist"][file_id].lower()) or
+                    (self.filter_text in self.text["encoder"][file_id].lower())):
+                return False
+
+        if self.filter_type == filterAll:
+            return True
+        elif self.filter_type == filterErrors:
+            return self.error_colour[file_id] == colourToCode(colourQualityBad)
+        elif self.filter_type in (filterLossless, filterLossy):
+            fn, ext = os.path.splitext(self.names[file_id])
+            if self.filter_type == filterLossless:
+                return ext.lower() in LosslessFormats
+            return ext.lower() in LossyFormats
+        elif self.filter_type == filterHighQuality:
+            return self.quality_colour[file_id] in (colourToCode(colourQualityGood), colourToCode(colourQualityOk))
+        elif self.filter_type == filterLowQuality:
+            return self.quality_colour[file_id] in (colourToCode(colourQualityWarning), colourToCode(colourQualityBad))
+        elif self.filter_type == filterUnscanned:
+            return not self.scanned[file_id]
+        return True
+
+    def setOrder(self, ids):
+        self.order = array('l', ids)
+        self.position = array('l', [-1]) * len(self.names)
+        for row, file_id in enumerate(self.order):
+            self.position[file_id] = row
+
+    # file store
+
+    def appendFiles(self, files):
+        ''' add list of (name, directory, cache key, cached result dict or None) - returns list of new file ids '''
+        first_id = len(self.names)
+        for name, directory, key, cached in files:
+            folder_id = self.folder_index.get(directory)
+            if folder_id is None:
+                folder_id = len(self.folders)
+                self.folders.append(directory)
+                self.folder_index[directory] = folder_id
+            self.names.append(name)
+            self.folder_ids.append(folder_id)
+            self.keys.append(key)
+            self.quality_colour.append(no_colour)
+            self.error_colour.append(no_colour)
+            self.scanned.append(False)
+            for field in TextFields:
+                self.text[field].append("")
+            if cached is not None:
+                self.setFields(len(self.names) - 1, cached)
+            if self.path_ids is not None:
+                self.path_ids[os.path.join(directory, name)] = len(self.names) - 1
+
+        new_ids = range(first_id, len(self.names))
+        self.all_ids.extend(new_ids)
+        self.position.extend([-1] * len(new_ids))
+        accepted = [file_id for file_id in new_ids if self.acceptsFile(file_id)]
+        if accepted:
+            first_row = len(self.order)
+            self.beginInsertRows(QModelIndex(), first_row, first_row + len(accepted) - 1)
+            for row, file_id in enumerate(accepted, first_row):
+                self.order.append(file_id)
+                self.position[file_id] = row
+            self.endInsertRows()
+        return list(new_ids)
+
+    def setFields(self, file_id, fields):
+        ''' set fields (result cache names, colours as codes) without notifying views '''
+        for field, value in fields.items():
+            if field in TextFields:
+                self.text[field][file_id] = value or ""
+            elif field == "quality_colour":
+                self.quality_colour[file_id] = no_colour if value is None else value
+            elif field == "error_colour":
+                self.error_colour[file_id] = no_colour if value is None else value
+            elif field == "frame_hist":
+                if value is None:
+                    self.frame_hist.pop(file_id, None)
+                else:
+                    self.frame_hist[file_id] = value
+            elif field == "scanned":
+                self.scanned[file_id] = bool(value)
+
+    def record(self, file_id):
+        ''' fields of file as a dict - see spct_parsers.mergeSongInfo '''
+        record = {field: self.text[field][file_id] for field in TextFields}
+        record["quality_colour"] = None if self.quality_colour[file_id] == no_colour else self.quality_colour[file_id]
+        record["error_colour"] = None if self.error_colour[file_id] == no_colour else self.error_colour[file_id]
+        record["frame_hist"] = self.frame_hist.get(file_id)
+        record["scanned"] = bool(self.scanned[file_id])
+        return record
+
+    def updateFile(self, file_id, fields):
+        self.setFields(file_id, fields)
+        self.fileChanged(file_id)
+
+    def fileChanged(self, file_id):
+        row = self.position[file_id]
+        if row >= 0:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(TableHeaders) - 1))
+
+    def filesChanged(self, file_ids):
+        ''' notify views of changes to several files with a single dataChanged covering their rows '''
+        rows = [self.position[file_id] for file_id in file_ids if self.position[file_id] >= 0]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(TableHeaders) - 1))
+
+    def setKey(self, file_id, key):
+        self.keys[file_id] = key
+
+    def fileCount(self):
+        return len(self.names)
+
+    def idAt(self, row):
+        return self.order[row]
+
+    def rowOf(self, file_id):
+        return self.position[file_id]
+
+    def visibleIds(self):
+        return list(self.order)
+
+    def path(self, file_id):
+        return os.path.join(self.folders[self.folder_ids[file_id]], self.names[file_id])
+
+    def folder(self, file_id):
+        return self.folders[self.folder_ids[file_id]]
+
+    def key(self, file_id):
+        return self.keys[file_id]
+
+    def isScanned(self, file_id):
+        return bool(self.scanned[file_id])
+
+    def streamCount(self, file_id):
+        ''' number of audio streams in file, 0 if not known - see spct_parsers.formatAudioStreams '''
+        streams = self.text["streams"][file_id]
+        return streams.count("\n") + 1 if streams else 0
+
+    def frameHist(self, file_id):
+        return self.frame_hist.get(file_id)
+
+    def idsInFolder(self, folder):
+        folder_id = self.folder_index.get(folder)
+        if folder_id is None:
+            return []
+        return [file_id for file_id in range(len(self.names)) if self.folder_ids[file_id] == folder_id]
+
+    def idForPath(self, path):
+        if self.path_ids is None:
+            self.path_ids = {self.path(file_id): file_id for file_id in range(len(self.names))}
+        return self.path_ids.get(path)
@@ -1,34 +1,125 @@
 # -*- coding: utf-8 -*-
 
-import os,fnmatch,json,logging
+import os,fnmatch,functools,logging,struct,threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import time
 from PyQt5.QtCore import QRunnable
-from spct_utils import debug_log, runCmd, getTempFileName
-from spct_parsers import parse_mp3guessenc_output, parse_aucdtect_output, parse_mediainfo_output
+from spct_utils import debug_log, runProcess, getTempFileName
+from spct_parsers import parse_mp3guessenc_output, parse_aucdtect_output, parse_mediainfo_output, split_mediainfo_output, \
+    cutoff_song_info, ffprobePacketParser
 from spct_defs import *
-from spct_objects import infoobj,main_info,song_info_obj
+from spct_objects import infoobj,main_info,song_info_obj,discovery_info,cmd_result
+from spct_pipeline import pcmFanout, processConsumer
+from spct_spectrogram import spectrogramData, computeSpectrogram, spectrogramEngineAvailable, spectrogram_params, \
+    spectrumAccumulator
 from spct_cfg import app_dirs
+from spct_cache import fileKey, getResultCache
+from spct_native import scan_mp3, scan_flac, scan_wav, native_version, readFrameIndex, frameIndex
+from spct_tools import getToolRegistry, internal_tool_versions, formatToolVersions
+from spct_framestore import getFrameIndexStore
+from spct_scheduler import METADATA, DECODE, ANALYSIS
 
 def getScannerThread(i, filenameStr, mp3guessenc_bin, mediainfo_bin, fileinfo_dialog_update=None, cmd_timeout=300,debug_enabled=False,main_q=None,info_q=None):
     threads = set()
+    # the file info dialog shows mediainfo's text output, for the file list it's parsed so json is used if supported
+    if fileinfo_dialog_update is None and getToolRegistry().capable("mediainfo", "json"):
+        mediainfo_options = mediainfo_json_option
+    else:
+        mediainfo_options = "-"
     if fnmatch.fnmatch(filenameStr, "*.mp3"):
+        thread = None
         # use mp3guessenc if available
         if not mp3guessenc_bin == "":
-            threads.add(scanner_Thread(i, filenameStr, mp3guessenc_bin, "mp3guessenc", "-e", debug_enabled, info_q,
-                                    main_q, fileinfo_dialog_update, cmd_timeout))
+            thread = scanner_Thread(i, filenameStr, mp3guessenc_bin, "mp3guessenc", "-e", debug_enabled, info_q,
+                                    main_q, fileinfo_dialog_update, cmd_timeout)
         elif not mediainfo_bin == "":  # always use mediainfo
-            threads.add(scanner_Thread(i, filenameStr, mediainfo_bin, "mediainfo", "-", debug_enabled, info_q, main_q,
-                                    fileinfo_dialog_update, cmd_timeout))
+            thread = scanner_Thread(i, filenameStr, mediainfo_bin, "mediainfo", mediainfo_options, debug_enabled, info_q, main_q,
+                                    fileinfo_dialog_update, cmd_timeout)
+        if fileinfo_dialog_update is None:
+            # read the file directly, mp3guessenc is only needed to guess the encoder if it isn't in a lame tag
+            thread = nativeScanner_Thread(i, filenameStr, functools.partial(scan_mp3, require_encoder=not mp3guessenc_bin == ""),
+                                          main_q, thread)
+        if thread is not None:
+            threads.add(thread)
 
-    elif fnmatch.fnmatch(filenameStr, "*.flac") and not mediainfo_bin == "":
-        threads.add(scanner_Thread(i, filenameStr, mediainfo_bin, "mediainfo", "-", debug_enabled, info_q, main_q,
-                                fileinfo_dialog_update, cmd_timeout))
+    elif (fnmatch.fnmatch(filenameStr, "*.flac") or fnmatch.fnmatch(filenameStr, "*.wav")) and fileinfo_dialog_update is None:
+        # read the header directly, mediainfo is only run for files the native reader can't handle
+        thread = None
+        if not mediainfo_bin == "":
+            thread = scanner_Thread(i, filenameStr, mediainfo_bin, "mediainfo", mediainfo_options, debug_enabled, info_q,
+                                    main_q, fileinfo_dialog_update, cmd_timeout)
+        reader = scan_flac if fnmatch.fnmatch(filenameStr, "*.flac") else scan_wav
+        threads.add(nativeScanner_Thread(i, filenameStr, reader, main_q, thread))
     elif not mediainfo_bin == "":  # default for all files is mediainfo
-        threads.add(scanner_Thread(i, filenameStr, mediainfo_bin, "mediainfo", "-", debug_enabled, info_q, main_q,
+        threads.add(scanner_Thread(i, filenameStr, mediainfo_bin, "mediainfo", mediainfo_options, debug_enabled, info_q, main_q,
                                 fileinfo_dialog_update, cmd_timeout))
     return threads
 
 
+def getFileScanThreads(i, filenameStr, scanner_bins, cmd_timeout=300, debug_enabled=False, main_q=None, aucdtect_mode=None, scan_for_errors=True,
+                       cutoff_scan=False):
+    ''' all threads needed to scan a file for the file list - scanner_bins is dict from ToolRegistry.scannerBins
+        aucdtect_mode None disables aucdtect, cutoff_scan finds the lowpass frequency of lossless files '''
+    thread_list = []
+    threads = getScannerThread(i, filenameStr, scanner_bins["mp3guessenc"], scanner_bins["mediainfo"], None, cmd_timeout,
+                               debug_enabled, main_q, None)
+    for thread in threads:
+        if isinstance(thread, QRunnable):
+            thread_list.append(thread)
+        else:
+            debug_log("getScannerThread not QRunnable: {}".format(thread), logging.WARNING)
+
+    # if lossless audio also run aucdtect if enabled and available
+
+    aucdtect_bin = scanner_bins["aucdtect"]
+    flac_bin = scanner_bins["flac"]
+    decoder_cmd = None
+    if aucdtect_mode is not None and not aucdtect_bin == "":
+        decoder_cmd = getDecoderCmd(filenameStr, flac_bin, scanner_bins["ffmpeg"])
+    check_errors = fnmatch.fnmatch(filenameStr, "*.flac") and scan_for_errors and not flac_bin == ""
+    want_cutoff = (cutoff_scan and os.path.splitext(filenameStr)[1].lower() in LosslessFormats
+                   and spectrogramEngineAvailable())
+    if want_cutoff:
+        pipeline_decoder_cmd = getDecoderCmd(filenameStr, flac_bin, scanner_bins["ffmpeg"])
+        want_cutoff = pipeline_decoder_cmd is not None
+    if check_errors:
+        # flac reports decode errors while decoding to stdout the same as when testing
+        pipeline_decoder_cmd = [flac_bin, "-dc", filenameStr]
+    if want_cutoff or (check_errors and decoder_cmd is not None):
+        # decode once for every check that needs the audio
+        aucdtect_cmd = [aucdtect_bin, "-m{}".format(aucdtect_mode), "-"] if decoder_cmd is not None else None
+        thread_list.append(decodePipeline_Thread(i, filenameStr, pipeline_decoder_cmd, check_errors, aucdtect_cmd,
+                                                 debug_enabled, cmd_timeout, main_q, want_cutoff))
+        return thread_list
+    if decoder_cmd is not None:
+        thread_list.append(aucdtect_Thread(i, filenameStr, decoder_cmd, aucdtect_bin, "-m{}".format(aucdtect_mode),
+                                           debug_enabled, cmd_timeout, main_q))
+    if check_errors:
+        thread_list.append(errorCheck_Thread(i, filenameStr, flac_bin, "-t", debug_enabled, cmd_timeout, main_q,
+                                             True))
+    return thread_list
+
+
+def threadTaskCount(threads):
+    ''' number of results threads will post '''
+    return sum(getattr(thread, "task_count", 1) for thread in threads)
+
+
+def getDecoderCmd(filenameStr, flac_bin, ffmpeg_bin, allow_lossy=False):
+    ''' command that decodes file to wav on stdout - [] for wav files, which are read directly,
+        None if there is no decoder for the file. lossy files are only decoded if allow_lossy (for spectrograms) '''
+    ext = os.path.splitext(filenameStr)[1].lower()
+    if ext == ".wav":
+        return []
+    elif ext == ".flac" and not flac_bin == "":
+        return [flac_bin, "-dcs", filenameStr]
+    elif (allow_lossy or ext in LosslessFormats) and not ffmpeg_bin == "":
+        return [ffmpeg_bin, "-v", "error", "-i", filenameStr, "-vn", "-f", "wav", "-"]
+    return None
+
+
 class scanner_Thread(QRunnable):
+    task_class = METADATA
     def __init__(self,row,filenameStr,binary,scanner_name,options,debug_enabled,infodlg_q,main_q,fileinfo_dialog_update=None,cmd_timeout=300):
         super(scanner_Thread, self).__init__()
         self.row = row
@@ -47,11 +138,15 @@ class scanner_Thread(QRunnable):
         debug_log("scanner thread running for row {}, file: {}".format(self.row,self.filenameStr))
         
         if os.path.lexists(self.filenameStr): 
-            try:
-                output_str,output_err = runCmd([self.binary,self.options,self.filenameStr],self.cmd_timeout)
-            except SubprocessError as e:
-                debug_log("Exception {} in runCmd {} for file {}".format(e,self.binary,self.filenameStr),logging.ERROR)
+            result = runProcess([self.binary,self.options,self.filenameStr],self.cmd_timeout)
+            if self.options == mediainfo_json_option and not result.failed() and not result.stdout.strip():
+                # mediainfo older than 17.10 has no json output
+                debug_log("no json output from {}, using text output".format(self.binary),logging.WARNING)
+                result = runProcess([self.binary,"-",self.filenameStr],self.cmd_timeout)
+            if result.failed():
                 output_str = "Error running command {}".format(self.binary)
+            else:
+                output_str = result.stdout
         else:
             output_str = "Error: file {} not found".format(self.filenameStr) # handle the case where file has been deleted while in queue e.g. temp files or user deletion
                 
@@ -68,27 +163,147 @@ class scanner_Thread(QRunnable):
             else: # unknown
                 debug_log("scanner thread finished but scanner {} unknown".format(self.scanner_name),logging.WARNING)
                 return
+            song_info.tool = (self.scanner_name, getToolRegistry().version(self.scanner_name))
             debug_log("{} scanner thread finished - row {}, result: {}".format(self.scanner_name,self.row,song_info.encoder))
     
             debug_log("{} scanner thread posting to queue - row {}".format(self.scanner_name,self.row))
         else:
             debug_log("{} scanner thread posting to queue with cmd error - row {}".format(self.scanner_name,self.row),logging.WARNING)
             song_info = song_info_obj()
-            song_info.result_type = song_info_obj.SCANNER_OUTPUT
             song_info.cmd_error = True
             debug_log("{} scanner thread finished with cmd error - row {}, result: {}".format(self.scanner_name,self.row,output_str),logging.WARNING)
             
         maininfo_obj = main_info(main_info.SCANNER_OUTPUT,output_str,self.row,song_info)
         self.main_q.put(maininfo_obj)
                 
+class nativeScanner_Thread(QRunnable):
+    ''' scan a file with a reader from spct_native instead of running a scanner
+        if the reader fails or returns None the fallback scanner_Thread is run instead '''
+    task_class = METADATA
+    def __init__(self,row,filenameStr,reader,main_q,fallback=None):
+        super(nativeScanner_Thread, self).__init__()
+        self.row = row
+        self.filenameStr = filenameStr
+        self.reader = reader
+        self.main_q = main_q
+        self.fallback = fallback
+
+    def run(self):
+        debug_log("native scanner thread running for row {}, file: {}".format(self.row,self.filenameStr))
+        try:
+            song_info = self.reader(self.filenameStr)
+        except (OSError, ValueError, IndexError, struct.error) as e:
+            debug_log("native scanner failed for file {}: {}".format(self.filenameStr,e),logging.WARNING)
+            song_info = None
+        if song_info is None:
+            if self.fallback is not None:
+                self.fallback.main_q = self.main_q
+                self.fallback.run()
+                return
+            song_info = song_info_obj()
+            song_info.cmd_error = True
+        else:
+            song_info.tool = ("native", native_version)
+        self.main_q.put(main_info(main_info.SCANNER_OUTPUT,"",self.row,song_info))
+
+class mediainfoBatchSizer(object):
+    ''' picks the number of files per mediainfo run - aims for runs of about target_time seconds,
+        halving the size whenever a batch fails or times out '''
+    def __init__(self, max_batch=16, target_time=2.0):
+        self.lock = threading.Lock()
+        self.max_batch = max_batch
+        self.target_time = target_time
+        self.batch_size = max_batch
+
+    def size(self):
+        with self.lock:
+            return max(1, min(self.batch_size, self.max_batch))
+
+    def record(self, files, elapsed, success):
+        with self.lock:
+            if not success:
+                self.batch_size = max(1, self.batch_size // 2)
+                return
+            try:
+                wanted = int(self.target_time / (elapsed / files))
+            except ZeroDivisionError:
+                wanted = self.max_batch
+            self.batch_size = max(1, min(self.max_batch, (self.batch_size + wanted) // 2))
+
+mediainfo_batch_sizer = mediainfoBatchSizer()
+
+def batchMediaInfoThreads(threads, max_batch):
+    ''' replace the mediainfo scanner_Threads in list with mediainfoBatch_Threads running up to max_batch files each '''
+    if max_batch < 2:
+        return list(threads)
+    mediainfo_threads = [thread for thread in threads if isinstance(thread, scanner_Thread) and
+                         thread.scanner_name == "mediainfo" and thread.fileinfo_dialog_update is None]
+    if len(mediainfo_threads) < 2:
+        return list(threads)
+    mediainfo_batch_sizer.max_batch = max_batch
+    batch_size = mediainfo_batch_sizer.size()
+    batched = set(mediainfo_threads)
+    thread_list = [mediainfoBatch_Thread(mediainfo_threads[i:i + batch_size])
+                   for i in range(0, len(mediainfo_threads), batch_size)]
+    thread_list.extend(thread for thread in threads if thread not in batched)
+    return thread_list
+
+class mediainfoBatch_Thread(QRunnable):
+    ''' run mediainfo once for several files and post a result for each, as their scanner_Threads would
+        files whose name isn't in the output (or all of them if the run fails) fall back to their own scanner_Thread '''
+    task_class = METADATA
+    def __init__(self,threads):
+        super(mediainfoBatch_Thread, self).__init__()
+        self.threads = threads
+        self.task_count = len(threads) # one result per file
+
+    def run(self):
+        pending = list(self.threads)
+        while pending: # batch size may have been reduced by failures since this thread was queued
+            batch_size = mediainfo_batch_sizer.size()
+            self.runBatch(pending[:batch_size])
+            pending = pending[batch_size:]
+
+    def runBatch(self,threads):
+        if len(threads) == 1:
+            threads[0].run()
+            return
+        binary = threads[0].binary
+        cmd_timeout = threads[0].cmd_timeout
+        start_time = time()
+        debug_log("mediainfo batch thread running for {} files".format(len(threads)))
+        options = [threads[0].options] if threads[0].options == mediainfo_json_option else []
+        result = runProcess([binary] + options + [thread.filenameStr for thread in threads],cmd_timeout)
+        output_str = "" if result.failed() else result.stdout
+        reports = split_mediainfo_output(output_str)
+        # reports are only paired with files by name - mediainfo may skip a file, so output order proves nothing
+        reports_by_name = {os.path.normcase(os.path.normpath(name)): report for name, report in reports if name}
+
+        failed = []
+        for thread in threads:
+            report = reports_by_name.get(os.path.normcase(os.path.normpath(thread.filenameStr)))
+            if report is None:
+                failed.append(thread)
+                continue
+            song_info = parse_mediainfo_output(report)
+            song_info.tool = ("mediainfo", getToolRegistry().version("mediainfo"))
+            thread.main_q.put(main_info(main_info.SCANNER_OUTPUT,report,thread.row,song_info))
+        mediainfo_batch_sizer.record(len(threads),time() - start_time,not failed)
+
+        if failed:
+            debug_log("mediainfo batch: {} of {} files not in output, scanning separately".format(len(failed),len(threads)),logging.WARNING)
+        for thread in failed:
+            thread.run()
+
 class aucdtect_Thread(QRunnable):
-    ''' run aucdtect on a file and post results to queue '''
-    def __init__(self,row,filenameStr,decoder_bin,decoder_options,aucdtect_bin,aucdtect_options,debug_enabled,cmd_timeout,main_q):
+    ''' run aucdtect on a file and post results to queue
+        files other than wav are decoded by decoder_cmd and streamed to aucdtect through a pipe '''
+    task_class = ANALYSIS
+    def __init__(self,row,filenameStr,decoder_cmd,aucdtect_bin,aucdtect_options,debug_enabled,cmd_timeout,main_q):
         super(aucdtect_Thread, self).__init__()
         self.row = row
         self.filenameStr = filenameStr
-        self.decoder_bin = decoder_bin
-        self.decoder_options = decoder_options
+        self.decoder_cmd = decoder_cmd
         self.aucdtect_bin = aucdtect_bin
         self.aucdtect_options = aucdtect_options
         self.debug_enabled = debug_enabled
@@ -96,34 +311,24 @@ class aucdtect_Thread(QRunnable):
         self.main_q = main_q
 
     def run(self):
-        temp_file = ""
         debug_log("aucdtect thread started for row {}, file: {}".format(self.row,self.filenameStr))
         if os.path.lexists(self.filenameStr): 
-            try:
-                temp_file = getTempFileName()
-                if not self.decoder_bin == "": # need to decode to wav
-                    decoder_output,output_err = runCmd([self.decoder_bin,self.decoder_options,self.filenameStr,"-o",temp_file],self.cmd_timeout)
-                    output_str,output_err = runCmd([self.aucdtect_bin,self.aucdtect_options,temp_file],self.cmd_timeout)
-                else:
-                    output_str,output_err = runCmd([self.aucdtect_bin,self.aucdtect_options,self.filenameStr],self.cmd_timeout)
-            except SubprocessError as e:
-                debug_log("Exception {} in runCmd {} for file {}".format(e,self.aucdtect_bin,self.filenameStr),logging.ERROR)
-                output_str = "Error"
+            if self.decoder_cmd: # aucdtect reads the decoded wav from stdin
+                result = runProcess([self.aucdtect_bin,self.aucdtect_options,"-"],self.cmd_timeout,source_cmd=self.decoder_cmd)
+            else:
+                result = runProcess([self.aucdtect_bin,self.aucdtect_options,self.filenameStr],self.cmd_timeout)
+            output_str = result.stdout if result.succeeded() else "Error" # or the verdict may be on part of the file
         else:
             output_str = "Error"
     
-        try:
-            os.remove(temp_file)
-        except OSError:
-            pass
-        
         if not (output_str == "Error"):
             song_info = parse_aucdtect_output(output_str)
+            song_info.tool = ("aucdtect", getToolRegistry().version("aucdtect"))
             debug_log("aucdtect thread finished - row {}, result: {}".format(self.row,song_info.quality))
     
         else:
             song_info = song_info_obj()
-            song_info.result_type = song_info_obj.SCANNER_OUTPUT
+            song_info.result_type = song_info_obj.AUCDTECT
             song_info.cmd_error = True
             debug_log("aucdtect thread finished with cmd error - row {}, result: {}".format(self.row,output_str),logging.WARNING)
 
@@ -132,6 +337,7 @@ class aucdtect_Thread(QRunnable):
 
 class errorCheck_Thread(QRunnable):
     ''' test file for decode errors and post results to queue '''
+    task_class = DECODE
     def __init__(self,row,filenameStr,decoder_bin,decoder_options,debug_enabled,cmd_timeout,main_q,use_stderr=False):
         super(errorCheck_Thread, self).__init__()
         self.row = row
@@ -147,14 +353,13 @@ class errorCheck_Thread(QRunnable):
         try:
             debug_log("error check thread started for row {}, file: {}".format(self.row,self.filenameStr))
             if os.path.lexists(self.filenameStr): 
-                try:
-                    cmd = [self.decoder_bin,self.decoder_options,self.filenameStr]
-                    debug_log("cmd: {}".format(cmd))
-                    output_str,output_err = runCmd(cmd,self.cmd_timeout)
-                except SubprocessError as e:
-                    debug_log("Exception {} in runCmd {} for file {}".format(e,self.decoder_bin,self.filenameStr),logging.ERROR)
+                result = runProcess([self.decoder_bin,self.decoder_options,self.filenameStr],self.cmd_timeout)
+                if result.failed():
                     output_str = "Error"
                     output_err = "Error"
+                else:
+                    output_str = result.stdout
+                    output_err = result.stderr
             else:
                 output_str = "Error"
                 output_err = "Error"
@@ -183,106 +388,130 @@ class errorCheck_Thread(QRunnable):
         except Exception as e:
             debug_log(e,logging.ERROR)
             
+class decodePipeline_Thread(QRunnable):
+    ''' decode a file once and feed the audio to aucdtect as it's decoded, instead of decoding it again for each check
+        posts a result for the decoder's error check if check_errors, one for aucdtect if aucdtect_cmd is given
+        and one for the lowpass frequency if detect_cutoff '''
+    task_class = ANALYSIS
+    def __init__(self,row,filenameStr,decoder_cmd,check_errors,aucdtect_cmd,debug_enabled,cmd_timeout,main_q,detect_cutoff=False):
+        super(decodePipeline_Thread, self).__init__()
+        self.row = row
+        self.filenameStr = filenameStr
+        self.decoder_cmd = decoder_cmd
+        self.check_errors = check_errors
+        self.aucdtect_cmd = aucdtect_cmd
+        self.debug_enabled = debug_enabled
+        self.cmd_timeout = cmd_timeout
+        self.main_q = main_q
+        self.detect_cutoff = detect_cutoff
+        self.task_count = int(check_errors) + int(aucdtect_cmd is not None) + int(detect_cutoff) # one result per check
+
+    def run(self):
+        debug_log("decode pipeline thread started for row {}, file: {}".format(self.row,self.filenameStr))
+        aucdtect = processConsumer(self.aucdtect_cmd) if self.aucdtect_cmd is not None else None
+        spectrum = spectrumAccumulator() if self.detect_cutoff else None
+        consumers = [consumer for consumer in (aucdtect,spectrum) if consumer is not None]
+        if os.path.lexists(self.filenameStr):
+            decoder_result = pcmFanout(self.decoder_cmd,consumers,self.filenameStr).run(self.cmd_timeout)
+        else:
+            decoder_result = cmd_result(self.decoder_cmd)
+            decoder_result.error = "file not found"
+            debug_log("decode pipeline thread file: {} does not exist".format(self.filenameStr),logging.WARNING)
+
+        if self.check_errors:
+            song_info = song_info_obj()
+            song_info.result_type = song_info_obj.ERROR_CHECK
+            if decoder_result.failed():
+                song_info.cmd_error = True
+            elif not decoder_result.returncode == 0 or "ERROR while decoding" in decoder_result.stderr:
+                song_info.file_error = True
+                debug_log("decode pipeline found errors - row {}, result: {}".format(self.row,decoder_result.stderr),logging.WARNING)
+            self.main_q.put(main_info(main_info.ERROR_CHECK,decoder_result.stderr,self.row,song_info))
+
+        if aucdtect is not None:
+            if not aucdtect.result.succeeded() or not decoder_result.succeeded(): # verdict on part of the file
+                song_info = song_info_obj()
+                song_info.result_type = song_info_obj.AUCDTECT
+                song_info.cmd_error = True
+                debug_log("decode pipeline aucdtect failed - row {}".format(self.row),logging.WARNING)
+            else:
+                song_info = parse_aucdtect_output(aucdtect.result.stdout)
+                song_info.tool = ("aucdtect", getToolRegistry().version("aucdtect"))
+            self.main_q.put(main_info(main_info.SCANNER_OUTPUT,aucdtect.result.stdout,self.row,song_info))
+
+        if spectrum is not None: # after aucdtect, so the worse of the two quality results is kept
+            if not decoder_result.succeeded():
+                song_info = song_info_obj()
+                song_info.result_type = song_info_obj.CUTOFF
+                song_info.cmd_error = True
+            else:
+                song_info = cutoff_song_info(spectrum.cutoff())
+                song_info.tool = ("cutoff", internal_tool_versions["cutoff"])
+                debug_log("decode pipeline cutoff - row {}: {}".format(self.row,song_info.cutoff))
+            self.main_q.put(main_info(main_info.SCANNER_OUTPUT,"",self.row,song_info))
+        debug_log("decode pipeline thread finished - row {}".format(self.row))
+
 class makeBitGraphThread(QRunnable):
-    ''' generate bitrate graph using ffprobe/avprobe 
-        and plot with gnuplot '''
+    ''' read the bitrate of each frame for the bitrate graph - from the file's own frame headers if spct_native can
+        read them, otherwise with ffprobe. posts a spct_native.frameIndex, plotted by spct_bitgraph.
+        the index is kept in the frame index store so it's only read once per file '''
     
-    def __init__(self,fn,grid,ffprobe_bin,cmd_timeout,infodlg_q,gnuplot_bin):
+    def __init__(self,fn,grid,ffprobe_bin,cmd_timeout,infodlg_q,usecache=True):
         super(makeBitGraphThread, self).__init__()
         self.fn = fn
         self.grid = grid
         self.ffprobe_bin = ffprobe_bin
-        self.gnuplot_bin = gnuplot_bin
         self.cmd_timeout = cmd_timeout
         self.infodlg_q = infodlg_q
+        self.usecache = usecache
+
+    def readIndex(self):
+        ''' returns (frameIndex, tools string of the reader) or None '''
+        index = readFrameIndex(self.fn)
+        if index is not None:
+            return index, formatToolVersions({"native": native_version})
+        if not self.ffprobe_bin == "":
+            debug_log("Running ffprobe to read frame bitrates for file {}".format(self.fn))
+            index = self.ffprobeFrameIndex()
+            if index is not None:
+                return index, formatToolVersions({"ffprobe": getToolRegistry().version("ffprobe")})
+        return None
 
     def run(self):
-        output_str = ""
-        try:
-            output_str,output_err = runCmd([self.ffprobe_bin,"-show_packets","-of","json",self.fn],self.cmd_timeout)
-        except SubprocessError as e:
-            debug_log(e,logging.ERROR)
-            return None
-    
-        x_list = []
-        y_list = []
-    
-        try:
-            json_packet_data = json.loads(output_str)
-            packets = json_packet_data["packets"]
-        except Exception as e:
-            debug_log("Exception in makeBitGraphThread: {}".format(e),logging.ERROR)
-            return None
-    
-        for dictionary in packets:
-            if not dictionary["codec_type"] == "audio":
-                continue
-            try:
-                x = float(dictionary["pts_time"]) # time
-            except (KeyError, ValueError, OverflowError) as e:
-                x = 0
-            try:
-                t = float(dictionary["duration_time"]) # duration
-            except (KeyError, ValueError, OverflowError) as e:
-                t = 0
+        index = key = None
+        if self.usecache:
             try:
-                sz = float(dictionary["size"]) # size in bytes
-            except (KeyError, ValueError, OverflowError) as e:
-                sz = 0
-            try:
-                y = round(((sz*8)/1024)/t)
-            except (ZeroDivisionError, ValueError, OverflowError) as e:
-                y = 0
-        
-            if y > 0:
-                y_list.append(y) # bitrate
-                x_list.append(round(x,3))
-
-        assert len(x_list) == len(y_list)
-                
-        datfile = getTempFileName() + ".dat"
-        with open(datfile, "w") as tf: # datfile tho
-           for i in range(0,len(x_list)):
-               tf.write(str(x_list[i]) + " " + str(y_list[i]) + "\n") 
-               
-        cmdfile_template = app_dirs.user_config_dir + "/bitgraph.plot"
-        pngfile = getTempFileName() + ".png"
-        if not os.path.lexists(cmdfile_template):
-            with open(cmdfile_template, "w") as cft:
-                cft.write(str("set style line 1 lc rgb '#0060ad' lt 1 lw 2 pt 0 ps 1.5   # --- blue\n"))
-                cft.write(str("set title \"Bitrate vs time\"\n"))
-                cft.write(str("set xlabel \"Time (s)\"\n"))
-                cft.write(str("set ylabel \"Bitrate (KiB)\"\n"))
-                cft.write(str("set terminal png size 800,600 enhanced font \"Helvetica,20\"\nset output '{pngfile}'\n"))
-                cft.write(str("plot '{datfile}' notitle with lines\n"))
+                key = fileKey(os.stat(self.fn))
+            except OSError:
+                pass
+        if key is not None:
+            stored = getFrameIndexStore().lookup(key)
+            if stored is not None and getToolRegistry().isCurrent(stored[1]):
+                index = stored[0]
+        if index is None:
+            read = self.readIndex()
+            if read is not None:
+                index = read[0]
+                if key is not None and len(index):
+                    getFrameIndexStore().store(key,index,read[1])
+        if index is None or not len(index):
+            debug_log("makeBitGraphThread: no frame bitrates for file {}".format(self.fn),logging.WARNING)
+            return None
+        self.infodlg_q.put(infoobj(infoobj.BITGRAPH,index,self.grid,self.fn))
 
-        cmdfile = getTempFileName() + ".plot"
-        with open(cmdfile, "w") as cf:
-            with open(cmdfile_template, "r") as cft:
-                for line in cft:
-                    if "{datfile}" in line:
-                        cf.write(line.replace("{datfile}",datfile))
-                    elif "{pngfile}" in line:
-                        cf.write(line.replace("{pngfile}",pngfile))
-                    else:
-                        cf.write(line)
-                    
-        output_str = ""
-        try:
-            debug_log("running {} with cmdfile {}".format(self.gnuplot_bin,cmdfile))
-            output_str,output_err = runCmd([self.gnuplot_bin,"{}".format(cmdfile)],self.cmd_timeout)
-        except SubprocessError as e:
-            debug_log(e,logging.ERROR)
+    def ffprobeFrameIndex(self):
+        ''' only the first audio stream's packet times, durations and sizes are output, and parsed as they arrive '''
+        parser = ffprobePacketParser()
+        result = runProcess([self.ffprobe_bin,"-v","error","-select_streams","a:0","-show_entries",
+                             "packet=pts_time,duration_time,size","-of","csv=p=0",self.fn],self.cmd_timeout,
+                            output_callback=parser.feed)
+        if result.failed():
             return None
-            
-        try:
-            os.remove(cmdfile)
-            os.remove(datfile)
-        except OSError:
-            pass        
-            
-        info = infoobj(infoobj.BITGRAPH,pngfile,self.grid,self.fn)
-        self.infodlg_q.put(info)
+        parser.finish()
+        if parser.bad_lines:
+            debug_log("makeBitGraphThread: {} unreadable ffprobe lines for file {}".format(parser.bad_lines,self.fn),
+                      logging.WARNING)
+        return frameIndex(parser.times,parser.bitrates,parser.duration)
 
 class makeBitHistThread(QRunnable):
     ''' plot bitrate histogram with gnuplot '''
@@ -328,27 +557,26 @@ class makeBitHistThread(QRunnable):
                     else:
                         cf.write(line)
                
-        output_str = ""
-        try:
-            debug_log("running {} with cmdfile {}".format(self.gnuplot_bin,cmdfile))
-            output_str,output_err = runCmd([self.gnuplot_bin,"{}".format(cmdfile)],self.cmd_timeout)
-            debug_log(output_str)
-            debug_log(output_err)
-        except SubprocessError as e:
-            debug_log(e,logging.ERROR)
-            return None
+        debug_log("running {} with cmdfile {}".format(self.gnuplot_bin,cmdfile))
+        result = runProcess([self.gnuplot_bin,"{}".format(cmdfile)],self.cmd_timeout)
+        debug_log(result.stdout)
+        debug_log(result.stderr)
             
         try:
             os.remove(cmdfile)
             os.remove(datfile)
         except OSError:
             pass        
+        if result.failed():
+            return None
             
         info = infoobj(infoobj.BITHIST,pngfile,self.grid,self.fn)
         self.infodlg_q.put(info)
         
 class makeSpectrogramThread(QRunnable):
-    def __init__(self,fn,sox_bin,temp_file,palette,grid,cmd_timeout,infodlg_q):
+    ''' calculate spectrogram in process with spct_spectrogram if numpy is available and the file can be decoded,
+        else run sox. spectral data is kept in the result cache so it's only calculated once per file '''
+    def __init__(self,fn,sox_bin,temp_file,palette,grid,cmd_timeout,infodlg_q,decoder_cmd=None,usecache=True):
         super(makeSpectrogramThread, self).__init__()
         self.fn = fn
         self.sox_bin = sox_bin
@@ -357,16 +585,181 @@ class makeSpectrogramThread(QRunnable):
         self.grid = grid
         self.cmd_timeout = cmd_timeout
         self.infodlg_q = infodlg_q
+        self.decoder_cmd = decoder_cmd
+        self.usecache = usecache
 
-    def run(self):
+    def makeImage(self):
+        ''' spectrogram as QImage, None if it can't be calculated here '''
         try:
-            sox_output,output_err = runCmd([self.sox_bin,self.fn,"-n","spectrogram","-l","-p{}".format(self.palette),"-c ","-o",self.temp_file],self.cmd_timeout)
-        except SubprocessError as e:
-            debug_log(e,logging.ERROR)
+            key = fileKey(os.stat(self.fn))
+        except OSError:
+            return None
+        spectrogram = None
+        if self.usecache:
+            cached = getResultCache().lookupSpectrogram(key,spectrogram_params)
+            if cached is not None:
+                spectrogram = spectrogramData.unpack(*cached)
+        if spectrogram is None:
+            try:
+                spectrogram = computeSpectrogram(self.fn,self.decoder_cmd,self.cmd_timeout)
+            except (OSError, ValueError) as e:
+                debug_log("spectrogram failed for file {}: {}".format(self.fn,e),logging.WARNING)
+                return None
+            if spectrogram is None:
+                return None
+            if self.usecache:
+                getResultCache().storeSpectrogram(key,self.fn,spectrogram_params,spectrogram.sample_rate,
+                                                  spectrogram.width,spectrogram.height,spectrogram.pack())
+        return spectrogram.toImage(self.palette)
+
+    def run(self):
+        if spectrogramEngineAvailable() and self.decoder_cmd is not None:
+            image = self.makeImage()
+            if image is not None:
+                self.infodlg_q.put(infoobj(infoobj.SPECTROGRAM,image,self.grid,self.fn))
+                return
+            debug_log("no spectral data for file {}, using sox".format(self.fn),logging.WARNING)
+        result = runProcess([self.sox_bin,self.fn,"-n","spectrogram","-l","-p{}".format(self.palette),"-c ","-o",self.temp_file],self.cmd_timeout)
+        if result.failed():
             self.temp_file = ""
         if not self.temp_file == "":
             try:
                 info = infoobj(infoobj.SPECTROGRAM,self.temp_file,self.grid,self.fn)
                 self.infodlg_q.put(info) # Timer watches this queue and updates gui
             except Exception as e:
-                debug_log(e,logging.ERROR)               
+                debug_log(e,logging.ERROR)
+
+class fileDiscovery_Thread(QRunnable):
+    ''' find files matching filemask under directories using os.scandir
+        several directories are read concurrently and files are posted to queue in batches
+        if dir_index (ResultCache) is given, directories whose mtime is unchanged use the stored listing instead of
+        scandir - files are still stat'ed, as a file changed in place doesn't change its directory's mtime '''
+    def __init__(self,directories,filemask_regex,discovery_q,followsymlinks=False,recursedirectories=True,walkers=8,batch_size=500,dir_index=None):
+        super(fileDiscovery_Thread, self).__init__()
+        self.directories = directories
+        self.filemask_regex = filemask_regex
+        self.discovery_q = discovery_q
+        self.followsymlinks = followsymlinks
+        self.recursedirectories = recursedirectories
+        self.walkers = walkers
+        self.batch_size = batch_size
+        self.dir_index = dir_index
+        self.dir_updates = []
+        self.cancelled = False
+        self.visited = set()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def readDir(self,directory):
+        ''' list directory in ResultCache.lookupDir format, and stat of files matching filemask by name '''
+        listing = []
+        stats = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        listing.append([entry.name,"d"])
+                    elif entry.is_symlink() and entry.is_dir():
+                        listing.append([entry.name,"l"])
+                    elif entry.is_file():
+                        if self.filemask_regex.search(entry.name) is not None:
+                            if os.name == 'nt': # DirEntry.stat() has no inode number on windows
+                                st = os.stat(entry.path)
+                            else:
+                                st = entry.stat()
+                            stats[entry.name] = st
+                            listing.append([entry.name,"f"])
+                        else:
+                            listing.append([entry.name,"o"]) # other file, not stat'ed
+                except OSError as e:
+                    debug_log("fileDiscovery_Thread: error reading {}: {}".format(entry.path,e),logging.WARNING)
+        return listing,stats
+
+    def scanDir(self,directory):
+        ''' return files matching filemask and subdirectories of directory '''
+        files = []
+        subdirs = []
+        if self.cancelled:
+            return files,subdirs
+        try:
+            listing = None
+            stats = {}
+            if self.dir_index is not None:
+                dir_mtime = os.stat(directory).st_mtime_ns # read before listing so changes during scandir aren't missed
+                stored = self.dir_index.lookupDir(directory)
+                if stored is not None and stored[0] == dir_mtime:
+                    listing = stored[1]
+            if listing is None:
+                listing,stats = self.readDir(directory)
+                if self.dir_index is not None:
+                    self.dir_updates.append((directory,dir_mtime,listing))
+        except OSError as e:
+            debug_log("fileDiscovery_Thread: error reading directory {}: {}".format(directory,e),logging.WARNING)
+            return files,subdirs
+
+        for entry in listing:
+            name,kind = entry[0],entry[1]
+            if kind == "d" or (kind == "l" and self.followsymlinks):
+                subdirs.append(os.path.join(directory,name))
+            elif kind in ("f","o") and self.filemask_regex.search(name) is not None:
+                st = stats.get(name)
+                if st is None: # stored listing, or filemask changed since listing was stored
+                    try:
+                        st = os.stat(os.path.join(directory,name))
+                    except OSError:
+                        continue
+                files.append((name,directory,st))
+        files.sort(key=lambda f: f[0])
+        return files,subdirs
+
+    def firstVisit(self,directory):
+        ''' guard against symlink loops when following symlinks '''
+        if not self.followsymlinks:
+            return True
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return False
+        if (st.st_dev,st.st_ino) in self.visited:
+            return False
+        self.visited.add((st.st_dev,st.st_ino))
+        return True
+
+    def run(self):
+        start_time = time()
+        count = 0
+        batch = []
+        last_post = time()
+        debug_log("file discovery started for {}".format(self.directories))
+        try:
+            with ThreadPoolExecutor(max_workers=self.walkers) as executor:
+                pending = set(executor.submit(self.scanDir,d) for d in self.directories if self.firstVisit(d))
+                while pending and not self.cancelled:
+                    done,pending = wait(pending,return_when=FIRST_COMPLETED)
+                    for future in done:
+                        files,subdirs = future.result()
+                        batch.extend(files)
+                        if self.recursedirectories:
+                            for subdir in subdirs:
+                                if self.firstVisit(subdir):
+                                    pending.add(executor.submit(self.scanDir,subdir))
+                    if len(batch) >= self.batch_size or (batch and time() - last_post > 0.2):
+                        count += len(batch)
+                        self.discovery_q.put(discovery_info(discovery_info.FILES,batch,count,time() - start_time))
+                        batch = []
+                        last_post = time()
+                for future in pending:
+                    future.cancel()
+            if batch and not self.cancelled:
+                count += len(batch)
+                self.discovery_q.put(discovery_info(discovery_info.FILES,batch,count,time() - start_time))
+        except Exception as e:
+            debug_log("Exception in fileDiscovery_Thread: {}".format(e),logging.ERROR)
+        if self.dir_updates:
+            try:
+                self.dir_index.storeDirs(self.dir_updates)
+            except Exception as e:
+                debug_log("Exception storing directory index: {}".format(e),logging.ERROR)
+        debug_log("file discovery finished - {} files in {:.1f}s".format(count,time() - start_time))
+        self.discovery_q.put(discovery_info(discovery_info.FINISHED,None,count,time() - start_time))
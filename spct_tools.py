@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import re
+import threading
+
+import spct_cfg as cfg
+from spct_utils import debug_log, runProcess, findGuessEncBin, findMediaInfoBin, findFlacBin, findauCDtectBin, \
+    findSoxBin, findGnuPlotBin, findffprobeBin, findffmpegBin
+
+# name -> (function returning configured path, arguments that make the tool print its version, version regex)
+# stdout and stderr are both searched, tools without a version option print it in their usage text
+tool_definitions = {
+    "mediainfo": (findMediaInfoBin, ["--Version"], r"v(\d+(?:\.\d+)+)"),
+    "mp3guessenc": (findGuessEncBin, [], r"mp3guessenc\D*?(\d+(?:\.\d+)+\w*)"),
+    "flac": (findFlacBin, ["--version"], r"flac (\d+(?:\.\d+)+)"),
+    "aucdtect": (findauCDtectBin, [], r"version (\d+(?:\.\d+)+)"),
+    "sox": (findSoxBin, ["--version"], r"v(\d+(?:\.\d+)+)"),
+    "gnuplot": (findGnuPlotBin, ["--version"], r"gnuplot (\d+(?:\.\d+)+(?: patchlevel \w+)?)"),
+    "ffprobe": (findffprobeBin, ["-version"], r"version (\S+)"),
+    "ffmpeg": (findffmpegBin, ["-version"], r"version (\S+)"),
+}
+
+# versions of the readers and analysers in Specton itself, stored with their results like external tool versions
+# increase when one changes so cached results from it are rescanned
+internal_tool_versions = {"native": "1", "cutoff": "1"}
+
+# tools used to scan files for the file list - the keys of ToolRegistry.scannerBins
+scanner_tool_names = ("mp3guessenc", "mediainfo", "aucdtect", "flac", "ffmpeg")
+
+version_probe_timeout = 10
+
+
+def versionTuple(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+
+def toolCapabilities(name, version):
+    ''' optional features of a tool version - unknown versions are assumed to have them '''
+    capabilities = set()
+    if name == "mediainfo" and (not version or versionTuple(version) >= (17, 10)):
+        capabilities.add("json")  # --Output=JSON
+    return capabilities
+
+
+def parseToolVersions(tools):
+    ''' "mediainfo=21.09;native=1" as stored in the result cache -> dict of tool name -> version '''
+    if not tools:
+        return {}
+    return dict(item.split("=", 1) for item in tools.split(";") if "=" in item)
+
+
+def formatToolVersions(tool_versions):
+    return ";".join("{}={}".format(name, version) for name, version in sorted(tool_versions.items()))
+
+
+class toolInfo(object):
+
+    def __init__(self, name, path="", version=""):
+        self.name = name
+        self.path = path  # "" if not installed
+        self.version = version  # "" if unknown, None until probed
+        self.identity = None  # [size, mtime_ns] of the binary, stored with its version
+        self.capabilities = set()
+
+
+class ToolRegistry(object):
+    ''' paths, versions and capabilities of the external tools
+        paths are resolved once - call refresh() after the tool paths are changed.
+        versions are cached in version_cache_path by binary path, size and mtime so tools are only run to
+        find their version when they are installed or upgraded. uncached versions are probed in the background,
+        version() waits for the probe, isCurrent() and capable() don't '''
+
+    def __init__(self, version_cache_path):
+        self.version_cache_path = version_cache_path
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()  # probes, and the version cache file
+        self.tools = {}
+        self.refresh()
+
+    def loadVersionCache(self):
+        try:
+            with open(self.version_cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def saveVersionCache(self, version_cache):
+        try:
+            os.makedirs(os.path.dirname(self.version_cache_path), exist_ok=True)
+            with open(self.version_cache_path, "w") as f:
+                json.dump(version_cache, f, indent=1)
+        except OSError as e:
+            debug_log("Could not save tool versions: {}".format(e), logging.WARNING)
+
+    @staticmethod
+    def probeVersion(path, version_args, version_regex):
+        result = runProcess([path] + version_args, version_probe_timeout, output_limit=65536)
+        search = re.search(version_regex, result.stdout + result.stderr)
+        if search is None:
+            debug_log("Could not find version of {}".format(path), logging.WARNING)
+            return ""
+        return search.group(1)
+
+    def refresh(self):
+        ''' resolve tool paths and read cached versions - doesn't run any tool, so it can be called from the gui '''
+        version_cache = self.loadVersionCache()
+        tools = {}
+        for name, (find_bin, version_args, version_regex) in tool_definitions.items():
+            info = toolInfo(name)
+            path = find_bin()
+            if path and os.path.exists(path):
+                info.path = path
+                try:
+                    st = os.stat(path)
+                    info.identity = [st.st_size, st.st_mtime_ns]
+                except OSError:
+                    pass
+                cached = version_cache.get(path)
+                if cached is not None and cached[:2] == info.identity:
+                    info.version = cached[2]
+                else:
+                    info.version = None
+                info.capabilities = toolCapabilities(name, info.version)
+            tools[name] = info
+        with self.lock:
+            self.tools = tools
+        pending = [info for info in tools.values() if info.version is None]
+        if pending:
+            threading.Thread(target=self.probeVersions, args=(pending,), daemon=True).start()
+        debug_log("Tools: {}".format(", ".join("{} {} ({})".format(info.name, info.version or "?", info.path)
+                                               for info in tools.values() if info.path)))
+
+    def probeVersions(self, infos):
+        for info in infos:
+            self.probe(info)
+
+    def probe(self, info):
+        ''' find version of tool if not yet known, and add it to the version cache '''
+        with self.probe_lock:
+            if info.version is not None:
+                return
+            find_bin, version_args, version_regex = tool_definitions[info.name]
+            version = self.probeVersion(info.path, version_args, version_regex)
+            info.capabilities = toolCapabilities(info.name, version)
+            info.version = version
+            debug_log("Tool version: {} {} ({})".format(info.name, version, info.path))
+            if info.identity is not None:
+                version_cache = self.loadVersionCache()
+                version_cache[info.path] = info.identity + [version]
+                self.saveVersionCache(version_cache)
+
+    def tool(self, name):
+        with self.lock:
+            return self.tools.get(name) or toolInfo(name)
+
+    def path(self, name):
+        return self.tool(name).path
+
+    def version(self, name):
+        ''' version of tool, "" if unknown - waits for the version to be probed, so not for the gui thread '''
+        info = self.tool(name)
+        if info.version is None:
+            self.probe(info)
+        return info.version
+
+    def capable(self, name, capability):
+        return capability in self.tool(name).capabilities
+
+    def scannerBins(self):
+        ''' paths of the scanner tools used for the file list - "" for tools that are not installed '''
+        return {name: self.path(name) for name in scanner_tool_names}
+
+    def isCurrent(self, tools):
+        ''' False if a tool that produced a cached result (result cache "tools" value) has since changed version
+            results from tools that are no longer installed are kept, as they can't be rescanned with them,
+            and so are results from tools whose version hasn't been probed yet '''
+        for name, version in parseToolVersions(tools).items():
+            if name in internal_tool_versions:
+                if not internal_tool_versions[name] == version:
+                    return False
+                continue
+            info = self.tool(name)
+            if info.path and info.version is not None and not info.version == version:
+                return False
+        return True
+
+
+tool_registry = None
+tool_registry_lock = threading.Lock()
+
+
+def getToolRegistry():
+    ''' resolve tools on first use '''
+    global tool_registry
+    with tool_registry_lock:
+        if tool_registry is None:
+            tool_registry = ToolRegistry(os.path.join(cfg.app_dirs.user_cache_dir, "tool_versions.json"))
+        return tool_registry
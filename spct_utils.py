@@ -1,21 +1,30 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import multiprocessing
 import os
+import re
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
+import weakref
 from functools import partial
 from hashlib import md5
+from time import time
 
 import spct_cfg as cfg
+from spct_defs import defaultfilemask
+from spct_objects import cmd_result
 
 os.makedirs(cfg.app_dirs.user_log_dir, exist_ok=True)
 logfile = os.path.join(cfg.app_dirs.user_log_dir, "debug.log")
-try:
-   os.remove(logfile)
-except OSError:
-   pass
+if multiprocessing.parent_process() is None: # scanner worker processes log to the same file
+    try:
+       os.remove(logfile)
+    except OSError:
+       pass
    
 logging.basicConfig(filename=logfile, level=logging.DEBUG, format='%(asctime)s - %(threadName)s - (%(levelname)s) %(message)s')
 logging.raiseExceptions=False
@@ -57,6 +66,28 @@ def findffprobeBin(settings_key='Paths/ffprobe_bin', nt_path=cfg.app_dirs.user_c
         
     return ff_bin
 
+def findffmpegBin(settings_key='Paths/ffmpeg_bin', nt_path=cfg.app_dirs.user_cache_dir+'/tools/ffmpeg/ffmpeg.exe', posix_path='/usr/bin/ffmpeg'):
+    ff_bin = cfg.settings.value(settings_key)
+    if ff_bin is None:
+        if os.name == 'nt':
+            return nt_path
+        elif os.name == 'posix':
+            if os.path.exists(posix_path):
+                return posix_path
+            elif os.path.exists(os.path.dirname(posix_path) + "/avconv"): # also try avconv
+                return os.path.dirname(posix_path) + "/avconv"
+
+    return ff_bin
+
+def getFilemaskRegex():
+    filemask = cfg.settings.value('Options/FilemaskRegEx', defaultfilemask)
+
+    try:
+        return re.compile(filemask, re.IGNORECASE)
+    except re.error as e:
+        debug_log("Error in filemask regex: {}, using default".format(e), logging.WARNING)
+        return re.compile(defaultfilemask, re.IGNORECASE)
+
 def getTempFileName():
     with tempfile.NamedTemporaryFile() as temp_file:
         return temp_file.name
@@ -75,32 +106,167 @@ def openFolder(folder_name):
     else:
         debug_log("Folder/directory viewing not implemented on this platform",logging.WARNING)
         
-def runCmd(cmd,cmd_timeout=300):
-    ''' run command without showing console window on windows - return stdout and stderr as strings '''
-    startupinfo = None
-    output = ""
-    output_err = ""
-    debug_log("runCmd: {}".format(cmd))
+cmd_output_limit = 128 * 1024 * 1024 # most bytes of stdout or stderr kept from a command
+
+class outputBuffer(object):
+    ''' collects output of a command up to limit bytes, anything after that is dropped '''
+    def __init__(self,limit=None):
+        self.chunks = []
+        self.size = 0
+        self.limit = limit
+        self.truncated = False
+
+    def write(self,data):
+        if self.limit is not None and self.size + len(data) > self.limit:
+            data = data[:max(0,self.limit - self.size)]
+            self.truncated = True
+        if data:
+            self.chunks.append(data)
+            self.size += len(data)
+
+    def text(self):
+        return b"".join(self.chunks).decode('utf-8','replace')
+
+def readStream(stream,callback):
+    ''' pass output from stream to callback in chunks until eof - runs in a reader thread
+        the stream is drained even if callback fails, so the process never blocks writing to it '''
+    try:
+        while True:
+            data = stream.read1(65536)
+            if not data:
+                break
+            if callback is not None:
+                try:
+                    callback(data)
+                except Exception as e:
+                    debug_log("exception in output callback: {}".format(e),logging.ERROR)
+                    callback = None
+    except (OSError, ValueError) as e:
+        debug_log("readStream: {}".format(e),logging.WARNING)
+    finally:
+        stream.close()
+
+running_processes = weakref.WeakSet() # started by startProcess, see stopProcesses
+running_processes_lock = threading.Lock()
+processes_stopped = False
+
+def startProcess(cmd,stdin=subprocess.DEVNULL,stderr=subprocess.PIPE):
+    ''' start cmd with stdout piped, in a new process group so killProcess also stops anything it starts
+        no console window is shown on windows '''
+    if processes_stopped:
+        raise OSError("not starting {}, shutting down".format(cmd[0]))
     if os.name == 'nt':
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        proc = subprocess.Popen(cmd,startupinfo=startupinfo,creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+                                stdin=stdin,stdout=subprocess.PIPE,stderr=stderr)
+    else:
+        proc = subprocess.Popen(cmd,start_new_session=True,stdin=stdin,stdout=subprocess.PIPE,stderr=stderr)
+    with running_processes_lock:
+        running_processes.add(proc)
+    return proc
+
+def stopProcesses():
+    ''' for shutdown - kill every command started by startProcess that hasn't finished, and start no more.
+        being in their own process groups they don't get the ctrl-c that stops specton,
+        once killed the threads waiting on them return promptly '''
+    global processes_stopped
+    with running_processes_lock:
+        processes_stopped = True
+        processes = list(running_processes)
+    for proc in processes:
+        if proc.poll() is None:
+            killProcess(proc)
+
+def killProcess(proc):
+    ''' kill process and its process group '''
     try:
-        proc = subprocess.Popen(cmd,bufsize=-1,startupinfo=startupinfo,stdout=subprocess.PIPE,stderr=subprocess.PIPE,stdin=None,shell=False,universal_newlines=False)
-    except SubprocessError as e:
-        proc = None
-        debug_log("exception in runCmd: {}".format(e),logging.ERROR)
-    if proc is not None:
-        try:
-            outputb, output_errb = proc.communicate()
-            output = outputb.decode('utf-8','replace')
-            output_err = output_errb.decode('utf-8','replace')
-        except subprocess.TimeoutExpired(timeout=cmd_timeout):
-            proc.kill()
-            debug_log("runCmd: Process killed due to timeout",logging.WARNING)
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            subprocess.call(["taskkill","/F","/T","/PID",str(proc.pid)],startupinfo=startupinfo,
+                            stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid,signal.SIGKILL)
+    except OSError:
+        pass
+    if proc.poll() is None:
+        proc.kill()
+
+def runProcess(cmd,cmd_timeout=300,output_limit=cmd_output_limit,output_callback=None,source_cmd=None):
+    ''' run cmd, killing it and everything it started if it hasn't finished after cmd_timeout seconds - returns cmd_result
+        stdout is passed to output_callback in chunks of bytes (from a reader thread) if given,
+        otherwise stdout and stderr are kept as strings, each up to output_limit bytes
+        if source_cmd is given its stdout is piped into the stdin of cmd, and it's killed along with cmd '''
+    result = cmd_result(cmd)
+    start_time = time()
+    if source_cmd is not None:
+        debug_log("runProcess: {} | {}".format(source_cmd,cmd))
     else:
-        debug_log("runCmd: Proc was none",logging.WARNING)
-    return output,output_err
-    
+        debug_log("runProcess: {}".format(cmd))
+
+    processes = []
+    try:
+        stdin = subprocess.DEVNULL
+        if source_cmd is not None:
+            processes.append(startProcess(source_cmd,stderr=subprocess.DEVNULL))
+            stdin = processes[0].stdout
+        processes.append(startProcess(cmd,stdin))
+    except (OSError, ValueError) as e:
+        result.error = e
+        debug_log("runProcess: exception starting {}: {}".format(cmd,e),logging.ERROR)
+        for proc in processes:
+            killProcess(proc)
+            proc.wait()
+        return result
+    finally:
+        if source_cmd is not None and processes:
+            processes[0].stdout.close() # only cmd holds the pipe now, so the source sees a broken pipe if cmd exits
+    proc = processes[-1]
+
+    stdout_buffer = outputBuffer(output_limit)
+    stderr_buffer = outputBuffer(output_limit)
+    readers = [threading.Thread(target=readStream,args=(proc.stdout,output_callback or stdout_buffer.write),daemon=True),
+               threading.Thread(target=readStream,args=(proc.stderr,stderr_buffer.write),daemon=True)]
+    for reader in readers:
+        reader.start()
+
+    deadline = start_time + cmd_timeout
+    try:
+        proc.wait(max(0,deadline - time()))
+        for reader in readers: # output pipes can be held open by processes cmd started
+            reader.join(max(0,deadline - time()))
+        if any(reader.is_alive() for reader in readers):
+            raise subprocess.TimeoutExpired(cmd,cmd_timeout)
+    except subprocess.TimeoutExpired:
+        result.timed_out = True
+        debug_log("runProcess: {} killed after {} seconds".format(cmd,cmd_timeout),logging.WARNING)
+        for p in processes:
+            killProcess(p)
+        for reader in readers:
+            reader.join(1)
+    for p in processes[:-1]: # cmd has finished, the decoded audio etc. isn't wanted any more
+        if p.poll() is None:
+            killProcess(p)
+    for p in processes:
+        p.wait()
+
+    result.returncode = proc.returncode
+    if source_cmd is not None: # killed above if cmd stopped reading before it finished
+        result.source_returncode = processes[0].returncode
+    result.elapsed = time() - start_time
+    result.stdout = stdout_buffer.text()
+    result.stderr = stderr_buffer.text()
+    result.truncated = stdout_buffer.truncated or stderr_buffer.truncated
+    if result.truncated:
+        debug_log("runProcess: output of {} truncated to {} bytes".format(cmd,output_limit),logging.WARNING)
+    return result
+
+def runCmd(cmd,cmd_timeout=300):
+    ''' run command without showing console window on windows - return stdout and stderr as strings '''
+    result = runProcess(cmd,cmd_timeout)
+    return result.stdout,result.stderr
+
 def format_bytes(num, suffix='B'):
     for unit in ['','Ki','Mi','Gi','Ti','Pi','Ei','Zi']:
         if abs(num) < 1024.0:
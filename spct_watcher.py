@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+from time import time, sleep
+
+from PyQt5.QtCore import QRunnable
+
+from spct_utils import debug_log
+
+# inotify event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+
+watch_mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+inotify_event_header = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyWatcher(object):
+    ''' directory watcher using linux inotify via ctypes - subdirectories are watched too if recurse '''
+
+    def __init__(self, folders, recurse=True, followsymlinks=False):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.inotify_add_watch = libc.inotify_add_watch
+        self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # watch descriptor -> directory
+        self.folders = folders
+        self.recurse = recurse
+        self.followsymlinks = followsymlinks
+        try:
+            for folder in folders:
+                self.addTree(folder)
+        except OSError:
+            self.close()
+            raise
+
+    def addWatch(self, directory):
+        ''' returns False if directory was already watched (inotify gives the same inode the same descriptor) '''
+        wd = self.inotify_add_watch(self.fd, os.fsencode(directory), watch_mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(directory))
+        if wd in self.watches:
+            return False
+        self.watches[wd] = directory
+        return True
+
+    def addTree(self, directory):
+        ''' watch directory, and subdirectories if recurse - returns files already present (may predate the watch) '''
+        if not self.addWatch(directory):  # symlink loop
+            return []
+        try:
+            files, subdirs = listDir(directory, self.followsymlinks)
+        except OSError as e:
+            debug_log("InotifyWatcher: error reading {}: {}".format(directory, e), logging.WARNING)
+            return []
+        if self.recurse:
+            for subdir in subdirs:
+                files.extend(self.addTree(subdir))
+        return files
+
+    def poll(self, timeout):
+        ''' wait up to timeout seconds - return list of created or changed file paths '''
+        changed = []
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + inotify_event_header.size <= len(data):
+            wd, mask, cookie, name_len = inotify_event_header.unpack_from(data, offset)
+            offset += inotify_event_header.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+            offset += name_len
+            if mask & IN_Q_OVERFLOW:
+                debug_log("InotifyWatcher: event queue overflow, rescanning watched folders", logging.WARNING)
+                for folder in self.folders:
+                    changed.extend(walkFiles(folder, self.recurse, self.followsymlinks))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR or (self.followsymlinks and mask & IN_CREATE and os.path.isdir(path)):
+                if self.recurse and mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        changed.extend(self.addTree(path))
+                    except OSError as e:
+                        debug_log("InotifyWatcher: can't watch {}: {}".format(path, e), logging.WARNING)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    ''' fallback watcher - compares size and mtime of files matching filemask every poll_interval seconds
+        directories are only listed again when their mtime changes, but every file is stat'ed on each poll,
+        as a file changed in place doesn't change its directory's mtime '''
+
+    def __init__(self, folders, filemask_regex, recurse=True, followsymlinks=False, poll_interval=10):
+        self.folders = folders
+        self.filemask_regex = filemask_regex
+        self.recurse = recurse
+        self.followsymlinks = followsymlinks
+        self.poll_interval = poll_interval
+        self.dirs = {}  # directory -> (mtime_ns, matching files, subdirectories)
+        self.snapshot = self.takeSnapshot()
+        self.next_poll = time() + poll_interval
+
+    def takeSnapshot(self):
+        snapshot = {}
+        dirs = {}
+        visited = set()
+        pending = list(self.folders)
+        while pending:
+            directory = pending.pop()
+            try:
+                st = os.stat(directory)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in visited:  # symlink loop
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            listing = self.dirs.get(directory)
+            if listing is None or not listing[0] == st.st_mtime_ns:
+                try:
+                    files, subdirs = listDir(directory, self.followsymlinks)
+                except OSError as e:
+                    debug_log("PollingWatcher: error reading {}: {}".format(directory, e), logging.WARNING)
+                    continue
+                listing = (st.st_mtime_ns,
+                           [path for path in files if self.filemask_regex.search(os.path.basename(path)) is not None],
+                           subdirs)
+            dirs[directory] = listing
+            for path in listing[1]:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+            if self.recurse:
+                pending.extend(listing[2])
+        self.dirs = dirs
+        return snapshot
+
+    def poll(self, timeout):
+        wait = self.next_poll - time()
+        if wait > timeout:
+            sleep_for = timeout
+        else:
+            sleep_for = max(wait, 0)
+        sleep(sleep_for)
+        if time() < self.next_poll:
+            return []
+        snapshot = self.takeSnapshot()
+        changed = [path for path, stat_data in snapshot.items() if not self.snapshot.get(path) == stat_data]
+        self.snapshot = snapshot
+        self.next_poll = time() + self.poll_interval
+        return changed
+
+    def close(self):
+        pass
+
+
+def listDir(directory, followsymlinks=False):
+    ''' (files, subdirectories) of directory as paths - symlinked subdirectories only if followsymlinks '''
+    files = []
+    subdirs = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=followsymlinks):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry.path)
+            except OSError:
+                pass
+    return files, subdirs
+
+
+def walkFiles(folder, recurse=True, followsymlinks=False):
+    files = []
+    visited = set()
+    pending = [folder]
+    while pending:
+        directory = pending.pop()
+        try:
+            st = os.stat(directory)
+            if (st.st_dev, st.st_ino) in visited:  # symlink loop
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            dir_files, subdirs = listDir(directory, followsymlinks)
+        except OSError as e:
+            debug_log("walkFiles: error reading {}: {}".format(directory, e), logging.WARNING)
+            continue
+        files.extend(dir_files)
+        if recurse:
+            pending.extend(subdirs)
+    return files
+
+
+class folderWatch_Thread(QRunnable):
+    ''' watch folders for new or modified files matching filemask and post them to watch_q in batches
+        events are coalesced - a batch is posted once no new events have arrived for quiet_period seconds
+        subfolders are watched if recursedirectories, symlinked ones too if followsymlinks - as file discovery does '''
+
+    def __init__(self, folders, filemask_regex, watch_q, followsymlinks=False, recursedirectories=True, quiet_period=2.0,
+                 max_delay=30.0):
+        super(folderWatch_Thread, self).__init__()
+        self.folders = list(folders)
+        self.filemask_regex = filemask_regex
+        self.watch_q = watch_q
+        self.followsymlinks = followsymlinks
+        self.recursedirectories = recursedirectories
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def createWatcher(self):
+        if sys.platform.startswith('linux'):
+            try:
+                return InotifyWatcher(self.folders, self.recursedirectories, self.followsymlinks)
+            except (OSError, AttributeError) as e:  # e.g. max_user_watches reached
+                debug_log("inotify not available ({}), polling watched folders".format(e), logging.WARNING)
+        return PollingWatcher(self.folders, self.filemask_regex, self.recursedirectories, self.followsymlinks)
+
+    def run(self):
+        try:
+            watcher = self.createWatcher()
+        except Exception as e:
+            debug_log("Exception starting folder watcher: {}".format(e), logging.ERROR)
+            return
+        debug_log("Watching folders {} with {}".format(self.folders, type(watcher).__name__))
+        pending = set()
+        first_event = last_event = 0
+        try:
+            while not self.cancelled:
+                changed = [path for path in watcher.poll(0.5)
+                           if self.filemask_regex.search(os.path.basename(path)) is not None]
+                now = time()
+                if changed:
+                    if not pending:
+                        first_event = now
+                    pending.update(changed)
+                    last_event = now
+                if pending and ((now - last_event >= self.quiet_period) or (now - first_event >= self.max_delay)):
+                    debug_log("folder watcher posting {} changed files".format(len(pending)))
+                    self.watch_q.put(sorted(pending))
+                    pending = set()
+        except Exception as e:
+            debug_log("Exception in folderWatch_Thread: {}".format(e), logging.ERROR)
+        finally:
+            watcher.close()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+from spct_defs import colourToCode, colourFromCode
+from spct_objects import main_info, song_info_obj
+from spct_threads import getFileScanThreads
+from spct_utils import debug_log, stopProcesses
+
+
+def compactSongInfo(song_info):
+    ''' song_info_obj as a plain dict for sending between processes - colours as QualityColours codes '''
+    fields = vars(song_info).copy()
+    fields["quality_colour"] = colourToCode(fields["quality_colour"])
+    return fields
+
+
+def expandSongInfo(fields):
+    song_info = song_info_obj()
+    song_info.__dict__.update(fields)
+    song_info.quality_colour = colourFromCode(fields["quality_colour"])
+    return song_info
+
+
+class resultList(list):
+    ''' stands in for main_q when scanner threads are run directly in a worker process '''
+
+    def put(self, item, block=True, timeout=None):
+        self.append(item)
+
+
+def scanFile(file_id, filenameStr, scan_options):
+    ''' run every scanner thread for a file in this process - returns list of (result type, compact song info)
+        with exactly one entry per task (see threadTaskCount), so the GUI's task count always balances '''
+    scanner_bins, cmd_timeout, debug_enabled, aucdtect_mode, scan_for_errors, cutoff_scan = scan_options
+    results = []
+    for thread in getFileScanThreads(file_id, filenameStr, scanner_bins, cmd_timeout, debug_enabled, None,
+                                     aucdtect_mode, scan_for_errors, cutoff_scan):
+        posted = resultList()
+        thread.main_q = posted
+        try:
+            thread.run()
+        except Exception as e:
+            debug_log("Exception in scanner worker for file {}: {}".format(filenameStr, e), logging.ERROR)
+        for info in posted:
+            results.append((info.result_type, compactSongInfo(info.song_info)))
+        for missing in range(getattr(thread, "task_count", 1) - len(posted)):  # thread failed without posting
+            song_info = song_info_obj()
+            song_info.cmd_error = True
+            results.append((main_info.SCANNER_OUTPUT, compactSongInfo(song_info)))
+    return results
+
+
+def stopWorker(signum, frame):
+    ''' scanProcessPool.close terminates workers that are still busy - stop their scanners too '''
+    stopProcesses()
+    os._exit(1)
+
+
+def scanWorker(task_q, result_q):
+    ''' worker process main loop - runs until it receives None '''
+    debug_log("Scanner worker process {} started".format(os.getpid()))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # ctrl-c reaches the workers too, the parent shuts them down
+    if not os.name == 'nt':  # terminate() can't be handled on windows
+        signal.signal(signal.SIGTERM, stopWorker)
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        file_id, filenameStr, scan_options = task
+        try:
+            results = scanFile(file_id, filenameStr, scan_options)
+        except Exception as e:
+            debug_log("Exception in scanWorker: {}".format(e), logging.ERROR)
+            results = []
+        result_q.put((file_id, results))
+
+
+class scanProcessPool(object):
+    ''' long lived worker processes that run the scanners and parse their output, so parsing isn't limited by the GIL
+        results are posted to main_q as main_info objects, the same as from the scanner threads '''
+
+    def __init__(self, processes, main_q):
+        self.main_q = main_q
+        self.context = multiprocessing.get_context("spawn")  # don't fork a threaded Qt process
+        self.task_q = self.context.Queue()
+        self.result_q = self.context.Queue()
+        self.lock = threading.Lock()
+        self.in_progress = {}  # file id -> number of results still expected
+        self.workers = []
+        for i in range(processes if processes > 0 else os.cpu_count() or 1):
+            worker = self.context.Process(target=scanWorker, args=(self.task_q, self.result_q), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        self.collector = threading.Thread(target=self.collectResults, name="scanProcessPool collector", daemon=True)
+        self.collector.start()
+
+    def submit(self, file_id, filenameStr, scan_options, task_count):
+        ''' queue file for scanning - task_count is the number of results it will produce '''
+        with self.lock:
+            self.in_progress[file_id] = task_count
+        self.task_q.put((file_id, filenameStr, scan_options))
+
+    def collectResults(self):
+        while True:
+            item = self.result_q.get()
+            if item is None:
+                break
+            file_id, results = item
+            for result_type, fields in results:
+                self.main_q.put(main_info(result_type, "", file_id, expandSongInfo(fields)))
+            with self.lock:  # only after posting, so an idle pool never has results still to be posted
+                self.in_progress.pop(file_id, None)
+
+    def cancel(self):
+        ''' drop files that haven't been started - returns the number of results they would have posted '''
+        dropped = 0
+        with self.lock:
+            while True:
+                try:
+                    task = self.task_q.get(False)
+                except queue.Empty:
+                    break
+                dropped += self.in_progress.pop(task[0], 0)
+            return dropped
+
+    def isIdle(self):
+        with self.lock:
+            return not self.in_progress
+
+    def isAlive(self):
+        return all(worker.is_alive() for worker in self.workers)
+
+    def close(self):
+        self.cancel()
+        for worker in self.workers:
+            self.task_q.put(None)
+        for worker in self.workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+        self.result_q.put(None)
+        self.collector.join(1)
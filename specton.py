@@ -20,8 +20,8 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>. 
 '''
 
-import fnmatch
 import logging
+import multiprocessing
 import os
 import queue
 import subprocess
@@ -31,21 +31,29 @@ from collections import deque
 from io import TextIOWrapper
 from time import asctime, gmtime, strftime, time
 
-from PyQt5.QtCore import QTimer, QThreadPool, QRunnable, QReadLocker, QWriteLocker, \
+from PyQt5.QtCore import QTimer, QThreadPool, QReadLocker, QWriteLocker, \
     QReadWriteLock, QEvent, QTranslator, QLocale
 from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QFileDialog, \
-    QTableWidgetItem, QMessageBox, QMenu, QPushButton, QPlainTextEdit
+    QHeaderView, QMessageBox, QMenu, QPushButton, QPlainTextEdit
 
 import spct_cfg as cfg
 from dlg_main import Ui_MainWindow
+from spct_cache import getResultCache, fileKey
 from spct_defs import *
 from spct_downloader import DownloaderDlg
 from spct_fileinfodialog import FileInfo
-from spct_objects import main_info, song_info_obj
+from spct_objects import main_info, song_info_obj, discovery_info
 from spct_optionsdialog import OptionsDialog
-from spct_threads import getScannerThread, aucdtect_Thread, errorCheck_Thread
-from spct_utils import findGuessEncBin, findMediaInfoBin, findFlacBin, findauCDtectBin, md5Str, debug_log, findDlg, \
-    openFolder
+from spct_parsers import mergeSongInfo
+from spct_queue import notifyQueue
+from spct_scheduler import taskScheduler, schedulerLimits, PRIORITY_VISIBLE, PRIORITY_SELECTED, PRIORITY_INFO, \
+    max_priority_files
+from spct_tablemodel import FileTableModel
+from spct_tools import getToolRegistry
+from spct_threads import getFileScanThreads, batchMediaInfoThreads, fileDiscovery_Thread, threadTaskCount
+from spct_watcher import folderWatch_Thread
+from spct_workers import scanProcessPool
+from spct_utils import findMediaInfoBin, getFilemaskRegex, debug_log, findDlg, openFolder
 
 frozen = bool(getattr(sys, 'frozen', False))
 
@@ -76,21 +84,6 @@ if os.name == 'nt':  # various hacks
         sys.stderr = open(stderr_fn, "w")
 
 
-def headerIndexByName(table, headerName):
-    ''' find column in tablewidget from headerName '''
-    for i in range(0, table.columnCount()):
-        if table.horizontalHeaderItem(i).text() == headerName:
-            return i
-    return -1
-
-
-def getTableHeaders(table):
-    header_list = []
-    for i in range(0, table.columnCount()):
-        header_list.append(table.horizontalHeaderItem(i).text())
-    return header_list
-
-
 def checkPrereq(self):
     mi_bin = findMediaInfoBin()
     if not os.path.exists(mi_bin):
@@ -107,9 +100,10 @@ def checkPrereq(self):
 
 
 class Main(QMainWindow):
-    main_q = queue.Queue()
     infodlg_list = set()  # list of dialog windows
-    scanner_threadpool = QThreadPool(None)
+    discovery_threadpool = QThreadPool(None)
+    watch_q = queue.Queue()
+    watch_threadpool = QThreadPool(None)
     ql = QReadWriteLock()
     file_hashlist = set()
 
@@ -122,9 +116,16 @@ class Main(QMainWindow):
 
         self.task_count = 0
         self.task_total = 0
+        self.scanner_threadpool = taskScheduler()  # a thread pool for each task class
         self.scan_start_time = time()
         
         self.filterTimer = QTimer(self)
+        self.discovery_thread = None
+        self.discovery_usecache = True
+        self.watch_thread = None
+        self.watched_folders = set()  # folders added with addFilesFolders
+        self.watch_pending = set()  # changed files waiting for scanner to be idle
+        self.scan_process_pool = None  # scanProcessPool, started on first scan with Options/ProcessEngine
         self.recentFiles = deque([],cfg.maxMRU)
         
         self.ui.actionExit.triggered.connect(sys.exit)
@@ -160,6 +161,11 @@ class Main(QMainWindow):
         fileMenu.addAction(self.ui.actionExit)
         editMenu = self.ui.menubar.addMenu(self.tr('&Edit'))
         editMenu.addAction(self.ui.actionOptions)
+        self.actionWatchFolders = QAction(self.tr("&Watch Folders"), self)
+        self.actionWatchFolders.setCheckable(True)
+        self.actionWatchFolders.setChecked(cfg.settings.value('Options/WatchFolders', False, type=bool))
+        self.actionWatchFolders.toggled.connect(self.watchFoldersToggled)
+        editMenu.addAction(self.actionWatchFolders)
         viewMenu = self.ui.menubar.addMenu(self.tr('&View'))
         viewMenu.addAction(self.ui.actionViewConfigDir)
         viewMenu.addAction(self.ui.actionViewLogDir)
@@ -180,14 +186,27 @@ class Main(QMainWindow):
         helpMenu = self.ui.menubar.addMenu(self.tr('&Help'))
         helpMenu.addAction(self.ui.actionAbout)
 
-        self.ui.tableWidget.setColumnCount(len(TableHeaders))
-        self.ui.tableWidget.setHorizontalHeaderLabels(TableHeaders)
-        self.ui.tableWidget.horizontalHeader().resizeSection(headerIndexByName(self.ui.tableWidget, "Filename"), 300)
-        self.ui.tableWidget.horizontalHeader().setSectionsMovable(True)
-        self.ui.tableWidget.installEventFilter(self)
-
-        self.ui.tableWidget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.ui.tableWidget.customContextMenuRequested.connect(self.tableContextMenu)
+        self.model = FileTableModel(self)
+        self.ui.tableView.setModel(self.model)
+        self.ui.tableView.horizontalHeader().resizeSection(TableHeaders.index("Filename"), 300)
+        self.ui.tableView.horizontalHeader().setSectionsMovable(True)
+        self.ui.tableView.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  # no per-row size hints
+        self.ui.tableView.installEventFilter(self)
+        self.ui.tableView.viewport().installEventFilter(self)
+
+        self.ui.tableView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ui.tableView.customContextMenuRequested.connect(self.tableContextMenu)
+
+        # scan the files being looked at first - see updatePriorities
+        self.info_file_id = None  # file of the last FileInfo dialog opened
+        self.priorityTimer = QTimer(self)
+        self.priorityTimer.setSingleShot(True)
+        self.priorityTimer.setInterval(100)
+        self.priorityTimer.timeout.connect(self.updatePriorities)
+        self.ui.tableView.verticalScrollBar().valueChanged.connect(self.priorityTimer.start)
+        self.ui.tableView.selectionModel().selectionChanged.connect(self.priorityTimer.start)
+        self.model.layoutChanged.connect(self.priorityTimer.start)  # sorted or filtered
+        self.model.rowsInserted.connect(self.priorityTimer.start)
 
         windowState = cfg.settings.value("State/windowState")
         windowGeometry = cfg.settings.value("State/windowGeometry")
@@ -199,23 +218,28 @@ class Main(QMainWindow):
         if windowGeometry is not None:
             self.restoreGeometry(windowGeometry)
         if tableGeometry is not None:
-            self.ui.tableWidget.restoreGeometry(tableGeometry)
+            self.ui.tableView.restoreGeometry(tableGeometry)
         if tableHeaderState is not None:
-            self.ui.tableWidget.horizontalHeader().restoreState(tableHeaderState)
-            self.ui.tableWidget.sortByColumn(-1, Qt.AscendingOrder)
+            self.ui.tableView.horizontalHeader().restoreState(tableHeaderState)
+            self.ui.tableView.sortByColumn(-1, Qt.AscendingOrder)
 
         self.ui.filterBox.textChanged.connect(self.filterBoxChanged)
         self.ui.filter_comboBox.currentIndexChanged.connect(self.filterBoxChanged)
         self.filterTimer.setSingleShot(True)
         self.filterTimer.timeout.connect(self.doFilterTable)
             
-        updateMainGuiTimer = QTimer(self)  # this timer watches main_q and updates tablewidget with scanner results
-        updateMainGuiTimer.timeout.connect(self.updateMainGui)
-        updateMainGuiTimer.setInterval(500)
-        updateMainGuiTimer.start()
+        self.main_q = notifyQueue(min_interval=50)  # scanner results, applied to table by updateMainGui
+        self.main_q.connect(self.updateMainGui)
+
+        self.discovery_q = notifyQueue()  # files found by fileDiscovery_Thread, added by updateDiscovery
+        self.discovery_q.connect(self.updateDiscovery)
+
+        self.updateWatchTimer = QTimer(self)  # runs while watching folders
+        self.updateWatchTimer.timeout.connect(self.updateWatch)
+        self.updateWatchTimer.setInterval(1000)
 
     def eventFilter(self, obj, event):
-        if obj is self.ui.tableWidget:
+        if obj is self.ui.tableView or obj is self.ui.tableView.viewport():
             # handle file/folder drag & drop
             if event.type() == QEvent.DragEnter:
                 if event.mimeData().hasUrls():
@@ -289,130 +313,71 @@ class Main(QMainWindow):
         self.filterTimer.start(delay)
                     
     def doFilterTable(self):
-
-        def doTableHideTypes(table,filtertypes,row):
-            if filtertypes == 0: # "All"
-                return False
-            elif filtertypes == 1: # "Errors only"
-                errorsItem = table.item(row, headerIndexByName(table, "Errors"))
-                if errorsItem.background() == colourQualityBad:
-                    return False
-                else:
-                    return True
-            elif filtertypes == 2: # "Lossless"
-                fnItem = table.item(row, headerIndexByName(table, "Filename"))
-                fn, ext = os.path.splitext(fnItem.toolTip())
-                if ext.lower() in LosslessFormats:
-                    return False
-                else:
-                    return True
-            elif filtertypes == 3: # "Lossy"
-                fnItem = table.item(row, headerIndexByName(table, "Filename"))
-                fn, ext = os.path.splitext(fnItem.toolTip())
-                if ext.lower() in LossyFormats:
-                    return False
-                else:
-                    return True
-            elif filtertypes in (4,5): # "High quality", "Low quality"
-                qualityItem = table.item(row, headerIndexByName(table, "Quality"))
-                background_colour = qualityItem.background()
-                if filtertypes == 4:
-                    return False if background_colour in (colourQualityGood,colourQualityOk) else True
-                else:
-                    return False if background_colour in (colourQualityWarning,colourQualityBad) else True
-                    
-            elif filtertypes == 6: # "Unscanned"  
-                filenameItem = table.item(row, headerIndexByName(table, "Filename"))
-                fileScanned = filenameItem.data(dataScanned)
-                if fileScanned:
-                    return True
-                else:
-                    return False
-                
-        filterText = self.ui.filterBox.text().lower()        
-        filtertypes = self.ui.filter_comboBox.currentIndex()
-        
-        if filterText == "":
-            for i in range(0, self.ui.tableWidget.rowCount()):
-                self.ui.tableWidget.setRowHidden(i,False or (doTableHideTypes(self.ui.tableWidget,filtertypes,i)))
-        else:
-            for i in range(0, self.ui.tableWidget.rowCount()):
-                artistItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Artist"))
-                fnItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Filename"))
-                encoderItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Encoder"))
-                fn = fnItem.toolTip().lower()
-                if (filterText in fn) or (filterText in artistItem.text().lower()) or (filterText in encoderItem.text().lower()):
-                    self.ui.tableWidget.setRowHidden(i,False or (doTableHideTypes(self.ui.tableWidget,filtertypes,i)))
-                else:
-                    self.ui.tableWidget.setRowHidden(i,True)
+        self.model.setFilter(self.ui.filterBox.text(), self.ui.filter_comboBox.currentIndex())
 
     def tableContextMenu(self, point):
-        row = self.ui.tableWidget.rowAt(point.y())
-        selected_items = self.ui.tableWidget.selectedItems()
+        row = self.ui.tableView.rowAt(point.y())
         if not row == -1:
+            file_id = self.model.idAt(row)
+            selected_ids = [self.model.idAt(index.row()) for index in self.ui.tableView.selectionModel().selectedRows()]
+            if not selected_ids:
+                selected_ids = [file_id]
             menu = QMenu(self)
             viewInfoAction = QAction(self.tr("View &Info"), menu)
-            viewInfoAction.triggered.connect(partial(self.contextViewInfo, row))
+            viewInfoAction.triggered.connect(partial(self.contextViewInfo, file_id))
             menu.addAction(viewInfoAction)
             rescanFileAction = QAction(self.tr("&Scan File(s)"), menu)
-            rescanFileAction.triggered.connect(partial(self.contextRescanFile, row, selected_items))
+            rescanFileAction.triggered.connect(partial(self.contextRescanFile, file_id, selected_ids))
             if self.task_count > 0:
                 rescanFileAction.setEnabled(False)
             scanFolderAction = QAction(self.tr("Scan &Folder"), menu)
-            scanFolderAction.triggered.connect(partial(self.contextScanFolder, row))
+            scanFolderAction.triggered.connect(partial(self.contextScanFolder, file_id))
             if self.task_count > 0:
                 scanFolderAction.setEnabled(False)
             menu.addAction(rescanFileAction)
             menu.addAction(scanFolderAction)
             playFileAction = QAction(self.tr("&Play File"), menu)
-            playFileAction.triggered.connect(partial(self.contextPlayFile, row))
+            playFileAction.triggered.connect(partial(self.contextPlayFile, file_id))
             menu.addAction(playFileAction)
             browseFolderAction = QAction(self.tr("&Browse Folder"), menu)
-            browseFolderAction.triggered.connect(partial(self.contextBrowseFolder, row))
+            browseFolderAction.triggered.connect(partial(self.contextBrowseFolder, file_id))
             menu.addAction(browseFolderAction)
             writeReportAction = QAction(self.tr("Write &Report (Folder)"), menu)
-            writeReportAction.triggered.connect(partial(self.contextWriteReport, row))
+            writeReportAction.triggered.connect(partial(self.contextWriteReport, file_id))
             menu.addAction(writeReportAction)
-            menu.popup(self.ui.tableWidget.viewport().mapToGlobal(point))
+            menu.popup(self.ui.tableView.viewport().mapToGlobal(point))
 
     def closeEvent(self, event):
         self.cancel_Tasks()
+        self.stopWatching()
 
         if cfg.settings.value("Options/SaveWindowState", True, type=bool):
             windowState = self.saveState()
             windowGeometry = self.saveGeometry()
-            tableGeometry = self.ui.tableWidget.saveGeometry()
-            tableHeaderState = self.ui.tableWidget.horizontalHeader().saveState()
+            tableGeometry = self.ui.tableView.saveGeometry()
+            tableHeaderState = self.ui.tableView.horizontalHeader().saveState()
             cfg.settings.setValue("State/windowState", windowState)
             cfg.settings.setValue("State/windowGeometry", windowGeometry)
             cfg.settings.setValue("State/tableGeometry", tableGeometry)
             cfg.settings.setValue("State/tableHeaderState", tableHeaderState)
 
         cfg.settings.setValue("State/MRU", self.recentFiles)
+        getResultCache().commit()
+        if self.scan_process_pool is not None:
+            self.scan_process_pool.close()
         event.accept()
 
-    def contextWriteReport(self, row, silent=False):
-        folderItem = self.ui.tableWidget.item(row, headerIndexByName(self.ui.tableWidget, "Folder"))
-        report_dir = folderItem.toolTip()
-        report_dir_displayname = folderItem.text()
+    def contextWriteReport(self, file_id, silent=False):
+        report_dir = self.model.folder(file_id)
+        report_dir_displayname = os.path.basename(report_dir)
         file_list = []
-        for i in range(0, self.ui.tableWidget.rowCount()):
-            folderItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Folder"))
-            directory = folderItem.toolTip()
-            if report_dir == directory:
-                filenameItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Filename"))
-                filenameStr = filenameItem.data(dataFilenameStr)
-                modified_date = strftime("%d/%m/%Y %H:%M:%S UTC", gmtime(os.path.getmtime(filenameStr)))
-                codecItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Encoder"))
-                bitrateItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Bitrate"))
-                lengthItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Length"))
-                filesizeItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Filesize"))
-                qualityItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Quality"))
-                frequencyItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Frequency"))
-                modeItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Mode"))
-                file_list.append([filenameItem.text(), lengthItem.text(), filesizeItem.text(), bitrateItem.text(),
-                                  modeItem.text(), frequencyItem.text(), codecItem.text(), qualityItem.text(),
-                                  modified_date])
+        for i in self.model.idsInFolder(report_dir):
+            filenameStr = self.model.path(i)
+            modified_date = strftime("%d/%m/%Y %H:%M:%S UTC", gmtime(os.path.getmtime(filenameStr)))
+            record = self.model.record(i)
+            file_list.append([os.path.basename(filenameStr), record["length"], record["filesize"], record["bitrate"],
+                              record["mode"], record["frequency"], record["encoder"], record["quality"],
+                              modified_date])
 
         with open(report_dir + "/specton.log", "w") as report_file:
             report_file.write("Report for folder: {}\n".format(report_dir_displayname))
@@ -441,136 +406,100 @@ class Main(QMainWindow):
         if not silent:
             self.statusBar().showMessage("Report generated for folder {}".format(report_dir_displayname))
 
-    def contextRescanFile(self, row, selected_items):
+    def contextRescanFile(self, file_id, selected_ids):
         file_list = set()
-        for filenameItem in selected_items:
-            filenameItem.setData(dataScanned, False)
-            file_list.add(filenameItem.data(dataFilenameStr))
+        for i in selected_ids:
+            self.model.updateFile(i, {"scanned": False})
+            file_list.add(self.model.path(i))
         self.scan_Files(True, file_list)
 
-    def contextScanFolder(self, row):
-        folderItem = self.ui.tableWidget.item(row, headerIndexByName(self.ui.tableWidget, "Folder"))
-        scan_dir = folderItem.toolTip()
-        file_list = set()
-        for i in range(0, self.ui.tableWidget.rowCount()):
-            folderItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Folder"))
-            directory = folderItem.toolTip()
-            if scan_dir == directory:
-                filenameItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Filename"))
-                file_list.add(filenameItem.data(dataFilenameStr))
+    def contextScanFolder(self, file_id):
+        file_list = set(self.model.path(i) for i in self.model.idsInFolder(self.model.folder(file_id)))
         self.scan_Files(True, file_list)
 
-    def contextViewInfo(self, row):
-        filenameItem = self.ui.tableWidget.item(row, headerIndexByName(self.ui.tableWidget, "Filename"))
-        codecItem = self.ui.tableWidget.item(row, headerIndexByName(self.ui.tableWidget, "Encoder"))
-        bitrateItem = self.ui.tableWidget.item(row, headerIndexByName(self.ui.tableWidget, "Bitrate"))
-        filenameStr = filenameItem.data(dataFilenameStr)
+    def contextViewInfo(self, file_id):
+        filenameStr = self.model.path(file_id)
+        self.info_file_id = file_id
+        self.updatePriorities()
         dlg = findDlg(filenameStr, cfg.debug_enabled, self.infodlg_list)
         if dlg is None:
             debug_log("contextViewInfo: dialog was None")
-            dlg = FileInfo(filenameStr, bitrateItem.data(dataBitrate), self.infodlg_list)
+            dlg = FileInfo(filenameStr, self.model.frameHist(file_id), self.infodlg_list)
             debug_log(dlg.objectName())
             dlg.show()
         else:
             dlg.showNormal()
             dlg.activateWindow()
 
-    def contextPlayFile(self, row):  # todo implement this
+    def updatePriorities(self):
+        ''' move queued scanner threads for the FileInfo dialog's file, selected rows and visible rows to the front
+            of the queue - the rest keep their order '''
+        table = self.ui.tableView
+        first_row = table.rowAt(0)
+        if first_row < 0:
+            priorities = {}
+        else:
+            last_row = table.rowAt(table.viewport().height() - 1)
+            if last_row < 0:
+                last_row = self.model.rowCount() - 1
+            last_row = min(last_row, first_row + max_priority_files - 1)
+            priorities = {self.model.idAt(row): PRIORITY_VISIBLE for row in range(first_row, last_row + 1)}
+        selected = 0  # rows from the selection ranges, so a large selection isn't listed row by row
+        for selection_range in table.selectionModel().selection():
+            for row in range(selection_range.top(), selection_range.bottom() + 1):
+                if selected >= max_priority_files:
+                    break
+                priorities[self.model.idAt(row)] = PRIORITY_SELECTED
+                selected += 1
+        if self.info_file_id is not None:
+            priorities[self.info_file_id] = PRIORITY_INFO
+        self.scanner_threadpool.setPriorities(priorities)
+
+    def contextPlayFile(self, file_id):  # todo implement this
         pass
 
-    def contextBrowseFolder(self, row):
-        folderItem = self.ui.tableWidget.item(row, headerIndexByName(self.ui.tableWidget, "Folder"))
-        folderName = folderItem.toolTip()
+    def contextBrowseFolder(self, file_id):
+        folderName = self.model.folder(file_id)
         if os.name == 'nt':
             subprocess.Popen("explorer \"" + os.path.normpath(folderName) + "\"")
 
-    def addTableWidgetItem(self, row, name, directory, usecache, tableheaders):
+    def createFileEntry(self, name, directory, usecache, st=None):
+        ''' create model entry (name, directory, cache key, cached fields) for file, filled from cache if available
+            returns None if file already in table '''
         filenameStr = os.path.join(directory, name)
-        hashStr = filenameStr.replace("/", "\\") + str(
-            os.path.getmtime(filenameStr))  # use mtime so hash changes if file changed
-        filemd5 = md5Str(hashStr)
-
-        if filemd5 in self.file_hashlist:
-            return  # don't add same file twice
-
-        self.file_hashlist.add(filemd5)
-
-        filenameItem = QTableWidgetItem(name)
-        filenameItem.setToolTip(filenameStr)
-        filenameItem.setData(dataFilenameStr, filenameStr)
-        codecItem = QTableWidgetItem("")
-        folderItem = QTableWidgetItem(os.path.basename(directory))
-        folderItem.setToolTip(directory)
-        artistItem = QTableWidgetItem("")
-        bitrateItem = QTableWidgetItem("")
-        lengthItem = QTableWidgetItem("")
-        filesizeItem = QTableWidgetItem("")
-        qualityItem = QTableWidgetItem("")
-        frequencyItem = QTableWidgetItem("")
-        modeItem = QTableWidgetItem("")
-        errorItem = QTableWidgetItem("")
+        if st is None:
+            try:
+                st = os.stat(filenameStr)
+            except OSError as e:
+                debug_log("createFileEntry: can't stat {}: {}".format(filenameStr, e), logging.WARNING)
+                return None
+        filekey = fileKey(st)  # includes mtime so key changes if file changed
+
+        if filekey in self.file_hashlist:
+            return None  # don't add same file twice
+
+        self.file_hashlist.add(filekey)
 
+        cached = None
         if usecache:
-            if cfg.filecache.value('{}/Encoder'.format(filemd5)) is not None:
-                artistItem.setText(cfg.filecache.value('{}/Artist'.format(filemd5)))
-                codecItem.setText(cfg.filecache.value('{}/Encoder'.format(filemd5)))
-                bitrateItem.setText(cfg.filecache.value('{}/Bitrate'.format(filemd5)))
-                lengthItem.setText(cfg.filecache.value('{}/Length'.format(filemd5)))
-                filesizeItem.setText(cfg.filecache.value('{}/Filesize'.format(filemd5)))
-                frame_hist = cfg.filecache.value('{}/FrameHist'.format(filemd5))
-                if frame_hist is not None:
-                    bitrateItem.setData(dataBitrate, frame_hist)
-                quality = cfg.filecache.value('{}/Quality'.format(filemd5))
-                if quality is not None:
-                    qualityItem.setText(quality)
-                frequency = cfg.filecache.value('{}/Frequency'.format(filemd5))
-                if frequency is not None:
-                    frequencyItem.setText(frequency)
-                mode = cfg.filecache.value('{}/Mode'.format(filemd5))
-                if mode is not None:
-                    modeItem.setText(mode)
-                quality_colour = cfg.filecache.value('{}/QualityColour'.format(filemd5))
-                if quality_colour is not None:
-                    qualityItem.setBackground(quality_colour)
-                error_colour = cfg.filecache.value('{}/ErrorColour'.format(filemd5))
-                if error_colour is not None:
-                    errorItem.setBackground(error_colour)
-
-                filenameItem.setData(dataScanned, True)  # previously scanned
-
-        self.ui.tableWidget.insertRow(row)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Filename"), filenameItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Artist"), artistItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Folder"), folderItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Encoder"), codecItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Bitrate"), bitrateItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Length"), lengthItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Filesize"), filesizeItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Quality"), qualityItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Errors"), errorItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Frequency"), frequencyItem)
-        self.ui.tableWidget.setItem(row, tableheaders.index("Mode"), modeItem)
-
-    def recursiveAdd(self, directory, filemask_regex, followsymlinks=False, recursedirectories=True, usecache=True,
-                     tableheaders=None):
-        ''' walk through directory and add filenames to treeview'''
-        i = 0
-        c = 0
-        scan_start = time()
-        for root, dirs, files in os.walk(directory, True, None, followsymlinks):
-            c += 1
-            if c % 2 == 0:
-                QApplication.processEvents()
-                if (i > 0) and (i % 10 == 0):  # update count every 10 files
-                    self.statusBar().showMessage(
-                        "Scanning for files: {} found ({} files/s)".format(i, round(i / (time() - scan_start))))
-            if not recursedirectories:
-                while len(dirs) > 0:
-                    dirs.pop()
-            for name in sorted(files):
-                if filemask_regex.search(name) is not None:
-                    self.addTableWidgetItem(i, name, root, usecache, tableheaders)
-                    i += 1
+            cached = getResultCache().lookupFile(filekey, filenameStr, st)
+            if cached is not None:
+                if cached["encoder"] is None or not getToolRegistry().isCurrent(cached["tools"]):
+                    cached = None  # not scanned, or scanned with a tool version that has since changed
+                else:
+                    cached["scanned"] = True  # previously scanned
+
+        return name, directory, filekey, cached
+
+    def addTableRows(self, files, usecache):
+        ''' append batch of (name, directory, stat_result) to table with a single row count change '''
+        entries = []
+        for name, directory, st in files:
+            entry = self.createFileEntry(name, directory, usecache, st)
+            if entry is not None:
+                entries.append(entry)
+        if entries:
+            self.model.appendFiles(entries)
 
     def select_folder_click(self, checked):
         clearfilelist = cfg.settings.value('Options/ClearFilelist', True, type=bool)
@@ -578,6 +507,10 @@ class Main(QMainWindow):
 
     def addFilesFolders(self, filedirlist=None, clearfilelist=True):
 
+        if self.discovery_thread is not None:
+            debug_log("addFilesFolders: file discovery already running", logging.WARNING)
+            return
+
         if filedirlist is None:
             filedirlist = []
 
@@ -588,13 +521,7 @@ class Main(QMainWindow):
             else:
                 return
 
-        filemask = cfg.settings.value('Options/FilemaskRegEx', defaultfilemask)
-
-        try:
-            filemask_regex = re.compile(filemask, re.IGNORECASE)
-        except re.error as e:
-            debug_log("Error in filemask regex: {}, using default".format(e), logging.WARNING)
-            filemask_regex = re.compile(defaultfilemask, re.IGNORECASE)
+        filemask_regex = getFilemaskRegex()
 
         followsymlinks = cfg.settings.value('Options/FollowSymlinks', False, type=bool)
         recursedirectories = cfg.settings.value('Options/RecurseDirectories', True, type=bool)
@@ -605,226 +532,257 @@ class Main(QMainWindow):
         if clearfilelist:
             self.clear_List()
 
-        self.ui.tableWidget.setSortingEnabled(False)
-        self.ui.tableWidget.setUpdatesEnabled(False)
-        self.ui.tableWidget.setContextMenuPolicy(Qt.NoContextMenu)
+        self.ui.tableView.setSortingEnabled(False)
+        self.ui.tableView.setContextMenuPolicy(Qt.NoContextMenu)
         self.ui.progressBar.setMinimum(0)
         self.ui.progressBar.setMaximum(0)
         self.disableScanning()
 
-        tableheaders = getTableHeaders(self.ui.tableWidget)
+        files = []
+        directories = []
 
         for filedir in filedirlist:
             if os.path.isdir(filedir):
-                self.recursiveAdd(directory=filedir, filemask_regex=filemask_regex, followsymlinks=followsymlinks,
-                                  recursedirectories=recursedirectories, usecache=usecache, tableheaders=tableheaders)
+                directories.append(filedir)
                 if filedir in self.recentFiles:
                     self.recentFiles.remove(filedir)
                 self.recentFiles.appendleft(filedir)
             else:
-                self.addTableWidgetItem(0, os.path.basename(filedir), os.path.dirname(filedir), usecache, tableheaders)
+                files.append((os.path.basename(filedir), os.path.dirname(filedir), None))
 
+        self.addTableRows(files, usecache)
         self.mruMenuUpdate()
-        self.doFilterTable()
-        self.ui.tableWidget.setUpdatesEnabled(True)
-        self.ui.tableWidget.setSortingEnabled(True)
-        self.ui.tableWidget.setContextMenuPolicy(Qt.CustomContextMenu)
+
+        if directories:
+            self.watched_folders.update(directories)
+            self.startWatching()
+
+        if not directories:
+            self.finishAddFiles()
+            return
+
+        # files are found by a worker thread and added to the table by updateDiscovery
+        self.discovery_usecache = usecache
+        if usecache and cfg.settings.value('Options/IncrementalRescan', True, type=bool):
+            dir_index = getResultCache()  # only re-read directories whose mtime has changed
+        else:
+            dir_index = None
+        self.discovery_thread = fileDiscovery_Thread(directories, filemask_regex, self.discovery_q, followsymlinks,
+                                                     recursedirectories,
+                                                     cfg.settings.value('Options/DiscoveryThreads', 8, type=int),
+                                                     dir_index=dir_index)
+        self.discovery_threadpool.start(self.discovery_thread)
+        self.statusBar().showMessage("Scanning for files...")
+
+    def updateDiscovery(self):
+        ''' called when fileDiscovery_Thread posts to discovery_q - adds found files to the table model '''
+        for q_info in self.discovery_q.getAll():
+            if q_info.result_type == discovery_info.FILES:
+                self.addTableRows(q_info.files, self.discovery_usecache)
+                try:
+                    rate = round(q_info.count / q_info.elapsed)
+                except ZeroDivisionError:
+                    rate = 0
+                self.statusBar().showMessage(
+                    "Scanning for files: {} found ({} files/s) - Cancel to stop".format(q_info.count, rate))
+            elif q_info.result_type == discovery_info.FINISHED:
+                self.discovery_thread = None
+                self.finishAddFiles()
+                return
+
+    def finishAddFiles(self):
+        self.ui.tableView.setSortingEnabled(True)
+        self.ui.tableView.setContextMenuPolicy(Qt.CustomContextMenu)
         self.ui.progressBar.setMinimum(0)
         self.ui.progressBar.setMaximum(100)
         self.ui.progressBar.setValue(0)
         self.statusBar().showMessage('Ready')
         self.enableScanning()
 
+    def watchFoldersToggled(self, checked):
+        cfg.settings.setValue('Options/WatchFolders', checked)
+        if checked:
+            self.startWatching()
+        else:
+            self.stopWatching()
+
+    def startWatching(self):
+        ''' (re)start folderWatch_Thread for watched_folders if watch mode is enabled '''
+        self.stopWatching()
+        if not self.watched_folders or not self.actionWatchFolders.isChecked():
+            return
+        self.watch_thread = folderWatch_Thread(self.watched_folders, getFilemaskRegex(), self.watch_q,
+                                               cfg.settings.value('Options/FollowSymlinks', False, type=bool),
+                                               cfg.settings.value('Options/RecurseDirectories', True, type=bool))
+        self.watch_threadpool.start(self.watch_thread)
+        self.updateWatchTimer.start()
+
+    def stopWatching(self):
+        if self.watch_thread is not None:
+            self.watch_thread.cancel()
+            self.watch_thread = None
+        self.updateWatchTimer.stop()
+        self.watch_pending.clear()
+
+    def updateWatch(self):
+        ''' runs from timer while watching - adds new files to table and queues new or changed files for scanning '''
+        while not self.watch_q.empty():
+            try:
+                self.watch_pending.update(self.watch_q.get(False))
+            except queue.Empty:
+                break
+
+        if not self.watch_pending or self.task_count > 0 or self.discovery_thread is not None:
+            return  # wait until scanner is idle
+
+        new_files = []
+        for filenameStr in self.watch_pending:
+            try:
+                st = os.stat(filenameStr)
+            except OSError:
+                continue  # deleted or renamed again since the event
+            file_id = self.model.idForPath(filenameStr)
+            if file_id is None:
+                new_files.append((os.path.basename(filenameStr), os.path.dirname(filenameStr), st))
+            elif self.updateFileKey(file_id, st):  # file modified
+                self.model.updateFile(file_id, {"scanned": False})
+
+        debug_log("updateWatch: {} changed files, {} new".format(len(self.watch_pending), len(new_files)))
+        file_list = set(self.watch_pending)
+        self.watch_pending.clear()
+        self.addTableRows(new_files, cfg.settings.value('Options/UseCache', True, type=bool))
+        self.scan_Files(True, file_list)
+
+    def updateFileKey(self, file_id, st):
+        ''' set file's cache key from st - returns True if it changed '''
+        filekey = fileKey(st)
+        if self.model.key(file_id) == filekey:
+            return False
+        self.file_hashlist.discard(self.model.key(file_id))
+        self.file_hashlist.add(filekey)
+        self.model.setKey(file_id, filekey)
+        return True
+
     def cancel_Tasks(self):
+        if self.discovery_thread is not None:
+            self.discovery_thread.cancel()
         with QWriteLocker(self.ql):
             if self.task_count > 0:  # tasks are running
-                self.scanner_threadpool.clear()
-                self.task_count = self.scanner_threadpool.activeThreadCount()
+                # results of running tasks and those waiting in main_q still arrive, only dropped tasks are removed
+                self.task_count -= self.scanner_threadpool.clear()
+                if self.scan_process_pool is not None:
+                    self.task_count -= self.scan_process_pool.cancel()
 
-    def update_Table(self, row, song_info):
-        ''' update table with info from scanner '''
+    def update_Table(self, file_id, song_info, usecache):
+        ''' apply info from scanner to table model without notifying views - returns True if file was changed '''
         if not isinstance(song_info, song_info_obj):
             debug_log("update_Table received wrong data: {}".format(song_info), logging.WARNING)
-            return
+            return False
 
         if song_info.cmd_error:
-            debug_log("update_Table received cmd_error update for row {}: {}".format(row, vars(song_info)),
+            debug_log("update_Table received cmd_error update for file {}: {}".format(file_id, vars(song_info)),
                       logging.WARNING)  # todo: notify user of this
-            return
-
-        usecache = cfg.settings.value('Options/UseCache', True, type=bool)
-        table_headers = getTableHeaders(self.ui.tableWidget)
+            return False
 
         if song_info.file_error:
-            debug_log("Setting error status for row {}".format(row))
-            errorItem = self.ui.tableWidget.item(row, table_headers.index("Errors"))
-            errorItem.setBackground(colourQualityBad)
-            return
+            debug_log("Setting error status for file {}".format(self.model.path(file_id)))
+        elif song_info.result_type == song_info_obj.ERROR_CHECK:
+            debug_log(vars(song_info))  # todo something here
+            return False
+        elif song_info.result_type not in (song_info_obj.MEDIAINFO, song_info_obj.MP3GUESSENC, song_info_obj.AUCDTECT,
+                                          song_info_obj.CUTOFF):
+            debug_log("Update_Table: Result type {} unknown".format(song_info.result_type), logging.WARNING)
+            return False
+        elif song_info.decode_errors > 0:
+            debug_log("{} decode errors detected for file {}".format(song_info.decode_errors,
+                                                                     self.model.path(file_id)))
 
-        filenameItem = self.ui.tableWidget.item(row, table_headers.index("Filename"))
-        filenameStr = filenameItem.data(dataFilenameStr)
-        if usecache:
-            hashStr = filenameStr.replace("/", "\\") + str(os.path.getmtime(filenameStr))
-            filemd5 = md5Str(hashStr)
+        record = self.model.record(file_id)
+        cache_fields = mergeSongInfo(record, song_info)
+        self.model.setFields(file_id, record)
 
-        if song_info.result_type in (song_info_obj.MEDIAINFO, song_info_obj.MP3GUESSENC, song_info_obj.AUCDTECT):
+        if cache_fields and usecache:
+            getResultCache().store(self.model.key(file_id), self.model.path(file_id), **cache_fields)
+        return True
 
-            if song_info.quality is not None:
-                qualityItem = self.ui.tableWidget.item(row, table_headers.index("Quality"))
-                qualityItem.setText(song_info.quality)
-                if usecache:
-                    cfg.filecache.setValue('{}/Quality'.format(filemd5), song_info.quality)
+    def updateMainGui(self):
+        ''' called when scanner threads post to main_q - applies all waiting results to table model as one batch '''
+        results = self.main_q.getAll()
 
-            if song_info.quality_colour is not None:
-                qualityItem = self.ui.tableWidget.item(row, table_headers.index("Quality"))
-                qualityItem.setBackground(song_info.quality_colour)
-                if usecache:
-                    cfg.filecache.setValue('{}/QualityColour'.format(filemd5), qualityItem.background())
+        if not results:
+            return
 
-            if song_info.result_type in (song_info_obj.MEDIAINFO, song_info_obj.MP3GUESSENC):
+        usecache = cfg.settings.value('Options/UseCache', True, type=bool)
+        changed_ids = []
+        tasks_finished = 0
+        for q_info in results:
+            if not isinstance(q_info, main_info):
+                debug_log("updateMainGui received wrong data: {}".format(q_info), logging.WARNING)
+                continue
+            tasks_finished += 1
+            if self.update_Table(q_info.row, q_info.song_info, usecache):
+                changed_ids.append(q_info.row)
 
-                if song_info.decode_errors > 0:
-                    debug_log("{} decode errors detected for file {}".format(song_info.decode_errors, filenameStr))
-                    errorColour = colourQualityBad
-                else:
-                    errorColour = colourQualityGood
-
-                errorsItem = self.ui.tableWidget.item(row, table_headers.index("Errors"))
-                if not errorsItem.background() == colourQualityBad:
-                    errorsItem.setBackground(errorColour)
-                if usecache:
-                    cfg.filecache.setValue('{}/ErrorColour'.format(filemd5), errorsItem.background())
-
-                filenameItem.setData(dataScanned, True)  # boolean, true if file already scanned
-                codecItem = self.ui.tableWidget.item(row, table_headers.index("Encoder"))
-
-                # prefer mp3guessenc encoder info over mediainfo
-
-                if song_info.result_type == song_info_obj.MP3GUESSENC:
-                    if not song_info.encoderstring == "":
-                        codecText = "{} ({})".format(song_info.audio_format, song_info.encoderstring)
-                    elif not song_info.encoder == "":
-                        codecText = "{} ({})".format(song_info.audio_format, song_info.encoder)
-                    else:
-                        codecText = "{}".format(song_info.audio_format)
-                    codecItem.setText(codecText)
-                elif not codecItem.text():  # mediainfo
-                    if not song_info.encoder == "":
-                        codecText = "{} ({})".format(song_info.audio_format, song_info.encoder)
-                    else:
-                        codecText = "{}".format(song_info.audio_format)
-                    codecItem.setText(codecText)
-
-                bitrateItem = self.ui.tableWidget.item(row, table_headers.index("Bitrate"))
-                if song_info.bitrate is not None:
-                    bitrateItem.setText(song_info.bitrate)
-
-                artistItem = self.ui.tableWidget.item(row, table_headers.index("Artist"))
-                if not song_info.artist == "":
-                    artistItem.setText(song_info.artist)
-
-                if song_info.frame_hist is not None:
-                    bitrateItem.setData(dataBitrate, song_info.frame_hist)
-
-                frequencyItem = self.ui.tableWidget.item(row, table_headers.index("Frequency"))
-                if song_info.frequency is not None:
-                    frequencyItem.setText(song_info.frequency)
-
-                modeItem = self.ui.tableWidget.item(row, table_headers.index("Mode"))
-                if song_info.mode is not None:
-                    modeItem.setText(song_info.mode)
-
-                lengthItem = self.ui.tableWidget.item(row, table_headers.index("Length"))
-                if song_info.length is not None:
-                    lengthItem.setText(song_info.length)
-
-                filesizeItem = self.ui.tableWidget.item(row, table_headers.index("Filesize"))
-                if song_info.filesize is not None:
-                    filesizeItem.setText(song_info.filesize)
-
-                if usecache:
-                    cfg.filecache.setValue('{}/Artist'.format(filemd5), artistItem.text())
-                    cfg.filecache.setValue('{}/Encoder'.format(filemd5), codecItem.text())
-                    cfg.filecache.setValue('{}/Bitrate'.format(filemd5), bitrateItem.text())
-                    cfg.filecache.setValue('{}/Length'.format(filemd5), lengthItem.text())
-                    cfg.filecache.setValue('{}/Filesize'.format(filemd5), filesizeItem.text())
-                    cfg.filecache.setValue('{}/Mode'.format(filemd5), modeItem.text())
-                    cfg.filecache.setValue('{}/Frequency'.format(filemd5), frequencyItem.text())
-                    try:
-                        cfg.filecache.setValue('{}/FrameHist'.format(filemd5), bitrateItem.data(dataBitrate))
-                    except KeyError:
-                        cfg.filecache.remove('{}/FrameHist'.format(filemd5))
+        self.model.filesChanged(changed_ids)  # one repaint for the whole batch
+        if usecache:
+            getResultCache().commit()  # one transaction per batch
 
-        elif song_info.result_type == song_info_obj.ERROR_CHECK:
-            debug_log(vars(song_info))  # todo something here
-        else:
-            debug_log("Update_Table: Result type {} unknown".format(song_info.result_type), logging.WARNING)
+        with QWriteLocker(self.ql):
+            self.task_count -= tasks_finished
+            task_count = self.task_count
+        debug_log("updateMainGui: applied {} results, task_total {} task_count {}".format(len(results),
+                                                                                          self.task_total,
+                                                                                          task_count))
+        files_scanned = self.task_total - task_count
+        try:
+            self.ui.progressBar.setValue(round((files_scanned / self.task_total) * 100))
+        except ZeroDivisionError:
+            self.ui.progressBar.setValue(0)
+
+        try:
+            scan_rate = files_scanned / (time() - self.scan_start_time)
+            eta_min = (task_count / scan_rate) / 60  # estimated finish time in mins
+        except ZeroDivisionError:
+            scan_rate = 0
+            eta_min = 0
+        if eta_min < 0:
+            eta_min = 0
+        self.statusBar().showMessage(
+            'Scanning... {}/{} tasks completed ({}/min, {}m {}s estimated)'.format(files_scanned, self.task_total,
+                                                                                   round(scan_rate * 60),
+                                                                                   int(eta_min),
+                                                                                   round((eta_min - int(eta_min)) * 60)))
+
+        if task_count < 1:
+            debug_log("updateMainGui: all threads finished, task count={}".format(task_count))
+            self.enableScanning()
+            if self.main_q.empty():
+                debug_log("updateMainGui: task queue empty, task count={}".format(task_count))
+                self.ui.progressBar.setValue(100)
+                self.statusBar().showMessage('Done')
 
-    def updateMainGui(self):
-        ''' runs from timer - takes results from main_q and adds to tablewidget '''
-
-        while not self.main_q.empty():
-            debug_log("updateMainGui: main_q not empty")
-            with QReadLocker(self.ql):
-                tasks_done = self.task_total - self.task_count
-                debug_log("updateMainGui: tasks_done {} self.task_total {} self.task_count {}".format(tasks_done,
-                                                                                                      self.task_total,
-                                                                                                      self.task_count))
-            try:
-                self.ui.progressBar.setValue(round((tasks_done / self.task_total) * 100))
-            except ZeroDivisionError:
-                self.ui.progressBar.setValue(0)
-                # scanner processes add results to main_q when finished
-            try:
-                q_info = self.main_q.get(False)
-            except queue.Empty as e:
-                debug_log("updateMainGui: main_q.get exception {}".format(e), logging.WARNING)
-                q_info = None
-
-            if q_info is not None:
-                if not isinstance(q_info, main_info):
-                    debug_log("updateMainGui received wrong data: {}".format(q_info), logging.WARNING)
-                    return
-
-                debug_log(
-                    "updateMainGui: calling update_Table for row {}".format(q_info.row))
-                self.ui.tableWidget.setUpdatesEnabled(False)
-                self.update_Table(q_info.row, q_info.song_info)
-                self.ui.tableWidget.setUpdatesEnabled(True)
-
-                with QWriteLocker(self.ql):
-                    self.task_count -= 1
-
-                scan_rate = tasks_done / (time() - self.scan_start_time)
-                files_scanned = self.task_total - self.task_count
-                try:
-                    eta_min = (self.task_count / scan_rate) / 60  # estimated finish time in mins
-                except ZeroDivisionError as e:
-                    eta_min = 0
-                if eta_min < 0:
-                    eta_min = 0
-                self.statusBar().showMessage(
-                    'Scanning... {}/{} tasks completed ({}/min, {}m {}s estimated)'.format(files_scanned,
-                                                                                           self.task_total,
-                                                                                           round(scan_rate * 60),
-                                                                                           int(eta_min), round(
-                            (eta_min - int(eta_min)) * 60)))
-
-                if self.task_count < 1:
-                    debug_log("updateMainGui: all threads finished, task count={}".format(self.task_count))
-
-                    self.enableScanning()
-                    self.ui.tableWidget.setSortingEnabled(True)
-                    if self.main_q.empty():
-                        debug_log("updateMainGui: task queue empty, task count={}".format(self.task_count))
-                        self.ui.progressBar.setValue(100)
-                        self.statusBar().showMessage('Done')
-        
     def doScanFile(self, thread):
+        task_count = getattr(thread, "task_count", 1)  # batch threads post a result for each file
+        with QWriteLocker(self.ql):
+            self.task_count += task_count
+            self.task_total += task_count
         self.scanner_threadpool.start(thread)
+
+    def doScanFileProcess(self, file_id, filenameStr, scan_options, task_count):
         with QWriteLocker(self.ql):
-            self.task_count += 1
-            self.task_total += 1
+            self.task_count += task_count
+            self.task_total += task_count
+        self.scan_process_pool.submit(file_id, filenameStr, scan_options, task_count)
+
+    def startProcessPool(self, numproc):
+        ''' start scanner worker processes, or restart them if the number of processes has changed '''
+        processes = numproc if numproc > 0 else os.cpu_count() or 1
+        if self.scan_process_pool is not None:
+            if len(self.scan_process_pool.workers) == processes and self.scan_process_pool.isAlive():
+                return
+            self.scan_process_pool.close()
+        debug_log("Starting {} scanner worker processes".format(processes))
+        self.scan_process_pool = scanProcessPool(processes, self.main_q)
 
     def disableScanning(self):
         self.ui.actionScan_Files.setEnabled(False)
@@ -849,103 +807,83 @@ class Main(QMainWindow):
         filelist - optional set of files to scan, all others will be skipped '''
         self.disableScanning()
         thread_list = deque()
+        file_tasks = deque()  # (file id, filename, number of tasks) for the process engine
+        use_processes = cfg.settings.value('Options/ProcessEngine', False, type=bool)
 
         numproc = cfg.settings.value('Options/Processes', 0,
                                      type=int)  # number of scanner processes to run, default = # of cpus
-        if numproc > 0:
-            self.scanner_threadpool.setMaxThreadCount(numproc)
-
-        self.ui.tableWidget.setSortingEnabled(False)  # prevent row numbers changing
-        self.ui.tableWidget.setUpdatesEnabled(True)
-
-        mp3guessenc_bin = findGuessEncBin()
-        if (mp3guessenc_bin == "") or (not os.path.exists(mp3guessenc_bin)):
-            mp3guessenc_bin = ""
+        scan_path = None  # first file to scan, its disk type sets the default limits
 
-        mediainfo_bin = findMediaInfoBin()
-        if (mediainfo_bin == "") or (not os.path.exists(mediainfo_bin)):
-            mediainfo_bin = ""
-
-        aucdtect_bin = findauCDtectBin()
-        if (aucdtect_bin == "") or (not os.path.exists(aucdtect_bin)):
-            aucdtect_bin = ""
-
-        flac_bin = findFlacBin()
-        if (flac_bin == "") or (not os.path.exists(flac_bin)):
-            flac_bin = ""
+        scanner_bins = getToolRegistry().scannerBins()
+        if cfg.settings.value('Options/auCDtect_scan', False, type=bool):
+            aucdtect_mode = cfg.settings.value('Options/auCDtect_mode', 10, type=int)
+        else:
+            aucdtect_mode = None
+        scan_for_errors = cfg.settings.value('Options/ScanForErrors', True, type=bool)
+        cutoff_scan = cfg.settings.value('Options/CutoffScan', False, type=bool)
 
         with QWriteLocker(self.ql):
             self.task_count = 0  # tasks remaining
         self.task_total = 0  # total tasks - used to calculate percentage remaining
 
         cmd_timeout = cfg.settings.value("Options/Proc_Timeout", 300, type=int)
+        scan_options = (scanner_bins, cmd_timeout, cfg.debug_enabled, aucdtect_mode, scan_for_errors, cutoff_scan)
 
-        for i in range(0, self.ui.tableWidget.rowCount()):
-            if self.ui.tableWidget.isRowHidden(i):
-                continue
-        
-            filenameItem = self.ui.tableWidget.item(i, headerIndexByName(self.ui.tableWidget, "Filename"))
-            filenameStr = filenameItem.data(dataFilenameStr)  # filename
+        # threads report results by file id, which stays valid when the table is sorted or filtered
+        for i in self.model.visibleIds():
+            filenameStr = self.model.path(i)
 
             if filelist is not None:
                 if not filenameStr in filelist:
                     continue
 
-            fileScanned = filenameItem.data(dataScanned)  # boolean, true if file already scanned
-
-            if not fileScanned:
+            if not self.model.isScanned(i):
 
                 debug_log("Queuing process for file {}".format(filenameStr))
-
-                threads = getScannerThread(i, filenameStr, mp3guessenc_bin, mediainfo_bin, None, cmd_timeout,
-                                           cfg.debug_enabled, self.main_q, None)
-                if threads:
-                    for thread in threads:
-                        if isinstance(thread, QRunnable):
-                            thread_list.append(thread)
-                        else:
-                            debug_log("getScannerThread not QRunnable: {}".format(thread), logging.WARNING)
-
-                # if lossless audio also run aucdtect if enabled and available
-
-                if fnmatch.fnmatch(filenameStr, "*.flac"):
-                    if cfg.settings.value('Options/auCDtect_scan', False, type=bool):
-                        if not aucdtect_bin == "":
-                            aucdtect_mode = cfg.settings.value('Options/auCDtect_mode', 10, type=int)
-                            thread = aucdtect_Thread(i, filenameStr, flac_bin, "-df", aucdtect_bin,
-                                                     "-m{}".format(aucdtect_mode), cfg.debug_enabled, cmd_timeout,
-                                                     self.main_q)
-                            thread_list.append(thread)
-                    if cfg.settings.value('Options/ScanForErrors', True, type=bool):
-                        if not flac_bin == "":
-                            thread = errorCheck_Thread(i, filenameStr, flac_bin, "-t", cfg.debug_enabled, cmd_timeout,
-                                                       self.main_q, True)
-                            thread_list.append(thread)
-                elif fnmatch.fnmatch(filenameStr, "*.wav"):
-                    if cfg.settings.value('Options/auCDtect_scan', False, type=bool):
-                        if not aucdtect_bin == "":
-                            aucdtect_mode = cfg.settings.value('Options/auCDtect_mode', 10, type=int)
-                            thread = aucdtect_Thread(i, filenameStr, "", "", aucdtect_bin, "-m{}".format(aucdtect_mode),
-                                                     cfg.debug_enabled, cmd_timeout, self.main_q)
-                            thread_list.append(thread)
+                try:  # results are stored under the key of the file as it is now
+                    self.updateFileKey(i, os.stat(filenameStr))
+                except OSError:
+                    pass
+                # the worst quality result is kept, so one from before the file changed mustn't be
+                self.model.setFields(i, {"quality": "", "quality_colour": None, "cutoff": ""})
+                if scan_path is None:
+                    scan_path = filenameStr
+
+                threads = getFileScanThreads(i, filenameStr, scanner_bins, cmd_timeout, cfg.debug_enabled,
+                                             self.main_q, aucdtect_mode, scan_for_errors, cutoff_scan)
+                if use_processes:  # worker process runs the same threads, one result each
+                    if threads:
+                        file_tasks.append((i, filenameStr, threadTaskCount(threads)))
+                else:
+                    thread_list.extend(threads)
 
             QApplication.processEvents()
 
         self.scan_start_time = time()  # used to calculate scanning rate
         #        self.statusBar().showMessage('Scanning files...')
 
-        if len(thread_list) == 0:  # nothing to do
+        if len(thread_list) == 0 and len(file_tasks) == 0:  # nothing to do
             self.enableScanning()
+        elif file_tasks:
+            debug_log("Starting worker processes... {} files".format(len(file_tasks)))
+            self.startProcessPool(numproc)
+            for file_id, filenameStr, task_count in file_tasks:
+                self.doScanFileProcess(file_id, filenameStr, scan_options, task_count)
         else:
             debug_log("Starting threads... {} tasks".format(len(thread_list)))
-            for thread in thread_list:
+            self.scanner_threadpool.setLimits(schedulerLimits(scan_path, numproc))
+            self.updatePriorities()
+            for thread in batchMediaInfoThreads(thread_list, cfg.settings.value('Options/MediaInfoBatch', 16, type=int)):
                 self.doScanFile(thread)
 
     def clear_List(self):
         self.ui.progressBar.setValue(0)
-        self.ui.tableWidget.clearContents()
-        self.ui.tableWidget.setRowCount(0)
+        self.model.clear()
+        self.info_file_id = None
         self.file_hashlist.clear()
+        if self.watched_folders:
+            self.watched_folders.clear()
+            self.stopWatching()
 
     def about_Dlg(self):
         QMessageBox.about(self, "About",
@@ -974,6 +912,11 @@ Python version: {}
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # scanner worker processes in frozen builds
+    if len(sys.argv) > 1 and sys.argv[1] == "scan":  # headless scanner, no QApplication or widgets
+        from spct_cli import scanMain
+        sys.exit(scanMain(sys.argv[2:]))
+
     app = QApplication(sys.argv)
     translator = QTranslator()
     if translator.load(QLocale(), "specton", "_", "./i18n"):
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import struct
+
+from spct_native import decodeMP3Header, mp3FrameScan, scan_mp3
+
+# MPEG1 layer III, no crc, 44.1 kHz, joint stereo
+bitrate_indexes = {128: 9, 192: 11, 320: 14}
+JOINT_STEREO = 1
+
+
+def mp3Header(bitrate, padding=0, channel_mode=JOINT_STEREO, mode_extension=2):
+    return (0xffe00000 | 3 << 19 | 1 << 17 | 1 << 16 | bitrate_indexes[bitrate] << 12 | padding << 9 |
+            channel_mode << 6 | mode_extension << 4)
+
+
+def mp3Frame(bitrate, body=b""):
+    header = mp3Header(bitrate)
+    frame_length = decodeMP3Header(header)[0]
+    return (struct.pack(">I", header) + body).ljust(frame_length, b"\x00")
+
+
+def xingFrame(frames, quality, encoder=b"LAME3.100", preset=480):
+    ''' Info tag with frame count, byte count, seek table and quality, then a lame tag '''
+    lame_tag = encoder.ljust(9, b"\x00") + bytes(17) + struct.pack(">H", preset)
+    body = bytes(32) + b"Xing" + struct.pack(">III", 15, frames, 0) + bytes(100) + struct.pack(">I", quality)
+    return mp3Frame(128, body + lame_tag)
+
+
+def test_decode_header():
+    assert decodeMP3Header(mp3Header(128)) == (417, 128, 44100, 3, JOINT_STEREO, 2)
+    assert decodeMP3Header(mp3Header(128, padding=1))[0] == 418
+    assert decodeMP3Header(mp3Header(320))[0] == 1044
+    assert decodeMP3Header(0x12345678) is None
+    assert decodeMP3Header(mp3Header(128) | 15 << 12) is None  # bad bitrate index
+
+
+def test_scan_mixed_bitrates_with_lame_tag(tmp_path):
+    audio = [128] * 3 + [320] * 5 + [192] * 2
+    data = xingFrame(len(audio), quality=78)  # V2 q2
+    data += b"".join(mp3Frame(bitrate) for bitrate in audio[:5])
+    data += b"junk"
+    data += b"".join(mp3Frame(bitrate) for bitrate in audio[5:])
+    path = tmp_path / "test.mp3"
+    path.write_bytes(data)
+
+    frames = mp3FrameScan(data, 0, len(data))
+    assert frames.frameCount() == len(audio)  # the Xing frame isn't audio
+    assert list(frames.bitrates) == audio
+    assert frames.header_errors == 1
+    assert frames.encoder_string == "LAME3.100"
+    assert frames.lame_preset == "V2"
+    assert frames.xing_quality == 78
+
+    si = scan_mp3(str(path))
+    assert not si.file_error
+    assert si.encoder == "Lame"
+    assert si.encoderstring == "LAME3.100"
+    assert si.frame_hist == ([128, 192, 320], [3, 2, 5])
+    assert si.bitrate == "{} kbps".format(round(sum(audio) / len(audio)))
+    assert si.mode == "JS/VBR"
+    assert si.frequency == "44.1 KHz"
+    assert si.decode_errors == 1
+
+
+def test_scan_without_encoder_tag(tmp_path):
+    path = tmp_path / "cbr.mp3"
+    path.write_bytes(b"".join(mp3Frame(128) for _ in range(4)))
+    assert scan_mp3(str(path), require_encoder=True) is None
+    si = scan_mp3(str(path))
+    assert si.frame_hist == ([128], [4])
+    assert si.mode == "JS/CBR"
+
+
+def test_scan_no_frames(tmp_path):
+    path = tmp_path / "empty.mp3"
+    path.write_bytes(b"not an mp3 file")
+    si = scan_mp3(str(path))
+    assert si.file_error
+    assert si.audio_format == "MP3?"
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from spct_parsers import ffprobePacketParser, parse_mediainfo_output, split_mediainfo_output
+
+
+def test_ffprobe_packets_split_across_chunks():
+    parser = ffprobePacketParser()
+    parser.feed(b"0.000000,0.026122,418\n0.026122,0.02")
+    parser.feed(b"6122,1045\n0.052245,N/A,418\n")
+    parser.feed(b"0.078367,0.026122,627")
+    parser.finish()
+    assert list(parser.times) == [0.0, 0.026122, 0.078367]  # packet without a duration is left out
+    assert list(parser.bitrates) == [128, 320, 192]
+    assert parser.duration == pytest.approx(0.078367 + 0.026122)
+    assert parser.bad_lines == 0
+
+
+def test_ffprobe_malformed_line():
+    parser = ffprobePacketParser()
+    parser.feed(b"0.000000,0.026122,418\n0.026122,0.026122\nside_data,,\n0.052245,0.026122,1045\n")
+    parser.finish()
+    assert list(parser.times) == [0.0, 0.052245]
+    assert list(parser.bitrates) == [128, 320]
+    assert parser.bad_lines == 2
+
+
+mediainfo_text = """General
+Complete name                            : /music/a.mp3
+Format                                   : MPEG Audio
+File size                                : 4.00 MiB
+Performer                                : Artist A
+
+Audio
+Format                                   : MPEG Audio
+Duration                                 : 3 min 30 s
+Bit rate mode                            : Constant
+Bit rate                                 : 160 kb/s
+Sampling rate                            : 44.1 kHz
+Writing library                          : LAME3.99r
+
+General
+Complete name                            : /music/b.flac
+Format                                   : FLAC
+File size                                : 20.0 MiB
+Performer                                : Artist B
+
+Audio
+Format                                   : FLAC
+Duration                                 : 2 min 5 s
+Bit rate mode                            : Variable
+Bit rate                                 : 900 kb/s
+Sampling rate                            : 44.1 kHz
+Bit depth                                : 16 bits
+"""
+
+
+def test_split_mediainfo_text():
+    reports = split_mediainfo_output(mediainfo_text)
+    assert [name for name, report in reports] == ["/music/a.mp3", "/music/b.flac"]
+    assert reports[0][1].startswith("General\n")
+    assert reports[1][1].startswith("General\n")
+    assert "Artist B" not in reports[0][1]
+    assert "Artist A" not in reports[1][1]
+    assert "".join(report for name, report in reports) == mediainfo_text
+    assert parse_mediainfo_output(reports[0][1]).artist == "Artist A"
+    assert parse_mediainfo_output(reports[1][1]).artist == "Artist B"
+
+
+def mediainfoMedia(name, artist, audio_format):
+    return {"@ref": name, "track": [{"@type": "General", "Format": audio_format, "Performer": artist},
+                                     {"@type": "Audio", "Format": audio_format, "SamplingRate": "44100"}]}
+
+
+@pytest.mark.parametrize("layout", ["list", "media list"])
+def test_split_mediainfo_json(layout):
+    media = [mediainfoMedia("/music/a.mp3", "Artist A", "MPEG Audio"),
+             mediainfoMedia("/music/b.flac", "Artist B", "FLAC")]
+    if layout == "list":
+        output = json.dumps([{"media": m} for m in media])
+    else:
+        output = json.dumps({"media": media})
+    reports = split_mediainfo_output(output)
+    assert [name for name, report in reports] == ["/music/a.mp3", "/music/b.flac"]
+    assert reports[0][1] == media[0]
+    assert parse_mediainfo_output(reports[0][1]).artist == "Artist A"
+    assert parse_mediainfo_output(reports[1][1]).artist == "Artist B"
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from spct_scheduler import METADATA, PRIORITY_SELECTED, PRIORITY_VISIBLE, TaskClasses, taskScheduler
+
+
+class fakeThread(object):
+    ''' scanner thread stand-in - records the order threads run in '''
+    task_class = METADATA
+
+    def __init__(self, row, run_order, release=None):
+        self.row = row
+        self.run_order = run_order
+        self.release = release
+
+    def run(self):
+        if self.release is not None:
+            self.release.wait(5)
+        self.run_order.append(self.row)
+
+
+def queueThreads(rows):
+    ''' scheduler running one metadata thread at a time, blocked until release is set, with threads for rows waiting '''
+    scheduler = taskScheduler(dict.fromkeys(TaskClasses, 1))
+    run_order = []
+    release = threading.Event()
+    scheduler.start(fakeThread(-1, run_order, release))
+    for row in rows:
+        scheduler.start(fakeThread(row, run_order))
+    return scheduler, run_order, release
+
+
+def test_queued_order():
+    scheduler, run_order, release = queueThreads(range(4))
+    assert scheduler.pendingCount() == 4
+    release.set()
+    assert scheduler.waitForDone(5000)
+    assert run_order == [-1, 0, 1, 2, 3]
+
+
+def test_priority_change_on_queued_task():
+    scheduler, run_order, release = queueThreads(range(5))
+    scheduler.setPriorities({3: PRIORITY_VISIBLE, 4: PRIORITY_SELECTED})
+    scheduler.setPriorities({1: PRIORITY_VISIBLE, 3: PRIORITY_SELECTED})  # 4 goes back to normal
+    assert scheduler.pendingCount() == 5
+    release.set()
+    assert scheduler.waitForDone(5000)
+    assert run_order == [-1, 3, 1, 0, 2, 4]
+
+
+def test_clear_removes_waiting_threads():
+    scheduler, run_order, release = queueThreads(range(3))
+    scheduler.setPriorities({2: PRIORITY_SELECTED})
+    assert scheduler.clear() == 3
+    assert scheduler.pendingCount() == 0
+    release.set()
+    assert scheduler.waitForDone(5000)
+    assert run_order == [-1]